@@ -0,0 +1,297 @@
+"""
+Fake GitHub REST and GraphQL APIs serving a synthetic account, for the
+benchmarks.
+
+Items are generated from their index, so accounts of any size are served
+without being built in memory. Responses carry the pagination, ETag and rate
+limit headers of the real API, and answer 304 to a matching If-None-Match.
+The GraphQL endpoint serves the same items as the viewer connections queried
+by GraphQLDataSync, so both syncs can be compared.
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WORDS = ('api', 'app', 'bot', 'cache', 'cli', 'client', 'config', 'core',
+         'data', 'deploy', 'docs', 'engine', 'extension', 'github', 'go',
+         'infra', 'kit', 'lib', 'linux', 'monitor', 'node', 'parser', 'plugin',
+         'python', 'react', 'rust', 'sdk', 'server', 'service', 'site',
+         'terraform', 'tools', 'ui', 'ulauncher', 'web', 'worker')
+
+
+class SyntheticAccount(object):
+    """ Deterministic repos, stars, gists and issues of an account """
+
+    def __init__(self, repos, stars=None, gists=None, issues=20, seed=0):
+        self.sizes = {
+            'repos': repos,
+            'starred': repos if stars is None else stars,
+            'gists': repos if gists is None else gists,
+            'issues': issues
+        }
+        self.seed = seed
+
+    def _name(self, kind, i):
+        rng = random.Random("{}-{}-{}".format(self.seed, kind, i))
+        words = rng.sample(WORDS, rng.randint(1, 3))
+        return "{}-{}".format("-".join(words), i)
+
+    def _date(self, i):
+        """ Dates go back in time with the index, so item 0 is the newest """
+        return time.strftime("%Y-%m-%dT%H:%M:%SZ",
+                             time.gmtime(1640995200 - i * 3600))
+
+    def repo(self, kind, i):
+        name = self._name(kind, i)
+        owner = 'owner-{}'.format(i % 97)
+        return {
+            'name': name,
+            'full_name': '{}/{}'.format(owner, name),
+            'description': 'Synthetic {} repository number {}'.format(
+                name.split('-')[0], i),
+            'html_url': 'https://github.com/{}/{}'.format(owner, name),
+            'stargazers_count': (i * 7919) % 5000,
+            'updated_at': self._date(i)
+        }
+
+    def item(self, kind, i):
+        if kind == 'starred':
+            return {
+                'starred_at': self._date(i),
+                'repo': self.repo(kind, i)
+            }
+        if kind == 'issues':
+            repo = self.repo('repos', i)
+            return {
+                'title': 'Fix the {} of {}'.format(
+                    self._name(kind, i).split('-')[0], repo['name']),
+                'number': i + 1,
+                'state': 'open',
+                'labels': [{
+                    'name': 'bug'
+                }],
+                'html_url': '{}/issues/{}'.format(repo['html_url'], i + 1),
+                'repository_url': 'https://api.github.com/repos/{}'.format(
+                    repo['full_name']),
+                'updated_at': self._date(i)
+            }
+        if kind == 'gists':
+            name = self._name(kind, i)
+            return {
+                'description': 'Snippet about {}'.format(name.replace('-', ' ')),
+                'html_url': 'https://gist.github.com/{}'.format(
+                    hashlib.md5(name.encode()).hexdigest()),
+                'files': {
+                    name + '.py': {
+                        'filename': name + '.py'
+                    }
+                },
+                'updated_at': self._date(i)
+            }
+        return self.repo(kind, i)
+
+    def node(self, kind, i):
+        """ The item as a node (or edge) of the matching GraphQL connection """
+        item = self.item(kind, i)
+        if kind == 'starred':
+            return {
+                'starredAt': item['starred_at'],
+                'node': self._repo_node(item['repo'])
+            }
+        if kind == 'gists':
+            return {
+                'description': item['description'],
+                'url': item['html_url'],
+                'updatedAt': item['updated_at'],
+                'files': [{
+                    'name': f['filename']
+                } for f in item['files'].values()]
+            }
+        return self._repo_node(item)
+
+    def _repo_node(self, repo):
+        return {
+            'name': repo['name'],
+            'nameWithOwner': repo['full_name'],
+            'description': repo['description'],
+            'url': repo['html_url'],
+            'stargazerCount': repo['stargazers_count'],
+            'updatedAt': repo['updated_at']
+        }
+
+    def page(self, kind, page, per_page):
+        total = self.sizes.get(kind, 0)
+        start = (page - 1) * per_page
+        return [
+            self.item(kind, i)
+            for i in range(start, min(total, start + per_page))
+        ], max(1, -(-total // per_page))
+
+    def connection(self, kind, first, after=None):
+        """ A page of a GraphQL connection, the cursor being the next index """
+        total = self.sizes.get(kind, 0)
+        start = int(after) if after else 0
+        end = min(total, start + first)
+        entries = [self.node(kind, i) for i in range(start, end)]
+        return {
+            'totalCount': total,
+            'pageInfo': {
+                'hasNextPage': end < total,
+                'endCursor': str(end)
+            },
+            'edges' if kind == 'starred' else 'nodes': entries
+        }
+
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    """ Serves the REST and GraphQL endpoints used by the syncs and the keywords """
+
+    COLLECTIONS = {
+        '/user/repos': 'repos',
+        '/user/starred': 'starred',
+        '/gists': 'gists'
+    }
+
+    # The searches ignore the query and page through a collection
+    SEARCHES = {
+        '/search/repositories': 'repos',
+        '/search/issues': 'issues'
+    }
+
+    # The viewer connections of the GraphQL queries, `starredRepositories`
+    # before `repositories`, which would match it otherwise
+    CONNECTIONS = (
+        ('starredRepositories', 'starred'),
+        ('repositories', 'repos'),
+        ('gists', 'gists'),
+        ('organizations', 'orgs')
+    )
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, data, headers=None):
+        body = json.dumps(data).encode()
+        etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('X-RateLimit-Remaining', '4999')
+        self.send_header('X-RateLimit-Reset', str(int(time.time()) + 3600))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _count_request(self):
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+        if server.latency:
+            time.sleep(server.latency)
+
+    def do_GET(self):
+        server = self.server
+        self._count_request()
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        if url.path == '/user':
+            return self._send_json({
+                'login': 'benchmark',
+                'name': 'Benchmark User',
+                'html_url': 'https://github.com/benchmark'
+            })
+
+        kind = self.COLLECTIONS.get(url.path) or self.SEARCHES.get(url.path)
+        if kind is None:
+            # Organizations, notifications and anything else are empty
+            return self._send_json([])
+
+        per_page = int(query.get('per_page', ['30'])[0])
+        page = int(query.get('page', ['1'])[0])
+        items, last = server.account.page(kind, page, per_page)
+        if url.path in self.SEARCHES:
+            items = {
+                'total_count': server.account.sizes[kind],
+                'items': items
+            }
+
+        links = []
+        base = 'http://{}:{}{}'.format(server.server_address[0],
+                                       server.server_address[1], url.path)
+        if page < last:
+            links.append('<{}?per_page={}&page={}>; rel="next"'.format(
+                base, per_page, page + 1))
+            links.append('<{}?per_page={}&page={}>; rel="last"'.format(
+                base, per_page, last))
+        self._send_json(items, {'Link': ', '.join(links)} if links else None)
+
+    def do_POST(self):
+        server = self.server
+        self._count_request()
+
+        if urlparse(self.path).path != '/graphql':
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length).decode())
+        query = request['query']
+        variables = request.get('variables') or {}
+
+        for connection, kind in self.CONNECTIONS:
+            if connection + '(' in query:
+                break
+        else:
+            return self._send_json({
+                'errors': [{
+                    'message': 'Unsupported query'
+                }]
+            })
+
+        first = int(re.search(r'first:\s*(\d+)', query).group(1))
+        page = server.account.connection(kind, first, variables.get('cursor'))
+        self._send_json({'data': {'viewer': {connection: page}}},
+                        {'X-RateLimit-Resource': 'graphql'})
+
+
+class FakeGitHub(ThreadingHTTPServer):
+    """ Fake GitHub API server, running in a daemon thread """
+
+    daemon_threads = True
+
+    def __init__(self, account, latency=0.0):
+        """
+        Args:
+          account (SyntheticAccount): The account served
+          latency (float): Seconds added to every response
+        """
+        super(FakeGitHub, self).__init__(('127.0.0.1', 0), FakeGitHubHandler)
+        self.account = account
+        self.latency = latency
+        self.request_count = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server_address)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
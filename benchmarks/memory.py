@@ -0,0 +1,102 @@
+"""
+Measures the memory used by the resident copy of the cached collections.
+
+A synthetic account is written to a JSON cache, then a fresh interpreter
+loads the repos and starred repos collections and reports the memory
+allocated for them, as measured by tracemalloc, and the growth of its RSS.
+The first load parses the JSON files, indexes them as dicts and writes their
+binary snapshots, which are then mapped; a second interpreter maps the
+existing snapshots. Either way the items end up in the mapped snapshot: the
+compact records of gh.records are only used when no snapshot can be written,
+which this benchmark doesn't measure.
+
+Usage:
+    python benchmarks/memory.py [--items 50000] [--output FILE]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_github import SyntheticAccount  # noqa: E402
+
+CHILD = """
+import json, resource, sys, tracemalloc
+from gh.cache import Cache
+cache = Cache(sys.argv[1])
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+tracemalloc.start()
+results = {}
+for name, load in (('repos', cache.get_repos),
+                   ('starred', cache.get_starred_repos)):
+    before = tracemalloc.get_traced_memory()[0]
+    index = load()
+    results[name + '_mb'] = (tracemalloc.get_traced_memory()[0] - before) / 2**20
+results['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+tracemalloc.stop()
+results['rss_growth_mb'] = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                            - rss_before) / 1024
+print(json.dumps(results))
+"""
+
+
+def repo_to_dict(repo):
+    """ The cached fields of a repository, as GitHubDataSync stores them """
+    return {
+        'name': repo['name'],
+        'fullname': repo['full_name'],
+        'description': repo['description'],
+        'url': repo['html_url'],
+        'stars': repo['stargazers_count'],
+        'updated_at': repo['updated_at']
+    }
+
+
+def create_cache_dir(items):
+    """ Creates a cache directory with the repos and stars of an account """
+    account = SyntheticAccount(items)
+    cache_dir = tempfile.mkdtemp(prefix='ulauncher-github-memory-')
+    for kind, filename in (('repos', 'github_repos_cache.json'),
+                           ('starred', 'github_repos_starred_cache.json')):
+        with open(os.path.join(cache_dir, filename), 'w') as f:
+            json.dump([
+                repo_to_dict(account.repo(kind, i)) for i in range(items)
+            ], f)
+    return cache_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--items', type=int, default=50000,
+                        help='Number of repos and of starred repos')
+    parser.add_argument('--output', help='Saves the results as JSON')
+    args = parser.parse_args()
+
+    cache_dir = create_cache_dir(args.items)
+    results = {'items': args.items}
+    for load in ('json', 'snapshot'):
+        output = subprocess.check_output(
+            [sys.executable, '-c', CHILD, cache_dir],
+            cwd=ROOT,
+            env=dict(os.environ, PYTHONPATH=ROOT))
+        results[load] = json.loads(output.decode().strip().splitlines()[-1])
+
+        print("{} load".format(load))
+        for name in ('repos', 'starred'):
+            print("  {:<8} {:8.1f} MB".format(name,
+                                              results[load][name + '_mb']))
+        print("  peak     {:8.1f} MB".format(results[load]['peak_mb']))
+        print("  RSS      {:8.1f} MB".format(results[load]['rss_growth_mb']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
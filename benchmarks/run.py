@@ -0,0 +1,283 @@
+"""
+Benchmarks the sync and the keywords against a fake GitHub API.
+
+For every account size, a fresh interpreter syncs a synthetic account with
+GitHubDataSync, syncs it again incrementally, then types queries into the
+cache backed keywords through KeywordQueryEventListener, one keystroke at a
+time. It reports the sync wall time and request count, the p50/p99 latency of
+a keystroke and the peak RSS, and saves everything as JSON.
+
+Live searches are typed into the keywords backed by the GitHub API, and
+each of them must cost a single API request, as counted by the extension.
+
+The account is also synced with GraphQLDataSync into another cache, which
+must hold the same repos, stars and gists as the REST one; the benchmark
+fails otherwise.
+
+Usage:
+    python benchmarks/run.py [--accounts 100 5000 50000] [--backend json]
+                             [--output benchmark-results.json]
+"""
+import argparse
+import json
+import os
+import platform
+import queue
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_github import FakeGitHub, SyntheticAccount  # noqa: E402
+
+KEYWORDS = {
+    'kw_user_repos': 'gh:repos',
+    'kw_user_starred_repos': 'gh:starred',
+    'kw_gists': 'gh:gists'
+}
+
+TYPED_QUERIES = 20
+
+# The live keywords, with a query matching nothing in the local caches and
+# the name of their live results
+LIVE_KEYWORDS = {
+    'kw_public_repos': ('gh:search', 'python', 'public_repos'),
+    'kw_issues_assigned': ('gh:issues', 'zzz', 'issue.assigned'),
+    'kw_user_pulls_created': ('gh:pulls', 'zzz', 'pr.created')
+}
+
+# API requests allowed per live search, so N+1 fetches while rendering are
+# caught
+LIVE_SEARCH_REQUESTS = 1
+LIVE_SEARCH_TIMEOUT = 10
+
+
+class TypedQueryEvent(object):
+    """ The keyword query event of a query typed in the launcher """
+
+    def __init__(self, keyword, argument):
+        self.keyword = keyword
+        self.argument = argument
+
+    def get_keyword(self):
+        return self.keyword
+
+    def get_argument(self):
+        return self.argument
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def typed_queries(account, kind, count):
+    """
+    Yields the successive queries of typing item names, as exact names,
+    word prefixes and acronyms (`ul-gh` for `ulauncher-github`).
+    """
+    step = max(1, account.sizes[kind] // count)
+    for n, i in enumerate(range(0, account.sizes[kind], step)):
+        name = account._name(kind, i)
+        words = name.split('-')
+        if n % 3 == 0:
+            target = name
+        elif n % 3 == 1:
+            target = " ".join(w[:3] for w in words[:2])
+        else:
+            target = "-".join(w[:2] for w in words[:-1])
+        for size in range(1, len(target) + 1):
+            yield target[:size]
+
+
+def cache_contents(cache):
+    """ The synced collections of a cache, as lists of dicts """
+    contents = {}
+    for name, get in (('repos', cache.get_repos),
+                      ('starred_repos', cache.get_starred_repos),
+                      ('gists', cache.get_gists)):
+        index = get()
+        contents[name] = [
+            item.to_dict() if hasattr(item, 'to_dict') else dict(item)
+            for item in index.search("", len(index))
+        ]
+    return contents
+
+
+def count_live_requests(extension, listener):
+    """
+    Types a query into every live keyword and returns the number of API
+    requests of its fetch, once its results were pushed.
+    """
+    pushed = queue.Queue()
+    extension.push_results = lambda event, action: pushed.put(action)
+    counts = {}
+    for keyword_id, (keyword, query, name) in LIVE_KEYWORDS.items():
+        listener.on_event(TypedQueryEvent(keyword, query), extension)
+        pushed.get(timeout=LIVE_SEARCH_TIMEOUT)
+        counts[keyword_id] = extension.fetch_requests[name]
+    return counts
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def run_account(size, backend):
+    """ Runs the benchmark of one account size in the current process """
+    os.environ.setdefault('ULAUNCHER_WS_API',
+                          'ws://127.0.0.1:5054/benchmark')
+
+    from gh.accounts import Account
+    from gh.extension import GitHubExtension
+    from gh.github_sync import GitHubDataSync
+    from gh.graphql_sync import GraphQLDataSync
+    from gh.listeners.query import KeywordQueryEventListener
+    from gh.profile import UserProfile
+
+    account = SyntheticAccount(size)
+    server = FakeGitHub(account).start()
+    benchmark_account = Account(
+        None, 'benchmark', server.url,
+        tempfile.mkdtemp(prefix='ulauncher-github-bench-'), backend)
+    benchmark_account.user = UserProfile('benchmark', 'Benchmark User',
+                                         'https://github.com/benchmark')
+
+    results = {'size': size, 'backend': backend}
+    for phase in ('full_sync', 'incremental_sync'):
+        before = server.request_count
+        wall, _ = timed(
+            GitHubDataSync(benchmark_account.api,
+                           benchmark_account.cache).execute)
+        results[phase] = {
+            'wall_s': wall,
+            'requests': server.request_count - before
+        }
+
+    graphql_account = Account(
+        None, 'benchmark', server.url,
+        tempfile.mkdtemp(prefix='ulauncher-github-bench-'), backend)
+    before = server.request_count
+    wall, _ = timed(
+        GraphQLDataSync(graphql_account.api, graphql_account.cache).execute)
+    rest_contents = cache_contents(benchmark_account.cache)
+    graphql_contents = cache_contents(graphql_account.cache)
+    results['graphql_full_sync'] = {
+        'wall_s': wall,
+        'requests': server.request_count - before,
+        'mismatched': [
+            name for name in rest_contents
+            if rest_contents[name] != graphql_contents[name]
+        ]
+    }
+
+    extension = GitHubExtension()
+    extension.preferences = dict(KEYWORDS)
+    extension.preferences.update(
+        (keyword_id, keyword)
+        for keyword_id, (keyword, _, _) in LIVE_KEYWORDS.items())
+    extension.accounts = [benchmark_account]
+    listener = KeywordQueryEventListener()
+
+    results['keystrokes'] = {}
+    kinds = {
+        'kw_user_repos': 'repos',
+        'kw_user_starred_repos': 'starred',
+        'kw_gists': 'gists'
+    }
+    for keyword_id, keyword in KEYWORDS.items():
+        latencies = []
+        for query in typed_queries(account, kinds[keyword_id],
+                                   TYPED_QUERIES):
+            wall, _ = timed(listener.on_event,
+                            TypedQueryEvent(keyword, query), extension)
+            latencies.append(wall * 1000)
+        results['keystrokes'][keyword_id] = {
+            'count': len(latencies),
+            'p50_ms': percentile(latencies, 50),
+            'p99_ms': percentile(latencies, 99),
+            'max_ms': max(latencies)
+        }
+
+    results['live_requests'] = count_live_requests(extension, listener)
+
+    # ru_maxrss is in kilobytes on Linux
+    results['peak_rss_mb'] = resource.getrusage(
+        resource.RUSAGE_SELF).ru_maxrss / 1024
+    server.shutdown()
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=ROOT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--accounts', type=int, nargs='+',
+                        default=[100, 5000, 50000],
+                        help='Number of repos, stars and gists of each account')
+    parser.add_argument('--backend', choices=['json', 'sqlite'],
+                        default='json')
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        print(json.dumps(run_account(args.single, args.backend)))
+        return
+
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'date': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        'accounts': []
+    }
+    for size in args.accounts:
+        # A process per account, so the peak RSS is the one of that account
+        output = subprocess.check_output([
+            sys.executable, __file__, '--single',
+            str(size), '--backend', args.backend
+        ])
+        results = json.loads(output.decode().strip().splitlines()[-1])
+        report['accounts'].append(results)
+
+        print("{} items ({})".format(size, args.backend))
+        for phase in ('full_sync', 'incremental_sync', 'graphql_full_sync'):
+            print("  {:<18} {:8.2f} s   {:6d} requests".format(
+                phase, results[phase]['wall_s'], results[phase]['requests']))
+        mismatched = results['graphql_full_sync']['mismatched']
+        if mismatched:
+            print("  GraphQL and REST caches differ: {}".format(
+                ", ".join(mismatched)))
+        for keyword_id, stats in results['keystrokes'].items():
+            print("  {:<22} p50 {:7.2f} ms   p99 {:7.2f} ms".format(
+                keyword_id, stats['p50_ms'], stats['p99_ms']))
+        for keyword_id, count in results['live_requests'].items():
+            print("  {:<22} {:6d} requests per live search".format(
+                keyword_id, count))
+        print("  peak RSS {:.1f} MB".format(results['peak_rss_mb']))
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("Results saved to {}".format(args.output))
+
+    if any(results['graphql_full_sync']['mismatched'] or any(
+            count > LIVE_SEARCH_REQUESTS
+            for count in results['live_requests'].values())
+           for results in report['accounts']):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Measures the startup time of the extension.
+
+Every run starts a fresh interpreter which imports the extension, creates it,
+configures it with PreferencesEventListener, like Ulauncher does on startup,
+and answers a cache backed keyword. The account is served by the fake GitHub
+API and was synced beforehand, so the syncs started by the listener run in
+the background, as they would with an existing cache. The time of each step
+and the heavy modules imported before the first answer, by any thread, are
+reported.
+
+Usage:
+    python benchmarks/startup.py [--runs 20] [--repos 5000] [--output FILE]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_github import FakeGitHub, SyntheticAccount  # noqa: E402
+
+TOKEN = 'startup-benchmark'
+
+# Modules that should only be imported after the first answer
+HEAVY_MODULES = ('github', 'requests', 'gi', 'sqlite3')
+
+CHILD = """
+import json, os, sys, time
+start = time.perf_counter()
+from gh.extension import GitHubExtension
+from gh.listeners.preferences import PreferencesEventListener
+imported = time.perf_counter()
+extension = GitHubExtension()
+created = time.perf_counter()
+
+
+class PreferencesEvent(object):
+    def __init__(self, preferences):
+        self.preferences = preferences
+
+
+PreferencesEventListener().on_event(PreferencesEvent(json.loads(sys.argv[1])),
+                                    extension)
+configured = time.perf_counter()
+extension.user_repos('')
+answered = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'create_ms': (created - imported) * 1000,
+    'configure_ms': (configured - created) * 1000,
+    'first_answer_ms': (answered - configured) * 1000,
+    'total_ms': (answered - start) * 1000,
+    'heavy_modules': [m for m in json.loads(sys.argv[2]) if m in sys.modules]
+}))
+"""
+
+
+def child_env():
+    """ The environment of the runs, with a Ulauncher cache of their own """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.setdefault('ULAUNCHER_WS_API', 'ws://127.0.0.1:5054/startup-benchmark')
+    env['XDG_CACHE_HOME'] = tempfile.mkdtemp(prefix='ulauncher-github-startup-')
+    return env
+
+
+def sync_account(env, server):
+    """ Syncs the account of the fake API into the Ulauncher cache of the runs """
+    from gh.accounts import Account, account_cache_dir
+    from gh.github_sync import GitHubDataSync
+
+    cache_dir = subprocess.check_output(
+        [sys.executable, '-c',
+         'from ulauncher.config import CACHE_DIR; print(CACHE_DIR)'],
+        cwd=ROOT,
+        env=env).decode().strip()
+    account = Account(None, TOKEN, server.url,
+                      account_cache_dir(cache_dir, server.url, TOKEN))
+    GitHubDataSync(account.api, account.cache).execute()
+
+
+def preferences(server):
+    """ The preferences of the runs, using the account of the fake API """
+    return {
+        'access_token': TOKEN,
+        'api_url': server.url,
+        'accounts': "",
+        'cache_backend': 'json',
+        'sync_backend': 'rest',
+        'notify_new_notifications': 'no',
+        'docs_search': 'live',
+        'docs_dump_file': ""
+    }
+
+
+def run_once(env, server):
+    """ Runs the startup in a fresh interpreter and returns its timings """
+    output = subprocess.check_output(
+        [sys.executable, '-c', CHILD,
+         json.dumps(preferences(server)),
+         json.dumps(HEAVY_MODULES)],
+        cwd=ROOT,
+        env=env)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--repos', type=int, default=5000)
+    parser.add_argument('--output', help='Saves the results as JSON')
+    args = parser.parse_args()
+
+    server = FakeGitHub(SyntheticAccount(args.repos)).start()
+    env = child_env()
+    sync_account(env, server)
+    runs = [run_once(env, server) for _ in range(args.runs)]
+    server.shutdown()
+
+    results = {'runs': args.runs, 'repos': args.repos, 'steps': {}}
+    for step in ('import_ms', 'create_ms', 'configure_ms', 'first_answer_ms',
+                 'total_ms'):
+        values = [run[step] for run in runs]
+        results['steps'][step] = {
+            'p50': statistics.median(values),
+            'p90': percentile(values, 90),
+            'max': max(values)
+        }
+        print("{:<16} p50 {:8.1f} ms   p90 {:8.1f} ms".format(
+            step, results['steps'][step]['p50'],
+            results['steps'][step]['p90']))
+
+    results['heavy_modules'] = sorted(
+        set(m for run in runs for m in run['heavy_modules']))
+    print("Heavy modules imported before the first answer: {}".format(
+        ", ".join(results['heavy_modules']) or "none"))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
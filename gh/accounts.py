@@ -0,0 +1,224 @@
+"""
+The GitHub accounts synced by the extension: the account of the access token
+and the extra accounts of the `accounts` preference, on github.com or on a
+GitHub Enterprise instance.
+
+Every account has its own API client, and so its own rate limit budget, its
+own cache directory, with the frecency of its items, and its own sync
+schedule, so the accounts sync
+concurrently and a new token never serves the data of another account.
+"""
+import itertools
+import logging
+import os
+from threading import Thread
+from urllib.parse import urlparse
+
+from gh.api import DEFAULT_API_URL, GitHubApiClient, GitHubApiError
+from gh.cache import KEY_FIELDS, create_cache
+from gh.frecency import FRECENCY_FILE, FrecencyStore
+from gh.github_sync import GitHubDataSync
+from gh.graphql_sync import GraphQLDataSync
+from gh.profile import USER_PROFILE_FILE, ProfileStore, UserProfile, \
+    token_fingerprint
+from gh.records import Record
+from gh.search import SearchIndex
+from gh.sync_scheduler import SYNC_INTERVALS, SyncScheduler
+
+logger = logging.getLogger(__name__)
+
+ACCOUNTS_DIR = 'accounts'
+ACCOUNT_PREFERENCES = ('access_token', 'api_url', 'accounts')
+
+# The collections synced for every account
+ACCOUNT_COLLECTIONS = ('repos', 'gists', 'starred', 'orgs', 'issues')
+
+
+def parse_accounts(text):
+    """
+    Parses the `accounts` preference, one account per line: its name, its
+    access token and, for GitHub Enterprise, its API URL, e.g.
+    `work ghp_xxx https://github.example.com/api/v3`.
+    Blank lines and lines starting with `#` are ignored, and so are the
+    accounts named like a previous one.
+    Returns a list of (name, token, api_url) tuples.
+    """
+    accounts = []
+    names = set()
+    for number, line in enumerate((text or "").splitlines(), 1):
+        fields = line.split()
+        if not fields or fields[0].startswith('#'):
+            continue
+        if len(fields) not in (2, 3):
+            logger.error("Invalid account on line %d of the accounts", number)
+            continue
+        if fields[0] in names:
+            logger.error("Account %s on line %d of the accounts is already "
+                         "defined", fields[0], number)
+            continue
+        names.add(fields[0])
+        api_url = fields[2] if len(fields) == 3 else DEFAULT_API_URL
+        accounts.append((fields[0], fields[1], api_url.rstrip('/')))
+    return accounts
+
+
+def account_id(api_url, token):
+    """ Identifies an account by its host and token, without revealing the token """
+    return "{}-{}".format(urlparse(api_url).hostname,
+                          token_fingerprint(token)[:16])
+
+
+def account_cache_dir(cache_dir, api_url, token):
+    """ Returns the cache directory of an account, named after its id """
+    return os.path.join(cache_dir, ACCOUNTS_DIR, account_id(api_url, token))
+
+
+class Account(object):
+    """ An account with its API client, cache, user profile and syncs """
+
+    def __init__(self, name, token, api_url, cache_dir, cache_backend='json',
+                 sync_backend='rest', on_progress=None):
+        """
+        Args:
+          name (str): The name of the account, None for the account of the
+            access token, which is then named after its user
+          token (str): The personal access token
+          api_url (str): The API base URL
+          cache_dir (str): The directory where the account is cached
+          cache_backend (str): Either `json` or `sqlite`
+          sync_backend (str): Either `rest` or `graphql`
+          on_progress (callable): Receives the account, the collection, the
+            number of pages and of items synced and the total number of pages,
+            if known, after every page
+        """
+        self.name = name
+        self.token = token
+        self.api = GitHubApiClient(token, api_url)
+        # Identifies the account in the results, unlike its label
+        self.id = account_id(self.api.base_url, token)
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache = create_cache(cache_dir, cache_backend)
+        self.sync_backend = sync_backend
+        self.profiles = ProfileStore(os.path.join(cache_dir, USER_PROFILE_FILE))
+        self.user: UserProfile = self.profiles.load(token)
+        self.frecency = FrecencyStore(os.path.join(cache_dir, FRECENCY_FILE))
+        self.on_progress = on_progress
+        self.sync_progress = {}
+        self.sync_scheduler = SyncScheduler(
+            {
+                name: (lambda full, name=name: self.sync(name, full))
+                for name in ACCOUNT_COLLECTIONS
+            }, SYNC_INTERVALS)
+
+    @property
+    def key(self):
+        """ Identifies the account among the configured ones """
+        return (self.api.base_url, self.token)
+
+    @property
+    def label(self):
+        """ The name of the account, shown next to its items """
+        if self.name:
+            return self.name
+        if self.user is not None:
+            return self.user.login
+        return urlparse(self.api.web_url).hostname
+
+    def configure_cache(self, backend):
+        """ Switches the cache to the given storage backend (json or sqlite) """
+        self.cache = create_cache(self.cache_dir, backend)
+
+    def create_sync_service(self):
+        """ Creates the sync service of the configured sync backend """
+        if self.sync_backend == 'graphql':
+            return GraphQLDataSync(self.api, self.cache, self._report_progress)
+        return GitHubDataSync(self.api, self.cache, self._report_progress)
+
+    def sync(self, name, full=False):
+        """ Syncs a collection of the account """
+        try:
+            self.create_sync_service().execute(full, collections=[name])
+        finally:
+            self.sync_progress.pop(name, None)
+
+    def _report_progress(self, collection, pages, items, total_pages=None):
+        self.sync_progress[collection] = (pages, items, total_pages)
+        if self.on_progress is not None:
+            self.on_progress(self, collection, pages, items, total_pages)
+
+    def refresh_user(self):
+        """
+        Revalidates the profile of the user in the background.
+        The stored profile is kept when GitHub can't be reached.
+        """
+
+        def load_user():
+            try:
+                with self.api.interactive():
+                    user = UserProfile.from_api(self.api.get("/user"))
+            except GitHubApiError as e:
+                logger.error("Failed to load the GitHub user of %s: %s",
+                             self.label, e)
+                if e.status == 401:
+                    self.user = None
+                return
+            except Exception as e:
+                logger.error("Failed to load the GitHub user of %s: %s",
+                             self.label, e)
+                return
+
+            logger.info("Logged in as %s on %s", user.login, self.api.web_url)
+            self.user = user
+            try:
+                self.profiles.store(self.token, user)
+            except OSError as e:
+                logger.error("Failed to store the GitHub user: %s", e)
+
+        th = Thread(target=load_user)
+        th.daemon = True
+        th.start()
+
+    def stop(self):
+        """ Stops scheduling the syncs of the account """
+        self.sync_scheduler.stop()
+
+
+def _search_key(item, key_fields):
+    return "\n".join(item.get(field) or "" for field in key_fields).lower()
+
+
+def merge_results(collection, query, results, limit):
+    """
+    Ranks the results of several accounts together.
+
+    The results are indexed again with the search fields of the collection and
+    searched with the query, so they are all scored the same way. Every item is
+    copied with the label and the id of its account.
+
+    Args:
+      collection (str): The name of the searched collection
+      query (str): The search query
+      results (list): (account, items) pairs
+      limit (int): The maximum number of results
+    """
+    entries = []
+    # Interleaved, so an empty query lists the first items of every account
+    rows = [[(account, item) for item in items] for account, items in results]
+    for account, item in itertools.chain.from_iterable(
+            itertools.zip_longest(*rows, fillvalue=(None, None))):
+        if account is None:
+            continue
+        item = dict(item.to_dict() if isinstance(item, Record) else item,
+                    account=account.label,
+                    account_id=account.id)
+        entries.append((_search_key(item, KEY_FIELDS[collection]), item))
+
+    ranked = SearchIndex(entries).search(query, limit)
+    if len(ranked) < limit:
+        # The SQLite cache also matches fields that aren't part of the keys
+        found = set(map(id, ranked))
+        ranked += [
+            item for _, item in entries if id(item) not in found
+        ][:limit - len(ranked)]
+    return ranked
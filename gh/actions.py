@@ -2,3 +2,8 @@
 The file specifies list of avaiable actions to be handled by the custom event handler
 """
 REFRESH_DATA = "github.refresh_data"
+SHOW_METRICS = "github.show_metrics"
+DUMP_METRICS = "github.dump_metrics"
+SHOW_SYNC_STATUS = "github.show_sync_status"
+OPEN_ITEM = "github.open_item"
+COPY_ITEM = "github.copy_item"
@@ -0,0 +1,370 @@
+"""
+Minimal GitHub REST client used by the background sync.
+It fetches all the pages of a collection in parallel once the total number
+of pages is known, and throttles itself using the rate limit headers.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+from urllib.parse import parse_qs, urlparse
+
+from gh.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = "https://api.github.com"
+PER_PAGE = 100
+MAX_WORKERS = 4
+
+# Number of requests of every resource the background requests leave to the
+# interactive ones, which share the same rate limits. GitHub counts the
+# requests of every resource (core REST, search, GraphQL) separately, and the
+# search budget, 30 requests a minute, is shared by the issues sync and the
+# live searches.
+RATE_LIMIT_RESERVES = {'core': 50, 'graphql': 50, 'search': 10}
+MAX_RATE_LIMIT_RETRIES = 3
+
+
+class GitHubApiError(Exception):
+    """ Raised when GitHub responds with an unexpected status code """
+
+    def __init__(self, status, message):
+        super(GitHubApiError, self).__init__("{} {}".format(status, message))
+        self.status = status
+
+
+class RateLimitError(GitHubApiError):
+    """
+    Raised when requests are still rate limited after the retries, or when
+    an interactive request finds the budget spent
+    """
+
+    def __init__(self, status, message, reset_at):
+        super(RateLimitError, self).__init__(status, message)
+        self.reset_at = reset_at
+
+
+class RequestCounter(object):
+    """ Counts the requests made while it is active """
+
+    def __init__(self):
+        self.count = 0
+
+
+class RateLimitBudget(object):
+    """ The remaining requests of a rate limit resource, until its reset """
+
+    def __init__(self, remaining, reset_at):
+        self.remaining = remaining
+        self.reset_at = reset_at
+
+
+class RateLimiter(object):
+    """
+    Tracks the X-RateLimit-Remaining and X-RateLimit-Reset headers of every
+    X-RateLimit-Resource and makes callers wait for the reset once the budget
+    of the resource they use is spent, instead of sleeping a fixed amount of
+    time between requests.
+
+    Background callers stop at the reserve of the resource, which is left to
+    the interactive ones. Those never wait: they fail once the budget is
+    really spent, as the user wouldn't wait for the reset.
+    """
+
+    def __init__(self, reserves=RATE_LIMIT_RESERVES):
+        """
+        Args:
+          reserves (dict): The requests kept aside, per resource
+        """
+        self.reserves = reserves
+        self.budgets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, resource='core', interactive=False):
+        """
+        Blocks until a request can be made without exhausting the budget.
+        Raises RateLimitError instead for interactive requests.
+        """
+        reserve = 0 if interactive else self.reserves.get(resource, 0)
+        while True:
+            with self._lock:
+                now = time.time()
+                budget = self.budgets.get(resource)
+                if budget is None or budget.remaining > reserve \
+                        or now >= budget.reset_at:
+                    if budget is not None:
+                        budget.remaining -= 1
+                    return
+                delay = budget.reset_at - now
+                if interactive:
+                    raise RateLimitError(
+                        429, "Rate limit of {} exhausted".format(resource),
+                        budget.reset_at)
+
+            logger.info("Rate limit of %s almost exhausted, waiting %d seconds",
+                        resource, delay)
+            time.sleep(delay)
+
+    def update(self, headers, resource='core'):
+        """
+        Updates the budget from the headers of a response.
+        The X-RateLimit-Resource header, when present, tells the resource.
+        """
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset_at = headers.get('X-RateLimit-Reset')
+        if remaining is None or reset_at is None:
+            return
+
+        resource = headers.get('X-RateLimit-Resource', resource)
+        with self._lock:
+            self.budgets[resource] = RateLimitBudget(int(remaining),
+                                                     int(reset_at))
+
+    def reset_time(self, headers):
+        """ Returns when a request rejected because of a rate limit can be retried """
+        retry_after = headers.get('Retry-After')
+        if retry_after is not None:
+            return time.time() + int(retry_after)
+        return int(headers.get('X-RateLimit-Reset', 0))
+
+    def wait_until_reset(self, headers):
+        """ Waits after a request was rejected because of a rate limit """
+        delay = max(self.reset_time(headers) - time.time(), 1)
+        logger.info("Rate limited by GitHub, retrying in %d seconds", delay)
+        time.sleep(delay)
+
+
+class GitHubApiClient(object):
+    """ GitHub REST API client """
+
+    def __init__(self, token, base_url=DEFAULT_API_URL,
+                 max_workers=MAX_WORKERS):
+        """
+        Args:
+          token (str): The personal access token
+          base_url (str): The API base URL
+          max_workers (int): Maximum number of pages fetched in parallel
+        """
+        self.base_url = base_url.rstrip('/')
+        self.max_workers = max_workers
+        self.rate_limiter = RateLimiter()
+        self.request_count = 0
+        self._count_lock = threading.Lock()
+        self._local = threading.local()
+        self._session = None
+        # Sent with every request, since the session is shared
+        self.headers = {
+            'Accept': 'application/vnd.github+json',
+            'Authorization': 'token {}'.format(token),
+        }
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _is_rate_limited(self, response):
+        """ Checks if a request was rejected because of a rate limit """
+        if response.status_code == 429:
+            return True
+        return response.status_code == 403 and (
+            response.headers.get('X-RateLimit-Remaining') == '0'
+            or 'Retry-After' in response.headers)
+
+    @property
+    def graphql_url(self):
+        """ The GraphQL endpoint matching the REST base URL """
+        if self.base_url.endswith('/v3'):
+            # GitHub Enterprise serves REST on /api/v3 and GraphQL on /api/graphql
+            return self.base_url[:-len('v3')] + 'graphql'
+        return self.base_url + '/graphql'
+
+    @property
+    def session(self):
+        """ The shared HTTP session, only imported once the first request is made """
+        if self._session is None:
+            from gh.http_session import get_session
+            self._session = get_session()
+        return self._session
+
+    @property
+    def web_url(self):
+        """ The web URL of the GitHub instance of the API """
+        if self.base_url == DEFAULT_API_URL:
+            return "https://github.com"
+        # GitHub Enterprise serves the API on /api/v3
+        return self.base_url.rsplit('/api', 1)[0]
+
+    @contextmanager
+    def interactive(self):
+        """
+        Marks the requests made by the current thread inside the block as
+        interactive: they use the rate limit reserves and never wait for a
+        reset.
+        """
+        previous = getattr(self._local, 'interactive', False)
+        self._local.interactive = True
+        try:
+            yield
+        finally:
+            self._local.interactive = previous
+
+    @contextmanager
+    def count_requests(self):
+        """
+        Counts the requests made by the current thread inside the block.
+        Yields a RequestCounter.
+        """
+        counters = getattr(self._local, 'counters', None)
+        if counters is None:
+            counters = self._local.counters = []
+
+        counter = RequestCounter()
+        counters.append(counter)
+        try:
+            yield counter
+        finally:
+            counters.remove(counter)
+
+    def _count_request(self):
+        """ Updates the global and the active request counters """
+        with self._count_lock:
+            self.request_count += 1
+            for counter in getattr(self._local, 'counters', ()):
+                counter.count += 1
+
+    def _stage(self, method, url):
+        """
+        Names the metrics stage of a request after its endpoint, e.g.
+        `api.GET /user/repos` or `api.GET /orgs/*`.
+        """
+        path = urlparse(url).path
+        base_path = urlparse(self.base_url).path
+        if path.startswith(base_path):
+            path = path[len(base_path):]
+
+        segments = path.strip('/').split('/')[:2]
+        if segments[0] in ('orgs', 'users', 'repos') and len(segments) > 1:
+            segments[1] = '*'
+        return "api.{} /{}".format(method, "/".join(segments))
+
+    def _resource(self, url):
+        """ The rate limit resource of a request, as GitHub names it """
+        if url == self.graphql_url:
+            return 'graphql'
+        base_path = urlparse(self.base_url).path
+        if urlparse(url).path.startswith(base_path + '/search/'):
+            return 'search'
+        return 'core'
+
+    def request(self, method, path, params=None, headers=None, json=None):
+        """
+        Makes a request to the API, waiting out the rate limit of its resource.
+        A 304 Not Modified response is returned as is.
+        """
+        url = path if path.startswith('http') else self.base_url + path
+        resource = self._resource(url)
+        interactive = getattr(self._local, 'interactive', False)
+
+        for attempt in range(MAX_RATE_LIMIT_RETRIES):
+            self.rate_limiter.acquire(resource, interactive)
+            self._count_request()
+            with timed(self._stage(method, url)):
+                response = self.session.request(
+                    method,
+                    url,
+                    params=params,
+                    headers=dict(self.headers, **(headers or {})),
+                    json=json)
+            self.rate_limiter.update(response.headers, resource)
+
+            if not self._is_rate_limited(response):
+                break
+            if interactive or attempt + 1 == MAX_RATE_LIMIT_RETRIES:
+                raise RateLimitError(response.status_code, response.reason,
+                                     self.rate_limiter.reset_time(response.headers))
+            self.rate_limiter.wait_until_reset(response.headers)
+
+        if response.status_code >= 400:
+            raise GitHubApiError(response.status_code, response.reason)
+
+        return response
+
+    def _counted_request(self, counters, *args):
+        """ Makes a request from a worker thread on behalf of the caller's counters """
+        self._local.counters = counters
+        try:
+            return self.request(*args)
+        finally:
+            self._local.counters = []
+
+    def get(self, path, params=None, headers=None):
+        """ Makes a GET request and returns the decoded JSON """
+        return self.request('GET', path, params, headers).json()
+
+    def graphql(self, query, variables=None):
+        """ Runs a GraphQL query and returns its data """
+        response = self.request('POST', self.graphql_url,
+                                json={
+                                    'query': query,
+                                    'variables': variables or {}
+                                }).json()
+        if response.get('errors'):
+            raise GitHubApiError(200, response['errors'][0].get('message'))
+        return response['data']
+
+    def next_pages(self, response, headers=None):
+        """ Yields the responses of the pages after the given one, in order """
+        while 'next' in response.links:
+            response = self.request('GET', response.links['next']['url'],
+                                    headers=headers)
+            yield response
+
+    def last_page(self, response):
+        """ Reads the number of the last page from the Link header """
+        last = response.links.get('last')
+        if not last:
+            return None
+        page = parse_qs(urlparse(last['url']).query).get('page')
+        return int(page[0]) if page else None
+
+    def iter_pages(self, path, params=None, headers=None, first_page=None):
+        """
+        Yields the response of every page of a paginated collection, in order.
+        The first page tells the total number of pages, and the remaining
+        pages are then fetched in parallel, at most `max_workers` pages ahead
+        of the one being consumed.
+
+        Args:
+          first_page (Response): The first page, when it was already fetched
+        """
+        params = dict(params or {}, per_page=PER_PAGE)
+        response = first_page or self.request('GET', path, params, headers)
+        yield response
+
+        last_page = self.last_page(response)
+        if last_page is None:
+            # No total is known, so follow the "next" links one by one.
+            yield from self.next_pages(response, headers)
+            return
+
+        counters = list(getattr(self._local, 'counters', ()))
+
+        def fetch(page):
+            return self._executor.submit(self._counted_request, counters,
+                                         'GET', path, dict(params, page=page),
+                                         headers)
+
+        pages = iter(range(2, last_page + 1))
+        futures = deque(map(fetch, islice(pages, self.max_workers)))
+        while futures:
+            response = futures.popleft().result()
+            futures.extend(map(fetch, islice(pages, 1)))
+            yield response
+
+    def get_all(self, path, params=None, headers=None):
+        """ Returns all the items of a paginated collection """
+        items = []
+        for response in self.iter_pages(path, params, headers):
+            items.extend(response.json())
+        return items
@@ -1,5 +1,267 @@
 import os
 import json
+import logging
+import tempfile
+import threading
+from collections import namedtuple
+
+from gh.records import OrgRepoRecord, RepoRecord, pack_records, \
+    unpack_records
+from gh.search import SearchIndex
+from gh.snapshot import open_snapshot, snapshot_path, write_snapshot
+from gh.utils import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# The fields of the items searched in every collection
+KEY_FIELDS = {
+    'repos': ('fullname', ),
+    'starred_repos': ('name', ),
+    'gists': ('description', 'filename'),
+    'orgs': ('login', 'name'),
+    'org_repos': ('fullname', ),
+    'issues': ('title', 'repository', 'labels')
+}
+
+# The field identifying the items of the collections synced page by page
+STREAM_KEYS = {
+    'repos': 'fullname',
+    'starred_repos': 'fullname',
+    'gists': 'url'
+}
+
+
+class Snapshot(namedtuple('Snapshot', 'generation signature index')):
+    """
+    Immutable view of a collection. Publishing a new snapshot is a single
+    reference assignment, so readers never need a lock to get a consistent
+    view of the data.
+    """
+
+
+class CachedCollection(object):
+    """
+    Resident copy of a JSON cache file.
+    The file is loaded once and only reloaded when its mtime or size changes.
+    It is loaded from its binary snapshot when the snapshot was built from
+    the current file, and parsed otherwise.
+    """
+
+    def __init__(self, path, key_fields, record_type=None):
+        """
+        Args:
+          path (str): The path of the JSON file backing this collection
+          key_fields (tuple): The item fields used to build the search key
+          record_type (type): The compact record the items are kept as,
+            instead of dicts, when the snapshot can't be used
+        """
+        self.path = path
+        self.snapshot_path = snapshot_path(path)
+        self.key_fields = key_fields
+        self.record_type = record_type
+        self._snapshot = Snapshot(0, None, SearchIndex([]))
+        self._scoped = {}
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self):
+        """ Incremented every time new data is published """
+        return self._snapshot.generation
+
+    def _file_signature(self):
+        """ Returns the (mtime, size) pair of the backing file """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _build_key(self, item):
+        """ Builds the lowercased search key of a single item """
+        return "\n".join(item.get(field) or ""
+                         for field in self.key_fields).lower()
+
+    def _build_index(self, items, signature):
+        """
+        Builds the search index of the items, which are dicts, and returns
+        it mapped from the snapshot written for it. When the snapshot can't
+        be written nor mapped, the index is kept in memory, with the items
+        packed as records.
+        """
+        index = SearchIndex([(self._build_key(item), item) for item in items])
+        if signature is not None:
+            try:
+                write_snapshot(self.snapshot_path, index, signature)
+                mapped = open_snapshot(self.snapshot_path, signature)
+                if mapped is not None:
+                    return mapped
+            except OSError as e:
+                logger.error("Unable to write cache snapshot %s: %s",
+                             self.snapshot_path, e)
+
+        if self.record_type is None:
+            return index
+        return index.with_items(pack_records(self.record_type, index.items))
+
+    def _publish(self, index, signature):
+        """ Swaps the snapshot """
+        self._snapshot = Snapshot(self._snapshot.generation + 1, signature,
+                                  index)
+
+    def _reload_if_changed(self):
+        """
+        Reloads the collection from disk when the file was modified.
+        If another thread is already writing or reloading, the current
+        snapshot is kept instead of waiting for it.
+        """
+        if self._file_signature() == self._snapshot.signature:
+            return
+
+        if not self._lock.acquire(blocking=False):
+            return
+
+        try:
+            signature = self._file_signature()
+            if signature == self._snapshot.signature:
+                return
+
+            index = open_snapshot(self.snapshot_path, signature) \
+                if signature is not None else None
+            if index is None:
+                items = []
+                if signature is not None:
+                    with open(self.path) as f:
+                        items = json.load(f)
+                index = self._build_index(items, signature)
+
+            self._publish(index, signature)
+        except ValueError as e:
+            logger.error("Unable to read cache file %s: %s", self.path, e)
+        finally:
+            self._lock.release()
+
+    def index(self):
+        """ Returns the search index of the cached items """
+        self._reload_if_changed()
+        return self._snapshot.index
+
+    def scoped_index(self, field, value):
+        """
+        Returns the search index of the items whose field equals the value,
+        ignoring case. It is built on first use for every snapshot.
+        """
+        index = self.index()
+        key = (self._snapshot.generation, field, value.lower())
+        scoped = self._scoped.get(key)
+        if scoped is None:
+            value = value.lower()
+            scoped = SearchIndex([
+                (index.keys[i], item) for i, item in enumerate(index.items)
+                if (item.get(field) or "").lower() == value
+            ])
+            # Indexes of older snapshots are dropped
+            self._scoped = {
+                k: v
+                for k, v in self._scoped.items() if k[0] == key[0]
+            }
+            self._scoped[key] = scoped
+        return scoped
+
+    def store(self, data):
+        """ Writes the data to disk and makes it the resident copy """
+        data = unpack_records(data)
+        with self._lock:
+            write_json_atomic(self.path, data)
+            signature = self._file_signature()
+            self._publish(self._build_index(data, signature), signature)
+
+    def merge(self, data, key_field, removed=()):
+        """
+        Merges changed items into the collection.
+        The changed items go first, replacing the existing items with the same key.
+        The items with a key in `removed` are dropped.
+        """
+        dropped = {item[key_field] for item in data}.union(removed)
+        self.store(data + [
+            item for item in self.index().items
+            if item[key_field] not in dropped
+        ])
+
+    def stream(self, key_field, replace=False):
+        """ Returns a stream merging the pages of a sync into the collection """
+        return CollectionStream(self, key_field, replace)
+
+
+class CollectionStream(object):
+    """
+    Merges the pages of a sync into a collection as they arrive.
+
+    Pages are spooled to a temporary file, and merged into the collection
+    every time the number of spooled items doubled, so the first pages are
+    searchable right away while the collection is only rewritten a
+    logarithmic number of times. With `replace`, the items that weren't
+    streamed are dropped once the stream is closed.
+
+    Between merges, only the page being added is held in memory. A merge
+    reads back every spooled item and the items of the collection, and
+    builds the search index of the merged collection, so it needs as much
+    memory as a sync that keeps all of its pages: about twice the size of
+    the collection while the new index is built.
+    """
+
+    def __init__(self, collection, key_field, replace=False):
+        self.collection = collection
+        self.key_field = key_field
+        self.replace = replace
+        self.count = 0
+        self.published = 0
+        self._spool = tempfile.TemporaryFile(
+            'w+', dir=os.path.dirname(collection.path) or '.')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # The pages merged before an error are kept, nothing is dropped
+        if exc_type is None:
+            self.close()
+        self._spool.close()
+
+    def add(self, items):
+        """ Adds the items of a page """
+        for item in items:
+            self._spool.write(json.dumps(item) + "\n")
+        self.count += len(items)
+        if items and self.count >= 2 * self.published:
+            self._publish()
+
+    def _spooled(self):
+        """ Reads back the streamed items, without duplicates """
+        self._spool.seek(0)
+        items = []
+        keys = set()
+        for line in self._spool:
+            item = json.loads(line)
+            if item[self.key_field] not in keys:
+                keys.add(item[self.key_field])
+                items.append(item)
+        return items, keys
+
+    def _publish(self, final=False):
+        """ Stores the streamed items before the items not streamed yet """
+        items, keys = self._spooled()
+        if not (final and self.replace):
+            items += [
+                item for item in self.collection.index().items
+                if item[self.key_field] not in keys
+            ]
+        self.collection.store(items)
+        self.published = self.count
+
+    def close(self):
+        """ Publishes the last pages, and drops the items not streamed """
+        if self.count > self.published or self.replace:
+            self._publish(final=True)
 
 
 class Cache(object):
@@ -12,43 +274,126 @@ class Cache(object):
             cache_dir, 'github_repos_starred_cache.json')
         self.gists_cache_file = os.path.join(cache_dir,
                                              'github_gists_cache.json')
-        self.__initialize_cache_files()
-
-    def __initialize_cache_files(self):
-        """ Creates the cache files on disk if they not exist yet"""
-        if not os.path.exists(self.repos_cache_file):
-            with open(self.repos_cache_file, 'w') as f:
-                json.dump([], f)
+        self.orgs_cache_file = os.path.join(cache_dir,
+                                            'github_orgs_cache.json')
+        self.org_repos_cache_file = os.path.join(
+            cache_dir, 'github_org_repos_cache.json')
+        self.issues_cache_file = os.path.join(cache_dir,
+                                              'github_issues_cache.json')
+        self.sync_state_file = os.path.join(cache_dir,
+                                            'github_sync_state.json')
 
-        if not os.path.exists(self.repos_starred_cache_file):
-            with open(self.repos_starred_cache_file, 'w') as f:
-                json.dump([], f)
-
-        if not os.path.exists(self.gists_cache_file):
-            with open(self.gists_cache_file, 'w') as f:
-                json.dump([], f)
+        self.repos = CachedCollection(self.repos_cache_file,
+                                      KEY_FIELDS['repos'], RepoRecord)
+        self.starred_repos = CachedCollection(self.repos_starred_cache_file,
+                                              KEY_FIELDS['starred_repos'],
+                                              RepoRecord)
+        self.gists = CachedCollection(self.gists_cache_file,
+                                      KEY_FIELDS['gists'])
+        self.orgs = CachedCollection(self.orgs_cache_file, KEY_FIELDS['orgs'])
+        self.org_repos = CachedCollection(self.org_repos_cache_file,
+                                          KEY_FIELDS['org_repos'],
+                                          OrgRepoRecord)
+        self.issues = CachedCollection(self.issues_cache_file,
+                                       KEY_FIELDS['issues'])
 
     def store_repos_cache(self, data=[]):
-        with open(self.repos_cache_file, 'w') as f:
-            json.dump(data, f)
+        self.repos.store(data)
 
     def store_gists_cache(self, data=[]):
-        with open(self.gists_cache_file, 'w') as f:
-            json.dump(data, f)
+        self.gists.store(data)
 
     def store_starred_repos(self, data=[]):
         """ Save starred repos in the cache"""
-        with open(self.repos_starred_cache_file, 'w') as f:
-            json.dump(data, f)
+        self.starred_repos.store(data)
+
+    def store_orgs_cache(self, data=[]):
+        """ Save the organizations of the user in the cache """
+        self.orgs.store(data)
+
+    def store_org_repos_cache(self, data=[]):
+        """ Save the repos of the organizations of the user in the cache """
+        self.org_repos.store(data)
+
+    def store_issues_cache(self, data=[]):
+        """ Save the open issues and pull requests of the user in the cache """
+        self.issues.store(data)
+
+    def merge_repos_cache(self, data):
+        """ Merge changed repos into the cache """
+        self.repos.merge(data, 'fullname')
+
+    def merge_gists_cache(self, data):
+        """ Merge changed gists into the cache """
+        self.gists.merge(data, 'url')
+
+    def merge_starred_repos(self, data):
+        """ Merge new starred repos into the cache """
+        self.starred_repos.merge(data, 'fullname')
+
+    def merge_issues_cache(self, data, closed=()):
+        """ Merge changed issues into the cache, dropping the closed ones """
+        self.issues.merge(data, 'id', closed)
+
+    def stream(self, name, replace=False):
+        """
+        Returns a stream merging the pages of a sync into a collection.
+        Args:
+          name (str): The collection, e.g. `repos` or `starred_repos`
+          replace (bool): Drop the items that weren't streamed once it is closed
+        """
+        return getattr(self, name).stream(STREAM_KEYS[name], replace)
+
+    def get_sync_state(self):
+        """ Returns the ETags and watermarks of the last sync """
+        try:
+            with open(self.sync_state_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def store_sync_state(self, state):
+        """ Save the ETags and watermarks of the last sync """
+        write_json_atomic(self.sync_state_file, state)
+
+    def get_repos(self) -> SearchIndex:
+        """ Returns the search index of the cached repos """
+        return self.repos.index()
+
+    def get_gists(self) -> SearchIndex:
+        """ Returns the search index of the cached gists """
+        return self.gists.index()
+
+    def get_starred_repos(self) -> SearchIndex:
+        """ Returns the search index of the cached starred repos """
+        return self.starred_repos.index()
+
+    def get_orgs(self) -> SearchIndex:
+        """ Returns the search index of the cached organizations """
+        return self.orgs.index()
+
+    def get_org_repos(self, org=None) -> SearchIndex:
+        """
+        Returns the search index of the cached organization repos,
+        or only of the repos of the given organization.
+        """
+        if org is None:
+            return self.org_repos.index()
+        return self.org_repos.scoped_index('org', org)
 
-    def get_repos(self):
-        with open(self.repos_cache_file) as f:
-            return json.load(f)
+    def get_issues(self, filter) -> SearchIndex:
+        """ Returns the search index of the cached issues of a filter """
+        return self.issues.scoped_index('filter', filter)
 
-    def get_gists(self):
-        with open(self.gists_cache_file) as f:
-            return json.load(f)
 
-    def get_starred_repos(self):
-        with open(self.repos_starred_cache_file) as cache_file:
-            return json.load(cache_file)
+def create_cache(cache_dir, backend='json'):
+    """
+    Creates the cache for the configured storage backend
+    Args:
+      cache_dir (str): The directory where the cache is stored
+      backend (str): Either `json` (default) or `sqlite`
+    """
+    if backend == 'sqlite':
+        from gh.sqlite_cache import SqliteCache
+        return SqliteCache(cache_dir)
+    return Cache(cache_dir)
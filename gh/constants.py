@@ -4,4 +4,12 @@ ISSUE_FILTER_CREATED = "issues.created"
 PR_FILTER_ASSIGNED = "pr.assigned"
 PR_FILTER_CREATED = "pr.created"
 
+# Search qualifiers of the issues and pull requests of each filter
+ISSUE_QUERIES = {
+    ISSUE_FILTER_ASSIGNED: "type:issue assignee:@me",
+    ISSUE_FILTER_CREATED: "type:issue author:@me",
+    PR_FILTER_ASSIGNED: "type:pr assignee:@me",
+    PR_FILTER_CREATED: "type:pr author:@me"
+}
+
 DOCS_BASE_URL = "https://docs.github.com"
@@ -0,0 +1,287 @@
+"""
+Offline search index of the GitHub documentation pages.
+
+The index is an inverted index of the titles, breadcrumbs and URLs of the
+pages, ranked with BM25. It is built from the page list of docs.github.com
+during the background sync, learned from the results of the live search, or
+imported from a dump file.
+"""
+import bisect
+import heapq
+import json
+import logging
+import math
+import re
+import threading
+import time
+from collections import namedtuple
+
+from gh.utils import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+DOCS_INDEX_VERSION = 1
+PAGE_LIST_PATH = "/api/pagelist/en/free-pro-team@latest"
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# A title term counts as much as three breadcrumbs or URL terms
+FIELD_WEIGHTS = (3, 1, 1)
+MAX_PREFIX_TERMS = 50
+
+TOKEN = re.compile(r'[a-z0-9]+')
+
+DocsState = namedtuple('DocsState',
+                       'built_at docs postings lengths impacts vocabulary')
+
+EMPTY_STATE = DocsState(0, [], {}, [], {}, [])
+
+
+def tokenize(text):
+    return TOKEN.findall((text or "").lower())
+
+
+def page_to_doc(path):
+    """
+    Builds a page entry from its path, as the page list has no titles,
+    e.g. `/en/actions/using-workflows/about-workflows` becomes
+    `About workflows` in `Actions / Using workflows`.
+    """
+    parts = [
+        part.replace('-', ' ').capitalize() for part in path.split('/')[2:]
+        if part and '@' not in part
+    ]
+    return {
+        'title': parts[-1] if parts else path,
+        'breadcrumbs': " / ".join(parts[:-1]),
+        'url': path
+    }
+
+
+class DocsIndex(object):
+    """
+    In process BM25 search over the documentation pages.
+
+    The index is loaded lazily on the first search. Builds replace the whole
+    state at once, so searches never see a half built index. Pages learned
+    from the live search are merged by a background thread, and builds and
+    merges are serialized, so neither loses the pages of the other.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+          path (str): The file the index is stored in
+        """
+        self.path = path
+        self._state = None
+        self._lock = threading.Lock()
+        self._update_lock = threading.Lock()
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._worker = None
+
+    def _load(self):
+        """ Returns the current state, reading it from disk the first time """
+        state = self._state
+        if state is not None:
+            return state
+
+        with self._lock:
+            if self._state is not None:
+                return self._state
+
+            state = EMPTY_STATE
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+                if data.get('version') == DOCS_INDEX_VERSION:
+                    state = self._create_state(data['docs'], data['built_at'],
+                                               data['postings'],
+                                               data['lengths'])
+            except FileNotFoundError:
+                pass
+            except (ValueError, KeyError) as e:
+                logger.error("Invalid docs index, ignoring it: %s", e)
+
+            self._state = state
+            return state
+
+    def _create_state(self, docs, built_at, postings=None, lengths=None):
+        """ Creates a state, computing the postings when not given """
+        if postings is None:
+            postings = {}
+            lengths = []
+            for doc_id, doc in enumerate(docs):
+                frequencies = {}
+                fields = (doc['title'], doc['breadcrumbs'], doc['url'])
+                for text, weight in zip(fields, FIELD_WEIGHTS):
+                    for term in tokenize(text):
+                        frequencies[term] = frequencies.get(term, 0) + weight
+                for term, frequency in frequencies.items():
+                    postings.setdefault(term, []).extend((doc_id, frequency))
+                lengths.append(sum(frequencies.values()))
+
+        return DocsState(built_at, docs, postings, lengths,
+                         self._impacts(postings, lengths), sorted(postings))
+
+    def _impacts(self, postings, lengths):
+        """
+        Precomputes the BM25 score of every term in every page, so searches
+        only have to add them up.
+        """
+        total = len(lengths)
+        avg_length = sum(lengths) / total if total else 0.0
+        impacts = {}
+        for term, posting in postings.items():
+            matches = len(posting) // 2
+            idf = math.log(1 + (total - matches + 0.5) / (matches + 0.5))
+            scores = impacts[term] = {}
+            for i in range(0, len(posting), 2):
+                doc_id, frequency = posting[i], posting[i + 1]
+                norm = K1 * (1 - B + B * lengths[doc_id] / avg_length)
+                scores[doc_id] = idf * frequency * (K1 + 1) / (frequency + norm)
+        return impacts
+
+    def _save(self, state):
+        """ Publishes the state and writes it to disk """
+        self._state = state
+        try:
+            write_json_atomic(
+                self.path, {
+                    'version': DOCS_INDEX_VERSION,
+                    'built_at': state.built_at,
+                    'docs': state.docs,
+                    'postings': state.postings,
+                    'lengths': state.lengths
+                })
+        except OSError as e:
+            logger.error("Failed to write the docs index: %s", e)
+
+    def __len__(self):
+        return len(self._load().docs)
+
+    @property
+    def built_at(self):
+        """ The time the index was last built """
+        return self._load().built_at
+
+    def is_stale(self, max_age):
+        """ Checks if the index was built more than max_age seconds ago """
+        return time.time() - self._load().built_at > max_age
+
+    def build(self, docs):
+        """ Replaces the index with the given pages """
+        docs = list(docs)
+        with self._update_lock:
+            self._save(self._create_state(docs, time.time()))
+
+    def add(self, docs):
+        """
+        Queues pages to add or update, e.g. learned from the live search.
+        Rebuilding the index takes too long for a keystroke, so they are
+        merged by a background thread.
+        """
+        with self._pending_lock:
+            self._pending.extend(docs)
+            if self._worker is not None:
+                return
+            self._worker = threading.Thread(target=self._merge_pending)
+            self._worker.daemon = True
+            self._worker.start()
+
+    def _merge_pending(self):
+        """ Merges the queued pages until there are none left """
+        while True:
+            with self._pending_lock:
+                docs, self._pending = self._pending, []
+                if not docs:
+                    self._worker = None
+                    return
+
+            with self._update_lock:
+                state = self._load()
+                by_url = {doc['url']: doc for doc in state.docs}
+                changed = [doc for doc in docs if by_url.get(doc['url']) != doc]
+                if not changed:
+                    continue
+
+                by_url.update((doc['url'], doc) for doc in changed)
+                self._save(
+                    self._create_state(list(by_url.values()), state.built_at))
+
+    def import_dump(self, path):
+        """ Builds the index from a JSON list of title, breadcrumbs and url """
+        with open(path) as f:
+            self.build({
+                'title': doc['title'],
+                'breadcrumbs': doc.get('breadcrumbs', ""),
+                'url': doc['url']
+            } for doc in json.load(f))
+
+    def build_from_page_list(self, session, base_url):
+        """ Builds the index from the page list of the docs site """
+        response = session.get(base_url + PAGE_LIST_PATH)
+        response.raise_for_status()
+        paths = [line.strip() for line in response.text.splitlines()]
+        self.build(page_to_doc(path) for path in paths if path)
+        logger.info("Docs index built with %d pages", len(self))
+
+    def _expand(self, vocabulary, prefix):
+        """ Returns the indexed terms starting with the prefix """
+        start = bisect.bisect_left(vocabulary, prefix)
+        terms = []
+        for term in vocabulary[start:start + MAX_PREFIX_TERMS]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def search(self, query, limit):
+        """
+        Returns the best `limit` pages containing every term of the query.
+        The last term is matched as a prefix, as it is usually still being
+        typed.
+        """
+        state = self._load()
+        tokens = tokenize(query)
+        if not tokens or not state.docs:
+            return []
+
+        scores = None
+        # The terms matching the fewest pages go first, so the following
+        # ones only have to look up the remaining candidates.
+        for token_scores in sorted(
+                (self._token_scores(state, token, i == len(tokens) - 1)
+                 for i, token in enumerate(tokens)), key=len):
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {
+                    doc_id: score + token_scores[doc_id]
+                    for doc_id, score in scores.items()
+                    if doc_id in token_scores
+                }
+            if not scores:
+                return []
+
+        best = heapq.nlargest(limit, scores, key=scores.get)
+        return [state.docs[doc_id] for doc_id in best]
+
+    def _token_scores(self, state, token, prefix):
+        """ Returns the score of the pages matching a query token """
+        if not prefix:
+            return state.impacts.get(token, {})
+
+        terms = self._expand(state.vocabulary, token)
+        if len(terms) == 1:
+            return state.impacts[terms[0]]
+
+        scores = {}
+        for term in terms:
+            for doc_id, score in state.impacts[term].items():
+                if score > scores.get(doc_id, 0):
+                    scores[doc_id] = score
+        return scores
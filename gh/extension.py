@@ -1,8 +1,6 @@
 import logging
-import requests
-import gi
+import os
 import time
-from threading import Thread, Timer
 
 from ulauncher.api.client.Extension import Extension
 from ulauncher.api.shared.action.HideWindowAction import HideWindowAction
@@ -12,37 +10,57 @@ from ulauncher.api.shared.action.RenderResultListAction import \
     RenderResultListAction
 from ulauncher.api.shared.action.ExtensionCustomAction import \
     ExtensionCustomAction
+from ulauncher.api.shared.action.SetUserQueryAction import SetUserQueryAction
 from ulauncher.api.shared.event import (ItemEnterEvent, KeywordQueryEvent,
                                         PreferencesEvent,
                                         PreferencesUpdateEvent)
 from ulauncher.api.shared.item.ExtensionResultItem import ExtensionResultItem
 from ulauncher.api.shared.item.ExtensionSmallResultItem import ExtensionSmallResultItem
+from ulauncher.api.shared.Response import Response
 from ulauncher.config import CACHE_DIR
 
 from gh.listeners.query import KeywordQueryEventListener
 from gh.listeners.preferences import PreferencesEventListener, PreferencesUpdateEventListener
 from gh.listeners.custom import ItemEnterEventListener
-from gh.cache import Cache
-from gh.actions import REFRESH_DATA
-from gh.github_sync import GitHubDataSync
+from gh.accounts import ACCOUNT_PREFERENCES, Account, account_cache_dir, \
+    merge_results, parse_accounts
+from gh.actions import COPY_ITEM, DUMP_METRICS, OPEN_ITEM, REFRESH_DATA, \
+    SHOW_METRICS, SHOW_SYNC_STATUS
+from gh.sync_scheduler import SYNC_INTERVALS, SyncScheduler, request_all
+from gh.api import DEFAULT_API_URL, GitHubApiClient
+from gh.profile import UserProfile
+from gh.docs_index import DocsIndex
+from gh.notifications import NOTIFICATIONS_FILE, NotificationsInbox, \
+    NotificationsPoller
+from gh.live_cache import LiveCache, filter_rows
+from gh.records import Record
+from gh.metrics import METRICS_FILE, metrics, timed
+from gh.frecency import FRECENCY_CANDIDATES, FRECENCY_COLLECTIONS, \
+    rank_by_frecency
 from gh.constants import ISSUE_FILTER_CREATED, ISSUE_FILTER_ASSIGNED, \
-    PR_FILTER_CREATED, PR_FILTER_ASSIGNED, DOCS_BASE_URL
-from github.AuthenticatedUser import AuthenticatedUser
-from github import GithubException, Github
-
-from datetime import datetime, timedelta
-
-from gh.utils import remove_html
-
-gi.require_version('Notify', '0.7')
-
-from gi.repository import Notify  # noqa
+    PR_FILTER_CREATED, PR_FILTER_ASSIGNED, DOCS_BASE_URL, ISSUE_QUERIES
+from gh.utils import remove_html, format_date, format_duration, \
+    format_progress, repository_full_name
 
 logger = logging.getLogger(__name__)
 
-FETCH_INTERVAL = 86400
-GITHUB_NOTIFICATIONS_MINIMUM_DAYS = 15  # Only return new notications in the last X days
+DOCS_INDEX_FILE = 'github_docs_index.json'
+DOCS_INDEX_MAX_AGE = 7 * 86400
+ISSUES_REFRESH_INTERVAL = 300  # Minimum time between two refreshes of the issues
 MAX_LIST_ITEMS = 8
+MAX_METRICS_ITEMS = 20
+PROGRESS_NOTIFICATION_INTERVAL = 10  # Minimum seconds between two progress notifications
+
+SEARCH_USERS_QUERY = """
+query($query: String!, $first: Int!) {
+  search(query: $query, type: USER, first: $first) {
+    nodes {
+      ... on User { login name url }
+      ... on Organization { login name url }
+    }
+  }
+}
+"""
 
 
 class GitHubExtension(Extension):
@@ -58,51 +76,231 @@ class GitHubExtension(Extension):
         self.subscribe(ItemEnterEvent, ItemEnterEventListener())
 
         self.icon_path = 'images/icon.png'
-        self.github: Github = None
-        self.user: AuthenticatedUser = None
-        self.cache = Cache(CACHE_DIR)
-
-        Notify.init("Ulauncher GitHub")
-
-    def refresh_user(self):
-        """ Updates the current logged in user in the extension"""
-        self.user = self.github.get_user()
-
-    def refresh_data(self):
-        """ Spawns a new Thread and refresh the local cached data """
-        th = Thread(target=self.fetch_data_from_github)
-        th.daemon = True
-        th.start()
+        self.account_preferences = dict.fromkeys(ACCOUNT_PREFERENCES)
+        self.accounts = []
+        self.cache_backend = 'json'
+        self.sync_backend = 'rest'
+        self.live_cache = LiveCache()
+        # Number of API requests of the last fetch of every live keyword
+        self.fetch_requests = {}
+        self.docs_index = DocsIndex(os.path.join(CACHE_DIR, DOCS_INDEX_FILE))
+        self.docs_offline = False
+        self.docs_dump_file = None
+        self.notifications: NotificationsInbox = None
+        self.notifications_poller: NotificationsPoller = None
+        self.notify_new_notifications = False
+        self.docs_scheduler = SyncScheduler(
+            {'docs': lambda full: self.refresh_docs_index()}, SYNC_INTERVALS)
+        self.refreshing = False
+        self.progress_notified_at = 0
+        self.current_event: KeywordQueryEvent = None
+        self._notify = None
+
+    @property
+    def primary_account(self) -> Account:
+        """ The account of the access token, used by the live searches """
+        return self.accounts[0] if self.accounts else None
+
+    @property
+    def api(self) -> GitHubApiClient:
+        """ The API client of the account of the access token """
+        account = self.primary_account
+        return account.api if account is not None else None
+
+    @property
+    def user(self) -> UserProfile:
+        """ The user of the access token, None until it is known """
+        account = self.primary_account
+        return account.user if account is not None else None
+
+    @property
+    def web_url(self):
+        """ The web URL of the GitHub instance of the access token """
+        api = self.api
+        return api.web_url if api is not None else "https://github.com"
+
+    @property
+    def gists_url(self):
+        """ The URL of the gists of the user of the access token """
+        if self.web_url == "https://github.com":
+            return "https://gist.github.com/mine"
+        # GitHub Enterprise serves the gists on /gist
+        return self.web_url + "/gist/mine"
+
+    def configure_accounts(self):
+        """
+        Sets up the account of the access token, on github.com or on the
+        GitHub Enterprise instance of the API URL, and the extra accounts.
+        Accounts that didn't change are kept, with their syncs, the syncs of
+        the removed ones are stopped.
+        The stored profile of a new user is used until it is revalidated.
+        """
+        preferences = self.account_preferences
+        configured = [(None, preferences['access_token'] or "",
+                       (preferences['api_url'] or DEFAULT_API_URL).rstrip('/'))]
+        configured += parse_accounts(preferences['accounts'])
+
+        current = {account.key: account for account in self.accounts}
+        accounts = []
+        for name, token, api_url in configured:
+            if (api_url, token) in [account.key for account in accounts]:
+                continue
+            account = current.pop((api_url, token), None)
+            if account is None:
+                account = Account(name, token, api_url,
+                                  account_cache_dir(CACHE_DIR, api_url, token),
+                                  self.cache_backend, self.sync_backend,
+                                  self.on_sync_progress)
+            account.name = name
+            accounts.append(account)
+
+        for account in current.values():
+            account.stop()
+        self.accounts = accounts
+
+    def configure_cache(self, backend):
+        """ Switches the local caches to the given storage backend (json or sqlite) """
+        self.cache_backend = backend or 'json'
+        for account in self.accounts:
+            account.configure_cache(self.cache_backend)
+
+    def configure_sync_backend(self, backend):
+        """ Switches the syncs to the given API (rest or graphql) """
+        self.sync_backend = backend or 'rest'
+        for account in self.accounts:
+            account.sync_backend = self.sync_backend
+
+    def configure_docs_index(self, mode, dump_file=None):
+        """
+        Enables the offline docs index (mode "offline") or the live docs search.
+        A dump file, when given, is imported into the index by the next refresh.
+        """
+        self.docs_offline = mode == 'offline'
+        self.docs_dump_file = os.path.expanduser(dump_file) \
+            if dump_file else None
 
-    def fetch_data_from_github(self):
+    def refresh_docs_index(self):
         """
-        Fetch user repositories, gists and other data from GitHub.
-        This should re run in a separate thread.
+        Imports the dump file into the offline docs index when it changed,
+        or rebuilds the index when it is outdated.
         """
+        import requests
+        from gh.http_session import get_session
 
-        sync_service = GitHubDataSync(self.github, self.cache)
+        if not self.docs_offline:
+            return
 
-        try:
+        dump_file = self.docs_dump_file
+        if dump_file and os.path.exists(dump_file) and \
+                os.path.getmtime(dump_file) > self.docs_index.built_at:
+            try:
+                self.docs_index.import_dump(dump_file)
+                return
+            except (OSError, ValueError, KeyError) as e:
+                logger.error("Failed to import the docs dump %s: %s",
+                             dump_file, e)
 
-            self.show_notification("Indexing GitHub data")
+        if not self.docs_index.is_stale(DOCS_INDEX_MAX_AGE):
+            return
 
-            start_time = time.time()
+        try:
+            self.docs_index.build_from_page_list(get_session(), DOCS_BASE_URL)
+        except (requests.RequestException, ValueError) as e:
+            logger.error("Failed to build the docs index: %s", e)
 
-            sync_service.execute()
+    def start_notifications_poller(self):
+        """
+        (Re)starts polling the notifications of the account of the access
+        token, into the inbox stored with its cache
+        """
+        if self.notifications_poller is not None:
+            self.notifications_poller.stop()
+
+        path = os.path.join(self.primary_account.cache_dir, NOTIFICATIONS_FILE)
+        if self.notifications is None or self.notifications.path != path:
+            self.notifications = NotificationsInbox(path)
+        self.notifications_poller = NotificationsPoller(
+            self.api, self.notifications, self.on_new_notifications)
+        self.notifications_poller.start()
+
+    def on_new_notifications(self, notifications):
+        """ Shows a desktop notification for new GitHub notifications """
+        if not self.notify_new_notifications:
+            return
+
+        if len(notifications) == 1:
+            self.show_notification("New notification: {}".format(
+                notifications[0]['title']))
+        else:
+            self.show_notification("{} new notifications".format(
+                len(notifications)))
 
-            execution_time = time.time() - start_time
+    def refresh_user(self):
+        """ Revalidates the profiles of the users of every account in the background """
+        for account in self.accounts:
+            account.refresh_user()
 
+    def on_sync_progress(self, account, collection, pages, items,
+                         total_pages=None):
+        """
+        Notifies the progress of the syncs while a refresh requested by the
+        user runs, at most every PROGRESS_NOTIFICATION_INTERVAL seconds.
+        """
+        now = time.time()
+        if not self.refreshing or \
+                now - self.progress_notified_at < PROGRESS_NOTIFICATION_INTERVAL:
+            return
+
+        self.progress_notified_at = now
+        progress = []
+        for account in self.accounts:
+            for name, state in sorted(account.sync_progress.items()):
+                if len(self.accounts) > 1:
+                    name = "{}/{}".format(account.label, name)
+                progress.append("{} {}".format(name, format_progress(*state)))
+        self.show_notification("Indexing GitHub data: {}".format(
+            ", ".join(progress)))
+
+    def refresh_data(self, full=False):
+        """
+        Refreshes the local cached data of every account in the background.
+        Refreshes requested while a sync is running don't start another one.
+        Args:
+          full (bool): Refetch everything instead of only the changes
+        """
+        # The first synced page notifies the start of the refresh, from a sync
+        # thread, so the launcher never waits for libnotify to load
+        self.refreshing = True
+        self.progress_notified_at = 0
+        schedulers = [(account.label, account.sync_scheduler)
+                      for account in self.accounts]
+        schedulers.append(('docs', self.docs_scheduler))
+        request_all(schedulers, self.on_data_refreshed, full=full)
+        for _, scheduler in schedulers:
+            scheduler.start()
+
+    def on_data_refreshed(self, errors, elapsed):
+        """ Notifies the end of a refresh requested by the user """
+        self.refreshing = False
+        if errors:
+            name, error = next(iter(errors.items()))
             self.show_notification(
-                "GitHub data indexed with success in {} seconds".format(
-                    int(execution_time)))
-        except Exception as e:
-            self.show_notification(
-                "An error occurred when indexing data from GitHub: {}".format(
-                    e))
+                "An error occurred when indexing data from GitHub ({}): {}".format(
+                    name, error))
+            return
 
-        timer = Timer(FETCH_INTERVAL, self.fetch_data_from_github)
-        timer.daemon = True
-        timer.start()
+        self.show_notification(
+            "GitHub data indexed with success in {} seconds".format(
+                int(elapsed)))
+
+    def refresh_issues(self):
+        """
+        Refreshes the issues and pull requests of every account in the
+        background, unless they were refreshed recently.
+        """
+        for account in self.accounts:
+            account.sync_scheduler.request(['issues'],
+                                           max_age=ISSUES_REFRESH_INTERVAL)
 
     def show_message_no_results(self, search_query):
         return RenderResultListAction([
@@ -120,9 +318,17 @@ class GitHubExtension(Extension):
         Args:
           text (str): The text to display on the notification
         """
-        Notify.Notification.new("Ulauncher GitHub", text).show()
+        if self._notify is None:
+            import gi
+            gi.require_version('Notify', '0.7')
+            from gi.repository import Notify
+
+            Notify.init("Ulauncher GitHub")
+            self._notify = Notify
 
-    def handle_github_exception(self, e: GithubException):
+        self._notify.Notification.new("Ulauncher GitHub", text).show()
+
+    def handle_github_exception(self, e: Exception):
         logger.error(e)
         return RenderResultListAction([
             ExtensionResultItem(
@@ -135,27 +341,93 @@ class GitHubExtension(Extension):
 
     def user_account(self):
         """ Show Information and quick shortcuts to user account actions"""
-        return RenderResultListAction([
-            ExtensionSmallResultItem(icon=self.icon_path,
-                                     name="Logged in as %s (%s)" %
-                                     (self.user.name, self.user.login),
-                                     highlightable=False,
-                                     on_enter=OpenUrlAction(
-                                         self.user.html_url)),
+        items = []
+        for account in self.accounts:
+            if account.user is not None:
+                name = "Logged in as %s (%s)" % (account.user.name,
+                                                 account.user.login)
+                if len(self.accounts) > 1:
+                    name += " on %s" % account.api.web_url
+                items.append(
+                    ExtensionSmallResultItem(
+                        icon=self.icon_path,
+                        name=name,
+                        highlightable=False,
+                        on_enter=OpenUrlAction(account.user.html_url)))
+            else:
+                items.append(
+                    ExtensionSmallResultItem(
+                        icon=self.icon_path,
+                        name="Loading your GitHub account...",
+                        highlightable=False,
+                        on_enter=HideWindowAction()))
+
+        return RenderResultListAction(items + [
             ExtensionSmallResultItem(
                 icon=self.icon_path,
                 name="Developer Settings",
-                on_enter=OpenUrlAction("https://github.com/settings/apps")),
+                on_enter=OpenUrlAction("{}/settings/apps".format(
+                    self.web_url))),
             ExtensionSmallResultItem(
                 icon=self.icon_path,
                 name="Billing Plans",
-                on_enter=OpenUrlAction("https://github.com/settings/billing"))
+                on_enter=OpenUrlAction("{}/settings/billing".format(
+                    self.web_url)))
         ])
 
+    def push_results(self, event, action):
+        """ Sends a new result list for an event that was already answered """
+        self._client.send(Response(event, action))
+
+    def live_results(self, keyword, query, fetch, render):
+        """
+        Renders a live keyword from the live cache.
+        Rows fetched in the background are rendered and sent for the event
+        being handled, unless the user typed a newer query meanwhile.
+        The requests made by every fetch are counted in `fetch_requests`.
+        """
+        event = self.current_event
+
+        def counted_fetch():
+            with self.api.count_requests() as counter, self.api.interactive():
+                try:
+                    return fetch()
+                finally:
+                    self.fetch_requests[keyword] = counter.count
+                    logger.debug("%s results fetched with %d requests",
+                                 keyword, counter.count)
+
+        rows = self.live_cache.get(
+            keyword, query, counted_fetch,
+            lambda rows: self.push_results(event, render(rows)),
+            lambda e: self.push_results(event, self.handle_github_exception(e)))
+
+        if rows is None:
+            return RenderResultListAction([
+                ExtensionResultItem(icon=self.icon_path,
+                                    name='Searching on GitHub...',
+                                    highlightable=False,
+                                    on_enter=HideWindowAction())
+            ])
+
+        return render(rows)
+
+    def render_rows(self, rows):
+        """ Builds the result items of rows from the live cache """
+        return [
+            ExtensionResultItem(icon=self.icon_path,
+                                name=row['name'],
+                                description=row['description'],
+                                on_enter=OpenUrlAction(row['url']),
+                                on_alt_enter=CopyToClipboardAction(
+                                    row['url'])) for row in rows
+        ]
+
     def search_public_repos(self, query):
         """ Search public repos """
 
         if not query or len(query) < 3:
+            self.live_cache.scheduler.supersede("public_repos")
             return RenderResultListAction([
                 ExtensionResultItem(
                     icon=self.icon_path,
@@ -165,29 +437,29 @@ class GitHubExtension(Extension):
                     on_enter=HideWindowAction())
             ])
 
-        try:
-            repos = self.github.search_repositories(
-                query=query)[:MAX_LIST_ITEMS]
-        except GithubException as e:
-            return self.handle_github_exception(e)
+        def fetch():
+            repos = self.api.get("/search/repositories", {
+                'q': query,
+                'per_page': MAX_LIST_ITEMS
+            })['items']
+            return [{
+                'name': "%s (%s stars)" % (repo['name'],
+                                           repo['stargazers_count']),
+                'description': repo['description'] or "",
+                'url': repo['html_url'],
+                'key': repo['full_name'].lower()
+            } for repo in repos]
 
-        items = []
+        def render(rows):
+            return RenderResultListAction(self.render_rows(rows))
 
-        for repo in repos:
-            items.append(
-                ExtensionResultItem(
-                    icon=self.icon_path,
-                    name="%s (%s stars)" % (repo.name, repo.stargazers_count),
-                    description=repo.description or "",
-                    on_enter=OpenUrlAction(repo.html_url),
-                    on_alt_enter=CopyToClipboardAction(repo.html_url)))
-
-        return RenderResultListAction(items)
+        return self.live_results("public_repos", query, fetch, render)
 
     def search_users(self, query):
         """ Search GitHub users """
 
         if not query or len(query) < 3:
+            self.live_cache.scheduler.supersede("users")
             return RenderResultListAction([
                 ExtensionResultItem(
                     icon=self.icon_path,
@@ -197,276 +469,417 @@ class GitHubExtension(Extension):
                     on_enter=HideWindowAction())
             ])
 
-        try:
-            users = self.github.search_users(query=query,
-                                             sort="followers",
-                                             order="desc")[:MAX_LIST_ITEMS]
-        except GithubException as e:
-            logger.error(e)
-            return RenderResultListAction([
-                ExtensionResultItem(
-                    icon=self.icon_path,
-                    name='An error ocurred when connecting to GitHub',
-                    description=str(e),
-                    highlightable=False,
-                    on_enter=HideWindowAction())
-            ])
+        def fetch():
+            # The REST search doesn't return the user names, so GraphQL is
+            # used to avoid fetching every user.
+            users = self.api.graphql(
+                SEARCH_USERS_QUERY, {
+                    'query': "{} sort:followers-desc".format(query),
+                    'first': MAX_LIST_ITEMS
+                })['search']['nodes']
+            return [{
+                'name': user['name'] or user['login'],
+                'description': "",
+                'url': user['url'],
+                'key': "{} {}".format(user['login'], user['name'] or "").lower()
+            } for user in users if user]
+
+        def render(rows):
+            return RenderResultListAction(self.render_rows(rows))
+
+        return self.live_results("users", query, fetch, render)
+
+    def search_cache(self, collection, query, *args):
+        """
+        Searches a collection in the cache of every account, timing the read
+        of the collection and the search separately. The results of several
+        accounts are ranked together, and with the frecency of the items
+        opened before, for the collections that learn it.
+        """
+        learns = collection in FRECENCY_COLLECTIONS
+        limit = MAX_LIST_ITEMS * FRECENCY_CANDIDATES if learns \
+            else MAX_LIST_ITEMS
+
+        results = []
+        for account in self.accounts:
+            with timed("cache.read.{}".format(collection)):
+                index = getattr(account.cache, 'get_' + collection)(*args)
+
+            with timed("search.{}".format(collection)):
+                items = index.search(query, limit)
+
+            if learns and not query.strip():
+                with timed("frecency.{}".format(collection)):
+                    items = account.frecency.with_opened(
+                        collection, items, index, MAX_LIST_ITEMS)
+            results.append((account, items))
+
+        if len(results) == 1:
+            items = results[0][1]
+        else:
+            with timed("merge.{}".format(collection)):
+                items = merge_results(collection, query, results,
+                                      sum(len(items) for _, items in results))
+
+        if not learns:
+            return items
+
+        with timed("frecency.{}".format(collection)):
+            return rank_by_frecency(
+                query, items,
+                lambda item: self.account_of(item).frecency.score(item['url']),
+                MAX_LIST_ITEMS)
+
+    def account_of(self, item):
+        """ Returns the account a result comes from """
+        account_id = item.get('account_id')
+        for account in self.accounts:
+            if account.id == account_id:
+                return account
+        return self.primary_account
+
+    def open_action(self, collection, item):
+        """ Opens the URL of an item, remembering it was opened """
+        return ExtensionCustomAction({
+            'action': OPEN_ITEM,
+            'collection': collection,
+            'item': item.to_dict() if isinstance(item, Record) else dict(item)
+        })
 
-        items = []
+    def copy_action(self, collection, item):
+        """ Copies the URL of an item, remembering it was selected """
+        return ExtensionCustomAction({
+            'action': COPY_ITEM,
+            'collection': collection,
+            'item': item.to_dict() if isinstance(item, Record) else dict(item)
+        })
 
-        for user in users:
-            name = ""
-            if user.name:
-                name = user.name
-            else:
-                name = user.login
+    def select_item(self, data):
+        """ Records the selection of an item, then opens or copies its URL """
+        url = data['item']['url']
+        try:
+            self.account_of(data['item']).frecency.record(
+                data['collection'], data['item'])
+        except Exception as e:
+            logger.error("Failed to record the selection of %s: %s", url, e)
 
-            items.append(
-                ExtensionResultItem(icon=self.icon_path,
-                                    name=name,
-                                    on_enter=OpenUrlAction(user.html_url),
-                                    on_alt_enter=CopyToClipboardAction(
-                                        user.html_url)))
+        if data['action'] == COPY_ITEM:
+            return CopyToClipboardAction(url)
+        return OpenUrlAction(url)
 
-        return RenderResultListAction(items)
+    def describe(self, item, description):
+        """ Prefixes the description of an item with the account it comes from """
+        account = item.get('account')
+        if account is None:
+            return description
+        return "[{}] {}".format(account, description)
 
     def user_repos(self, query):
         """ List the repos owned by the user """
 
         items = []
 
-        repos = self.cache.get_repos()
-
-        for repo in repos[:MAX_LIST_ITEMS]:
-
-            if query and query.lower() not in repo['fullname'].lower():
-                continue
+        repos = self.search_cache('repos', query)
 
+        with timed("render.repos"):
+            for repo in repos:
+                items.append(
+                    ExtensionResultItem(icon=self.icon_path,
+                                        name=repo['fullname'],
+                                        description=self.describe(
+                                            repo, repo['description'] or ""),
+                                        highlightable=not query,
+                                        on_enter=self.open_action(
+                                            'repos', repo),
+                                        on_alt_enter=self.copy_action(
+                                            'repos', repo)))
+
+        # The user is loaded in the background and may not be known yet
+        if self.user is not None:
             items.append(
-                ExtensionResultItem(icon=self.icon_path,
-                                    name=repo['fullname'],
-                                    description=repo['description'] or "",
-                                    highlightable=not query,
-                                    on_enter=OpenUrlAction(repo['url']),
-                                    on_alt_enter=CopyToClipboardAction(
-                                        repo['url'])))
-
-        items.append(
-            ExtensionSmallResultItem(
-                icon='images/icon_open.png',
-                name='Open on GitHub',
-                on_enter=OpenUrlAction(
-                    "https://github.com/{}?tab=repositories".format(
-                        self.user.login))))
+                ExtensionSmallResultItem(
+                    icon='images/icon_open.png',
+                    name='Open on GitHub',
+                    on_enter=OpenUrlAction(
+                        "{}/{}?tab=repositories".format(
+                            self.web_url, self.user.login))))
         return RenderResultListAction(items)
 
     def user_gists(self, query):
         """ List user gists"""
 
-        query = query.lower()
-        gists = self.cache.get_gists()
+        gists = self.search_cache('gists', query)
 
         items = []
-        for gist in gists[:MAX_LIST_ITEMS]:
-
-            desc = gist['description'] or ""
-
-            if query and (query not in desc.lower()
-                          and query not in gist['filename'].lower()):
-                continue
-
-            items.append(
-                ExtensionResultItem(icon=self.icon_path,
-                                    name=gist['filename'],
-                                    description=desc,
-                                    highlightable=not query,
-                                    on_enter=OpenUrlAction(gist['url']),
-                                    on_alt_enter=CopyToClipboardAction(
-                                        gist['url'])))
+        with timed("render.gists"):
+            for gist in gists:
+                items.append(
+                    ExtensionResultItem(icon=self.icon_path,
+                                        name=gist['filename'],
+                                        description=self.describe(
+                                            gist, gist['description'] or ""),
+                                        highlightable=not query,
+                                        on_enter=self.open_action(
+                                            'gists', gist),
+                                        on_alt_enter=self.copy_action(
+                                            'gists', gist)))
 
-            items.append(
-                ExtensionSmallResultItem(
-                    icon='images/icon_open.png',
-                    name='Open on GitHub',
-                    on_enter=OpenUrlAction("https://gist.github.com/mine")))
+        items.append(
+            ExtensionSmallResultItem(
+                icon='images/icon_open.png',
+                name='Open on GitHub',
+                on_enter=OpenUrlAction(self.gists_url)))
 
         return RenderResultListAction(items)
 
     def user_orgs(self, query):
-        """ List the Organizations the user belongs to"""
+        """
+        List the Organizations the user belongs to.
+        A query like `org/query` lists the repos of an organization instead.
+        """
+        if '/' in query:
+            org, repo_query = query.split('/', 1)
+            return self.org_repos(org.strip(), repo_query)
 
-        try:
-            orgs = self.github.get_user().get_orgs()
-        except GithubException as e:
-            return self.handle_github_exception(e)
+        keyword = self.current_event.get_keyword()
+        orgs = self.search_cache('orgs', query)
+        if not orgs:
+            return self.show_message_no_results(query)
 
         items = []
-        for org in orgs[:8]:
-
-            if query and query.lower() not in org.name.lower():
-                continue
+        with timed("render.orgs"):
+            for org in orgs:
+                items.append(
+                    ExtensionResultItem(
+                        icon=self.icon_path,
+                        name=org['name'],
+                        description=self.describe(
+                            org, org['description'] or org['login']),
+                        highlightable=not query,
+                        on_enter=self.open_action('orgs', org),
+                        on_alt_enter=SetUserQueryAction("{} {}/".format(
+                            keyword, org['login']))))
 
-            items.append(
-                ExtensionResultItem(icon=self.icon_path,
-                                    name=org.name,
-                                    highlightable=not query,
-                                    on_enter=OpenUrlAction(org.html_url),
-                                    on_alt_enter=CopyToClipboardAction(
-                                        org.html_url)))
+        return RenderResultListAction(items)
 
-        return RenderResultListAction(items[:MAX_LIST_ITEMS])
+    def org_repos(self, org, query):
+        """ List the repos of an organization the user belongs to """
 
-    def user_starred_repos(self, query):
-        """ List the repositories the user has starred"""
+        repos = self.search_cache('org_repos', query, org)
 
         items = []
-        repos = self.cache.get_starred_repos()
-        for repo in repos[:MAX_LIST_ITEMS]:
+        with timed("render.org_repos"):
+            for repo in repos:
+                items.append(
+                    ExtensionResultItem(icon=self.icon_path,
+                                        name=repo['fullname'],
+                                        description=self.describe(
+                                            repo, repo['description'] or ""),
+                                        highlightable=not query,
+                                        on_enter=OpenUrlAction(repo['url']),
+                                        on_alt_enter=CopyToClipboardAction(
+                                            repo['url'])))
 
-            if query and query.lower() not in repo['name'].lower():
-                continue
+        items.append(
+            ExtensionSmallResultItem(
+                icon='images/icon_open.png',
+                name='Open on GitHub',
+                on_enter=OpenUrlAction(
+                    "{}/orgs/{}/repositories".format(self.web_url, org))))
+        return RenderResultListAction(items)
 
-            items.append(
-                ExtensionResultItem(icon=self.icon_path,
-                                    name=repo['name'],
-                                    description=repo['description'],
-                                    on_enter=OpenUrlAction(repo['url']),
-                                    on_alt_enter=CopyToClipboardAction(
-                                        repo['url'])))
+    def user_starred_repos(self, query):
+        """ List the repositories the user has starred"""
 
+        items = []
+        repos = self.search_cache('starred_repos', query)
+        with timed("render.starred_repos"):
+            for repo in repos:
+                items.append(
+                    ExtensionResultItem(icon=self.icon_path,
+                                        name=repo['name'],
+                                        description=self.describe(
+                                            repo, repo['description'] or ""),
+                                        highlightable=not query,
+                                        on_enter=self.open_action(
+                                            'starred_repos', repo),
+                                        on_alt_enter=self.copy_action(
+                                            'starred_repos', repo)))
+
+        if self.user is not None:
             items.append(
                 ExtensionSmallResultItem(
                     icon='images/icon_open.png',
                     name='Open on GitHub',
                     on_enter=OpenUrlAction(
-                        "https://github.com/{}?tab=stars".format(
-                            self.user.login))))
+                        "{}/{}?tab=stars".format(
+                            self.web_url, self.user.login))))
 
         return RenderResultListAction(items)
 
-    def user_issues(self, query, filter=ISSUE_FILTER_ASSIGNED):
-        """ List the issues associated to the user"""
-        try:
-
-            if filter == ISSUE_FILTER_ASSIGNED:
-                search_query = "{} in:title type:issue is:open assignee:@me".format(
-                    query)
-                github_url = "https://github.com/issues"
-            elif filter == ISSUE_FILTER_CREATED:
-                search_query = "{} in:title type:issue is:open author:@me".format(
-                    query)
-                github_url = "https://github.com/issues/assigned"
-
-            issues = self.github.search_issues(search_query, sort="updated")
-            items = []
+    def search_issues(self, search_query):
+        """
+        Searches issues and pull requests, most recently updated first.
+        Everything needed to render them is part of the search response.
+        """
+        return self.api.get("/search/issues", {
+            'q': search_query,
+            'sort': 'updated',
+            'per_page': MAX_LIST_ITEMS
+        })['items']
 
-            if issues.totalCount == 0:
+    def issue_results(self, query, filter, github_url):
+        """
+        Lists the issues or pull requests of a filter from the local mirror.
+        The GitHub search is only used when nothing matches locally.
+        """
+        self.refresh_issues()
+
+        issues = self.search_cache('issues', query, filter)
+        if issues:
+            return self.render_issues(issues, query, github_url)
+
+        search_query = "{} in:title is:open {}".format(
+            query, ISSUE_QUERIES[filter])
+
+        def fetch():
+            issues = self.search_issues(search_query)
+            return [{
+                'name': issue['title'],
+                'description': "Last Updated: {}\nRepository: {}#{}".format(
+                    format_date(issue['updated_at']),
+                    repository_full_name(issue['repository_url']),
+                    issue['number']),
+                'url': issue['html_url'],
+                'key': issue['title'].lower()
+            } for issue in issues]
+
+        def render(rows):
+            if not rows:
                 return self.show_message_no_results(query)
 
-            for issue in issues[:MAX_LIST_ITEMS]:
-                items.append(
-                    ExtensionResultItem(
-                        icon=self.icon_path,
-                        name=issue.title,
-                        description="Last Updated: {}\nRepository: {}\n".
-                        format(issue.updated_at, issue.repository.name),
-                        on_enter=OpenUrlAction(issue.html_url)))
-
+            items = self.render_rows(rows)
             items.append(
                 ExtensionSmallResultItem(icon='images/icon_open.png',
                                          name='Open on GitHub',
                                          on_enter=OpenUrlAction(github_url)))
 
             return RenderResultListAction(items)
-        except GithubException as e:
-            return self.handle_github_exception(e)
 
-    def user_pull_requests(self, query, filter=PR_FILTER_ASSIGNED):
-        """ Lists Open Pull Requests that are assigned or created by the user"""
-        try:
+        return self.live_results(filter, query, fetch, render)
 
-            if filter == PR_FILTER_ASSIGNED:
-                search_query = "{} in:title type:pr is:open assignee:@me".format(
-                    query)
-                github_url = "https://github.com/pulls/assigned"
-            elif filter == PR_FILTER_CREATED:
-                search_query = "{} in:title type:pr is:open author:@me".format(
-                    query)
-                github_url = "https://github.com/pulls"
-
-            prs = self.github.search_issues(search_query, sort="updated")
-            items = []
+    def render_issues(self, issues, query, github_url):
+        """ Builds the result list of issues from the local mirror """
+        items = []
+        with timed("render.issues"):
+            for issue in issues:
+                description = "Last Updated: {}\nRepository: {}#{}".format(
+                    format_date(issue['updated_at']), issue['repository'],
+                    issue['number'])
+                if issue['labels']:
+                    description += "\nLabels: {}".format(issue['labels'])
 
-            if prs.totalCount == 0:
-                return self.show_message_no_results(query)
-            for pr in prs[:MAX_LIST_ITEMS]:
                 items.append(
-                    ExtensionResultItem(
-                        icon=self.icon_path,
-                        name=pr.title,
-                        description="Last Updated: {}\nRepository: {}".format(
-                            pr.updated_at, pr.repository.name),
-                        on_enter=OpenUrlAction(pr.html_url)))
+                    ExtensionResultItem(icon=self.icon_path,
+                                        name=issue['title'],
+                                        description=self.describe(
+                                            issue, description),
+                                        highlightable=not query,
+                                        on_enter=OpenUrlAction(issue['url']),
+                                        on_alt_enter=CopyToClipboardAction(
+                                            issue['url'])))
 
-            items.append(
-                ExtensionSmallResultItem(icon='images/icon_open.png',
-                                         name='Open on GitHub',
-                                         on_enter=OpenUrlAction(github_url)))
+        items.append(
+            ExtensionSmallResultItem(icon='images/icon_open.png',
+                                     name='Open on GitHub',
+                                     on_enter=OpenUrlAction(github_url)))
+        return RenderResultListAction(items)
 
-            return RenderResultListAction(items)
-        except GithubException as e:
-            return self.handle_github_exception(e)
+    def user_issues(self, query, filter=ISSUE_FILTER_ASSIGNED):
+        """ List the issues associated to the user"""
 
-    def user_notifications(self, query):
-        """ List the user notifications"""
-        try:
+        if filter == ISSUE_FILTER_ASSIGNED:
+            github_url = self.web_url + "/issues/assigned"
+        elif filter == ISSUE_FILTER_CREATED:
+            github_url = self.web_url + "/issues"
 
-            start_date = datetime.now() - timedelta(
-                GITHUB_NOTIFICATIONS_MINIMUM_DAYS)
-            notifications = self.user.get_notifications(participating=True,
-                                                        since=start_date)
-            items = []
+        return self.issue_results(query, filter, github_url)
 
-            if not notifications:
-                return self.show_message_not_results(query)
+    def user_pull_requests(self, query, filter=PR_FILTER_ASSIGNED):
+        """ Lists Open Pull Requests that are assigned or created by the user"""
 
-            for notification in notifications[:MAX_LIST_ITEMS]:
-                notification_url = notification.subject.url.replace(
-                    "https://api.github.com/repos", "https://github.com")
+        if filter == PR_FILTER_ASSIGNED:
+            github_url = self.web_url + "/pulls/assigned"
+        elif filter == PR_FILTER_CREATED:
+            github_url = self.web_url + "/pulls"
+
+        return self.issue_results(query, filter, github_url)
 
-                type = notification.subject.type
-                if type == "PullRequest":
-                    notification_url = notification_url.replace(
-                        "pulls", "pull")
+    def user_notifications(self, query):
+        """
+        List the user notifications.
+        They are rendered from the inbox kept up to date by the poller. Until
+        its first poll ends, in the background, the inbox is empty.
+        """
+        if not self.notifications.polled:
+            return RenderResultListAction([
+                ExtensionResultItem(
+                    icon=self.icon_path,
+                    name='Fetching your notifications from GitHub',
+                    description='They will be listed in a moment',
+                    highlightable=False,
+                    on_enter=OpenUrlAction(self.web_url + "/notifications"))
+            ])
+
+        notifications = filter_rows(self.notifications.rows(), query)
+        if not notifications:
+            return self.show_message_no_results(query)
+
+        items = []
+        with timed("render.notifications"):
+            for notification in notifications[:MAX_LIST_ITEMS]:
                 items.append(
                     ExtensionResultItem(
                         icon=self.icon_path,
-                        name=notification.subject.title,
-                        description="Date: {}\nType: {}\nRepository: {}".
-                        format(notification.updated_at,
-                               notification.subject.type,
-                               notification.repository.full_name),
-                        on_enter=OpenUrlAction(notification_url)))
+                        name=notification['title'],
+                        description="Date: {}\nType: {}\nRepository: {}".format(
+                            format_date(notification['updated_at']),
+                            notification['type'], notification['repository']),
+                        on_enter=OpenUrlAction(notification['url'])))
 
-            items.append(
-                ExtensionSmallResultItem(
-                    icon='images/icon_open.png',
-                    name='Open on GitHub',
-                    on_enter=OpenUrlAction(
-                        "https://github.com/notifications")))
-            return RenderResultListAction(items)
-        except GithubException as e:
-            return self.handdle_github_exception(e)
+        items.append(
+            ExtensionSmallResultItem(
+                icon='images/icon_open.png',
+                name='Open on GitHub',
+                on_enter=OpenUrlAction(self.web_url + "/notifications")))
+        return RenderResultListAction(items)
 
     def search_documentation(self, query):
-        """ Search dcoumentation """
+        """
+        Search documentation.
+        With the offline index enabled, the live search only runs when the
+        index has no match, and its results are added to the index.
+        """
+        if self.docs_offline:
+            with timed("search.docs"):
+                docs = self.docs_index.search(query, MAX_LIST_ITEMS)
+            if docs:
+                return self.render_docs(docs)
+
+        import requests
+        from gh.http_session import get_interactive_session
+
         search_url = "{}/search".format(DOCS_BASE_URL)
 
-        r = requests.get(search_url, {
-            'language': 'en',
-            'version': 'dotcom',
-            'query': query
-        })
+        try:
+            r = get_interactive_session().get(search_url,
+                                              params={
+                                                  'language': 'en',
+                                                  'version': 'dotcom',
+                                                  'query': query
+                                              })
+        except requests.RequestException as e:
+            return self.handle_github_exception(e)
 
         if r.status_code != 200:
             return RenderResultListAction([
@@ -485,16 +898,28 @@ class GitHubExtension(Extension):
         if len(data) == 0:
             return self.show_message_no_results(query)
 
-        items = []
-        for result in data[:MAX_LIST_ITEMS]:
-            items.append(
+        docs = [{
+            'title': remove_html(result["title"]),
+            'breadcrumbs': remove_html(result["breadcrumbs"]),
+            'url': result["url"]
+        } for result in data]
+
+        if self.docs_offline:
+            self.docs_index.add(docs)
+
+        return self.render_docs(docs[:MAX_LIST_ITEMS])
+
+    def render_docs(self, docs):
+        """ Builds the result items of documentation pages """
+        with timed("render.docs"):
+            items = [
                 ExtensionResultItem(icon=self.icon_path,
-                                    name=remove_html(result["title"]),
-                                    description=remove_html(
-                                        result["breadcrumbs"]),
+                                    name=doc['title'],
+                                    description=doc['breadcrumbs'],
                                     on_enter=OpenUrlAction("{}{}".format(
-                                        DOCS_BASE_URL, result["url"]))))
-
+                                        DOCS_BASE_URL, doc['url'])))
+                for doc in docs
+            ]
         return RenderResultListAction(items)
 
     def show_options(self):
@@ -504,5 +929,122 @@ class GitHubExtension(Extension):
                                      name="Refresh Extension Cache",
                                      highlightable=False,
                                      on_enter=ExtensionCustomAction(
-                                         {"action": REFRESH_DATA}))
+                                         {"action": REFRESH_DATA})),
+            ExtensionSmallResultItem(icon=self.icon_path,
+                                     name="Show Sync Status",
+                                     highlightable=False,
+                                     on_enter=ExtensionCustomAction(
+                                         {"action": SHOW_SYNC_STATUS},
+                                         keep_app_open=True)),
+            ExtensionSmallResultItem(icon=self.icon_path,
+                                     name="Show Performance Metrics",
+                                     highlightable=False,
+                                     on_enter=ExtensionCustomAction(
+                                         {"action": SHOW_METRICS},
+                                         keep_app_open=True)),
+            ExtensionSmallResultItem(icon=self.icon_path,
+                                     name="Dump Performance Metrics",
+                                     highlightable=False,
+                                     on_enter=ExtensionCustomAction(
+                                         {"action": DUMP_METRICS}))
         ])
+
+    def show_sync_status(self):
+        """ Lists the status of the sync of every collection of every account """
+        now = time.time()
+        jobs = []
+        for account in self.accounts:
+            for job in account.sync_scheduler.status()['jobs']:
+                progress = account.sync_progress.get(job['name'])
+                if len(self.accounts) > 1:
+                    job['name'] = "{}/{}".format(account.label, job['name'])
+                jobs.append((job, progress))
+        jobs += [(job, None) for job in self.docs_scheduler.status()['jobs']]
+
+        items = []
+        for job, progress in jobs:
+            if job['running']:
+                name = "{}: syncing for {}".format(
+                    job['name'], format_duration(now - job['started_at']))
+                if progress:
+                    name += ", " + format_progress(*progress)
+            elif job['last_success_at']:
+                name = "{}: synced {} ago".format(
+                    job['name'],
+                    format_duration(now - job['last_success_at']))
+            else:
+                name = "{}: never synced".format(job['name'])
+
+            description = []
+            if job['failures']:
+                description.append("Failed {} times: {}".format(
+                    job['failures'], job['last_error']))
+            if job['next_run'] is not None:
+                description.append("Next sync in {}".format(
+                    format_duration(job['next_run'] - now)))
+
+            items.append(
+                ExtensionResultItem(icon=self.icon_path,
+                                    name=name,
+                                    description="\n".join(description),
+                                    highlightable=False,
+                                    on_enter=HideWindowAction()))
+        return RenderResultListAction(items)
+
+    def show_metrics(self):
+        """ Lists the timings of the slowest stages, then the latency of every host """
+        from gh.http_session import latency_stats
+
+        summary = metrics.summary()
+        hosts = latency_stats()
+        if not summary and not hosts:
+            return RenderResultListAction([
+                ExtensionResultItem(icon=self.icon_path,
+                                    name="No metrics recorded yet",
+                                    highlightable=False,
+                                    on_enter=HideWindowAction())
+            ])
+
+        items = []
+        for stage, stats in list(summary.items())[:MAX_METRICS_ITEMS]:
+            description = ("p50 {p50_ms:.1f} ms, p90 {p90_ms:.1f} ms, "
+                           "p99 {p99_ms:.1f} ms, max {max_ms:.1f} ms "
+                           "({count} runs)").format(**stats)
+            items.append(
+                ExtensionResultItem(icon=self.icon_path,
+                                    name=stage,
+                                    description=description,
+                                    highlightable=False,
+                                    on_enter=CopyToClipboardAction(
+                                        "{}: {}".format(stage, description))))
+
+        for host, stats in sorted(hosts.items()):
+            name = "http {}".format(host)
+            description = ("avg {avg_ms:.1f} ms, max {max_ms:.1f} ms, "
+                           "last {last_ms:.1f} ms "
+                           "({count} responses)").format(**stats)
+            items.append(
+                ExtensionResultItem(icon=self.icon_path,
+                                    name=name,
+                                    description=description,
+                                    highlightable=False,
+                                    on_enter=CopyToClipboardAction(
+                                        "{}: {}".format(name, description))))
+        return RenderResultListAction(items)
+
+    def dump_metrics(self):
+        """
+        Saves the timings of every stage and the latency of every host to a
+        file in the cache dir
+        """
+        from gh.http_session import latency_stats
+
+        path = os.path.join(CACHE_DIR, METRICS_FILE)
+        try:
+            metrics.dump(path, hosts=latency_stats())
+        except OSError as e:
+            logger.error("Failed to dump the metrics: %s", e)
+            self.show_notification("Failed to save the metrics: {}".format(e))
+            return
+
+        self.show_notification("Metrics saved to {}".format(path))
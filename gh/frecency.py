@@ -0,0 +1,251 @@
+"""
+Learns which repos, stars, gists and organizations of an account are opened
+from the results, and ranks them higher.
+
+Every opening adds 1 to the frecency score of an item, and scores halve every
+FRECENCY_HALF_LIFE seconds, so items opened often and recently rank first.
+Openings are appended to a JSON lines log, compacted into a single line per
+item once it grows too long.
+"""
+import json
+import logging
+import threading
+import time
+
+from gh.cache import KEY_FIELDS
+from gh.records import Record
+from gh.utils import write_json_lines_atomic
+
+logger = logging.getLogger(__name__)
+
+FRECENCY_FILE = 'github_frecency.jsonl'
+FRECENCY_COLLECTIONS = ('repos', 'starred_repos', 'gists', 'orgs')
+FRECENCY_HALF_LIFE = 7 * 86400
+
+# Search results fetched per displayed result, so frequently opened items
+# ranked further down can move up
+FRECENCY_CANDIDATES = 4
+
+# The boost of an item is FRECENCY_WEIGHT * score / (score + FRECENCY_SATURATION),
+# so it never outweighs the whole search ranking
+FRECENCY_WEIGHT = 1.0
+FRECENCY_SATURATION = 2.0
+
+# The log is compacted once it has COMPACT_FACTOR lines per item
+COMPACT_FACTOR = 4
+COMPACT_MIN_LINES = 200
+
+# Items whose score decayed below MIN_SCORE are forgotten on compaction
+MIN_SCORE = 0.05
+MAX_ENTRIES = 500
+
+
+class FrecencyEntry(object):
+    """ The decayed score of an item, as of its last opening """
+
+    __slots__ = ('collection', 'item', 'score', 'at')
+
+    def __init__(self, collection, item, score, at):
+        self.collection = collection
+        self.item = item
+        self.score = score
+        self.at = at
+
+    def to_dict(self):
+        return {
+            'collection': self.collection,
+            'item': self.item,
+            'score': self.score,
+            'at': self.at
+        }
+
+
+class FrecencyStore(object):
+    """ The frecency scores of the opened items, by URL """
+
+    def __init__(self, path, half_life=FRECENCY_HALF_LIFE):
+        """
+        Args:
+          path (str): The path of the JSON lines log
+          half_life (int): Seconds after which a score is halved
+        """
+        self.path = path
+        self.half_life = half_life
+        self._entries = None
+        self._lines = 0
+        self._truncated = False  # The last line was cut by a crash
+        self._lock = threading.Lock()
+
+    def _decayed(self, entry, now):
+        return entry.score * 0.5**(max(now - entry.at, 0) / self.half_life)
+
+    def _apply(self, line):
+        """ Adds a line of the log to the entries """
+        key = line['item']['url']
+        entry = self._entries.get(key)
+        if entry is None:
+            self._entries[key] = FrecencyEntry(line['collection'],
+                                               line['item'], line['score'],
+                                               line['at'])
+            return
+
+        entry.score = self._decayed(entry, line['at']) + line['score']
+        entry.at = max(entry.at, line['at'])
+        entry.collection = line['collection']
+        entry.item = line['item']
+
+    def _load(self):
+        """ Reads the log the first time the scores are needed """
+        if self._entries is not None:
+            return
+
+        self._entries = {}
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                    except (ValueError, KeyError, TypeError) as e:
+                        # A line cut by a crash is skipped
+                        logger.error("Invalid frecency line: %s", e)
+                    self._lines += 1
+                    self._truncated = not line.endswith("\n")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error("Unable to read the frecency log %s: %s", self.path,
+                         e)
+
+    def record(self, collection, item, now=None):
+        """
+        Records the opening of an item of a collection.
+
+        Args:
+          collection (str): The collection of the item
+          item (dict): The item, identified by its `url`
+        """
+        if isinstance(item, Record):
+            item = item.to_dict()
+        item = {
+            k: v
+            for k, v in item.items() if k not in ('account', 'account_id')
+        }
+        line = {
+            'collection': collection,
+            'item': item,
+            'score': 1.0,
+            'at': now or time.time()
+        }
+
+        with self._lock:
+            self._load()
+            self._apply(line)
+            try:
+                with open(self.path, 'a') as f:
+                    if self._truncated:
+                        f.write("\n")
+                    f.write(json.dumps(line) + "\n")
+                self._truncated = False
+                self._lines += 1
+                if self._lines > max(COMPACT_MIN_LINES,
+                                     COMPACT_FACTOR * len(self._entries)):
+                    self._compact(line['at'])
+            except OSError as e:
+                logger.error("Unable to write the frecency log %s: %s",
+                             self.path, e)
+
+    def _compact(self, now):
+        """
+        Rewrites the log with a line per item, forgetting the items whose
+        score decayed and keeping the MAX_ENTRIES best. Called with the lock held.
+        """
+        scored = sorted(((self._decayed(entry, now), key)
+                         for key, entry in self._entries.items()),
+                        reverse=True)
+        self._entries = {
+            key: self._entries[key]
+            for score, key in scored[:MAX_ENTRIES] if score >= MIN_SCORE
+        }
+        write_json_lines_atomic(
+            self.path, [entry.to_dict() for entry in self._entries.values()])
+        self._lines = len(self._entries)
+        self._truncated = False
+        logger.info("Frecency log compacted to %d items", self._lines)
+
+    def score(self, url, now=None):
+        """ Returns the frecency score of an item """
+        with self._lock:
+            self._load()
+            entry = self._entries.get(url)
+            return self._decayed(entry, now or time.time()) if entry else 0.0
+
+    def with_opened(self, collection, results, index, limit):
+        """
+        Adds the most frecent opened items of a collection to the results of
+        an empty query, which only holds the most recent items. An opened item
+        is only added when a search of the index for its first key field
+        finds it, so deleted, unstarred or foreign items are never shown.
+
+        Args:
+          collection (str): The searched collection
+          results (list): The results of the empty query
+          index (SearchIndex): The index of the collection, or its SQLite
+            equivalent
+          limit (int): The maximum number of opened items to add
+        """
+        now = time.time()
+        with self._lock:
+            self._load()
+            opened = [
+                entry.item for entry in sorted(
+                    (entry for entry in self._entries.values()
+                     if entry.collection == collection),
+                    key=lambda entry: self._decayed(entry, now),
+                    reverse=True)
+            ]
+
+        seen = {item['url'] for item in results}
+        added = []
+        # Only the best ones are looked up, to bound the searches
+        for item in opened[:limit * FRECENCY_CANDIDATES]:
+            if len(added) >= limit:
+                break
+            if item['url'] in seen:
+                continue
+            term = next((item.get(field) for field in KEY_FIELDS[collection]
+                         if item.get(field)), None)
+            if not term:
+                continue
+            match = next((found for found in index.search(term, limit)
+                          if found['url'] == item['url']), None)
+            if match is not None:
+                added.append(match)
+        return list(results) + added
+
+
+def rank_by_frecency(query, results, score, limit):
+    """
+    Blends the frecency scores into the ranking of search results.
+
+    Every result gets a base score, from 1 for the first one down to 0, plus
+    a boost growing with its frecency score. Without a query, the results are
+    only ranked by frecency, then in their stored order.
+
+    Args:
+      query (str): The search query
+      results (list): The results, best first
+      score (callable): Returns the frecency score of a result
+      limit (int): The maximum number of results
+    """
+    total = len(results)
+    spread = 1 if query.strip() else 0
+    boosts = []
+    for item in results:
+        item_score = score(item)
+        boosts.append(FRECENCY_WEIGHT * item_score /
+                      (item_score + FRECENCY_SATURATION))
+
+    ranked = sorted(range(total),
+                    key=lambda i: spread * (1 - i / total) + boosts[i],
+                    reverse=True)
+    return [results[i] for i in ranked[:limit]]
@@ -1,89 +1,416 @@
+import itertools
 import logging
+import threading
 import time
-from github import Github
+from concurrent.futures import ThreadPoolExecutor
+from gh.api import GitHubApiClient, PER_PAGE
 from gh.cache import Cache
+from gh.constants import ISSUE_QUERIES
+from gh.metrics import timed
+from gh.utils import repository_full_name
 
 logger = logging.getLogger(__name__)
 
+# Incremental syncs can't see deleted repos, gists or removed stars,
+# so a full sync still runs once in a while.
+FULL_SYNC_INTERVAL = 7 * 86400
+
+STAR_MEDIA_TYPE = 'application/vnd.github.star+json'
+
+# Number of organizations whose repos are fetched in parallel
+ORG_WORKERS = 4
+
+# Issues stop matching a filter without any trace in the search results
+# (e.g. when unassigned), so they are fully refetched more often.
+ISSUES_FULL_SYNC_INTERVAL = 86400
+
 
 class GitHubDataSync(object):
-    """ Syncs the data from GitHub """
+    """
+    Syncs the data from GitHub.
+
+    After a first full sync, only the items changed since the last sync are
+    fetched. Every collection keeps the ETag and Last-Modified of its first
+    page, so an unchanged collection costs a single 304 response (which
+    doesn't count against the rate limit), and an updated_at watermark, so
+    pagination stops as soon as older items are reached.
+    """
+
+    _state_lock = threading.Lock()
 
-    def __init__(self, github_client: Github, cache: Cache):
-        self.github_client = github_client
+    def __init__(self, api: GitHubApiClient, cache: Cache, on_progress=None):
+        """
+        Args:
+          api (GitHubApiClient): The API client
+          cache (Cache): The cache the collections are merged into
+          on_progress (callable): Receives the collection, the number of
+            pages and of items done, and the total number of pages if known,
+            after every page
+        """
+        self.api = api
         self.cache = cache
+        self.on_progress = on_progress
+        self.state = {}
 
-    def execute(self):
-        """" Executes the sync process with GitHub"""
-        self.fetch_repos()
-        time.sleep(2)
-        self.fetch_gists()
-        time.sleep(2)
-        self.fetch_starred()
+    def fetchers(self):
+        """ Returns the fetch method of every synced collection """
+        return {
+            'repos': self.fetch_repos,
+            'gists': self.fetch_gists,
+            'starred': self.fetch_starred,
+            'orgs': self.fetch_orgs,
+            'issues': self.fetch_issues
+        }
 
-    def fetch_repos(self):
-        """ Fetch user repositories """
+    def execute(self, full=False, collections=None):
+        """
+        Executes the sync process with GitHub.
+        The collections are fetched concurrently.
 
-        logger.info("Fetching user repos from GitHub")
+        Args:
+          full (bool): Refetch everything instead of only the changes
+          collections (list): The collections to sync, all of them by default
+        """
+        fetchers = self.fetchers()
+        names = collections or list(fetchers)
+        self.state = self.cache.get_sync_state()
+
+        def fetch(name):
+            with timed("sync.{}".format(name)):
+                fetchers[name](full)
+
+        with timed("sync.total"), \
+                ThreadPoolExecutor(max_workers=len(names)) as executor:
+            futures = [executor.submit(fetch, name) for name in names]
+
+        try:
+            for future in futures:
+                future.result()
+        finally:
+            # Other syncs may have run meanwhile, so only the state of the
+            # synced collections is replaced.
+            with self._state_lock:
+                state = self.cache.get_sync_state()
+                state.update(
+                    (name, self.state[name]) for name in names
+                    if name in self.state)
+                self.cache.store_sync_state(state)
+
+    def repo_to_dict(self, repo):
+        """ Keeps only the repository fields stored in the cache """
+        return {
+            'name': repo['name'],
+            'fullname': repo['full_name'],
+            'description': repo['description'],
+            'url': repo['html_url'],
+            'stars': repo['stargazers_count'],
+            'updated_at': repo['updated_at']
+        }
+
+    def gist_to_dict(self, gist):
+        """ Keeps only the gist fields stored in the cache """
+        files = list(gist['files'].values())
+        return {
+            'description': gist['description'],
+            'url': gist['html_url'],
+            'filename': files[0]['filename'] if files else "",
+            'updated_at': gist['updated_at']
+        }
+
+    def _collection_state(self, name, full):
+        """
+        Returns the sync state of a collection.
+        The state is reset when a full sync is due.
+        """
+        state = self.state.get(name, {})
+        if full or not state.get('watermark') or \
+                time.time() - state.get('full_sync_at', 0) > FULL_SYNC_INTERVAL:
+            state = {}
+
+        self.state[name] = state
+        return state
+
+    def _remember(self, state, response, watermark):
+        """ Keeps the validators of the response and moves the watermark """
+        state['etag'] = response.headers.get('ETag')
+        state['last_modified'] = response.headers.get('Last-Modified')
+        if watermark:
+            state['watermark'] = max(watermark, state.get('watermark', ''))
+
+    def _newest(self, items, date_field, watermark=''):
+        """ Returns the newest date of the items, or the given watermark """
+        return max([item[date_field] for item in items if item.get(date_field)] +
+                   [watermark])
+
+    def _report(self, name, pages, items, total_pages=None):
+        """ Reports the progress of the sync of a collection """
+        if self.on_progress is not None:
+            self.on_progress(name, pages, items, total_pages)
+
+    def _stream_all(self, name, state, stream, convert, path, params=None,
+                    headers=None, date_field='updated_at'):
+        """
+        Fetches every item of a collection, with its pages in parallel.
+        Every page is added to the stream as soon as it arrives.
+        """
+        first_page = None
+        total_pages = None
+        watermark = ''
+        count = 0
+        pages = self.api.iter_pages(path, params, headers)
+        for page_number, response in enumerate(pages, 1):
+            if first_page is None:
+                first_page = response
+                total_pages = self.api.last_page(response) or \
+                    (None if 'next' in response.links else 1)
+
+            items = response.json()
+            watermark = self._newest(items, date_field, watermark)
+            stream.add([convert(item) for item in items])
+            count += len(items)
+            self._report(name, page_number, count, total_pages)
+
+        # The state only changes once every page was fetched, so an
+        # interrupted full sync is started over
+        self._remember(state, first_page, watermark)
+        state['full_sync_at'] = time.time()
+        return count
+
+    def _stream_changed(self, name, state, stream, convert, path, params=None,
+                        headers=None, date_field='updated_at'):
+        """
+        Fetches the items changed since the watermark, newest first, and adds
+        them to the stream page by page. Returns the number of changed items,
+        none when GitHub answers 304 Not Modified.
+        """
+        conditional_headers = dict(headers or {})
+        if state.get('etag'):
+            conditional_headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            conditional_headers['If-Modified-Since'] = state['last_modified']
+
+        params = dict(params or {}, per_page=PER_PAGE)
+        response = self.api.request('GET', path, params, conditional_headers)
+        if response.status_code == 304:
+            return 0
 
-        repos = self.github_client.get_user().get_repos(sort="updated",
-                                                        direction="desc")
+        first_page = response
+        watermark = state['watermark']
+        newest = ''
+        count = 0
+        pages = itertools.chain([response],
+                                self.api.next_pages(response, headers))
+        for page_number, response in enumerate(pages, 1):
+            items = response.json()
+            newer = list(
+                itertools.takewhile(lambda i: i[date_field] > watermark,
+                                    items))
+            newest = self._newest(newer, date_field, newest)
+            stream.add([convert(item) for item in newer])
+            count += len(newer)
+            self._report(name, page_number, count)
+            if len(newer) < len(items):
+                break
 
-        # need to iterate all repos to force the PaginatesList to get all the results
-        repo_data = []
-        for repo in repos:
-            repo_data.append({
-                'name': repo.name,
-                'fullname': repo.full_name,
-                'description': repo.description,
-                'url': repo.html_url,
-                'stars': repo.stargazers_count
-            })
+        self._remember(state, first_page, newest)
+        return count
 
-            time.sleep(0.1)
+    def _sync_collection(self, name, collection, state, convert, path,
+                         params=None, headers=None, date_field='updated_at'):
+        """
+        Streams a full sync of a collection, or the items changed since the
+        last sync when there is a state, into the cache.
+        Returns the number of streamed items.
+        """
+        incremental = bool(state)
+        with self.cache.stream(collection, replace=not incremental) as stream:
+            if not incremental:
+                return self._stream_all(name, state, stream, convert, path,
+                                        params, headers, date_field)
 
-        self.cache.store_repos_cache(repo_data)
+            count = self._stream_changed(name, state, stream, convert, path,
+                                         params, headers, date_field)
+            logger.info("%d %s changed since the last sync", count, name)
+            return count
 
-    def fetch_gists(self):
+    def fetch_repos(self, full=False):
+        """ Fetch user repositories """
+
+        logger.info("Fetching user repos from GitHub")
+
+        state = self._collection_state('repos', full)
+        params = {'sort': 'updated', 'direction': 'desc'}
+        self._sync_collection('repos', 'repos', state, self.repo_to_dict,
+                              "/user/repos", params)
+
+    def fetch_gists(self, full=False):
         """ Fetch user gists """
 
         logger.info("Fetching user gists from GitHub")
 
-        gists_data = []
-        gists = self.github_client.get_user().get_gists()
+        state = self._collection_state('gists', full)
+        params = {'since': state['watermark']} if state else None
+        self._sync_collection('gists', 'gists', state, self.gist_to_dict,
+                              "/gists", params)
 
-        for gist in gists:
-            gists_data.append({
-                'description':
-                gist.description,
-                'url':
-                gist.html_url,
-                'filename':
-                list(gist.files.values())[0].filename
-                if list(gist.files.values()) else ""
-            })
+    def fetch_starred(self, full=False):
+        """
+        Fetch starred repos.
+        The star media type adds the `starred_at` date used as watermark.
+        """
 
-            time.sleep(0.1)
+        logger.info("Fetching starred repos from GitHub")
 
-        self.cache.store_gists_cache(gists_data)
+        state = self._collection_state('starred', full)
+        self._sync_collection('starred',
+                              'starred_repos',
+                              state,
+                              lambda star: self.repo_to_dict(star['repo']),
+                              "/user/starred",
+                              headers={'Accept': STAR_MEDIA_TYPE},
+                              date_field='starred_at')
 
-    def fetch_starred(self):
-        """ Fetch starred repos """
+    def org_to_dict(self, org):
+        """ Keeps only the organization fields stored in the cache """
+        return {
+            'login': org['login'],
+            'name': org.get('name') or org['login'],
+            'description': org.get('description') or "",
+            'url': "{}/{}".format(self.api.web_url, org['login'])
+        }
 
-        logger.info("Fetching starred repos from GitHub")
+    def cached_org_repos(self, login):
+        """ Returns the cached repos of an organization """
+        index = self.cache.get_org_repos(login)
+        return index.search("", len(index))
+
+    def fetch_org_repos(self, login, etag=None):
+        """
+        Fetch the repos of an organization.
+        Returns the ETag of the first page and the repos, or the cached repos
+        when GitHub answers 304 Not Modified to the given ETag.
+        """
+        path = "/orgs/{}/repos".format(login)
+        params = {'sort': 'updated', 'direction': 'desc'}
+        headers = {'If-None-Match': etag} if etag else {}
+
+        response = self.api.request('GET', path,
+                                    dict(params, per_page=PER_PAGE), headers)
+        if response.status_code == 304:
+            return etag, self.cached_org_repos(login)
+
+        repos = []
+        for page in self.api.iter_pages(path, params, first_page=response):
+            repos.extend(
+                dict(self.repo_to_dict(r), org=login) for r in page.json())
+        return response.headers.get('ETag'), repos
+
+    def fetch_orgs(self, full=False):
+        """
+        Fetch the organizations of the user, and the repos of each one.
+        The repos of the organizations are fetched in parallel, and only
+        when the ETag of their first page changed.
+        """
+
+        logger.info("Fetching user organizations from GitHub")
+
+        state = self.state.get('orgs', {})
+        if full or \
+                time.time() - state.get('full_sync_at', 0) > FULL_SYNC_INTERVAL:
+            state = {'full_sync_at': time.time()}
+        self.state['orgs'] = state
+
+        orgs = [self.org_to_dict(o) for o in self.api.get_all("/user/orgs")]
+        logins = [org['login'] for org in orgs]
+        etags = state.get('etags', {})
+
+        with ThreadPoolExecutor(max_workers=ORG_WORKERS) as executor:
+            results = list(
+                executor.map(
+                    lambda login: self.fetch_org_repos(login, etags.get(login)),
+                    logins))
+
+        state['etags'] = {
+            login: etag
+            for login, (etag, _) in zip(logins, results)
+        }
+        self.cache.store_orgs_cache(orgs)
+        self.cache.store_org_repos_cache(
+            sorted(itertools.chain.from_iterable(r for _, r in results),
+                   key=lambda repo: repo['updated_at'] or "",
+                   reverse=True))
+
+    def issue_to_dict(self, issue, filter):
+        """ Keeps only the issue fields stored in the cache """
+        return {
+            'id': "{} {}".format(filter, issue['html_url']),
+            'filter': filter,
+            'title': issue['title'],
+            'repository': repository_full_name(issue['repository_url']),
+            'number': issue['number'],
+            'state': issue['state'],
+            'labels': ", ".join(label['name'] for label in issue['labels']),
+            'url': issue['html_url'],
+            'updated_at': issue['updated_at']
+        }
+
+    def search_issues(self, query):
+        """ Returns all the issues matching a search, most recently updated first """
+        issues = []
+        params = {'q': query, 'sort': 'updated', 'order': 'desc'}
+        for response in self.api.iter_pages("/search/issues", params):
+            issues.extend(response.json()['items'])
+        return issues
+
+    def fetch_issues(self, full=False):
+        """
+        Fetch the open issues and pull requests assigned to or created by the user.
+        After a full sync, only the ones updated after the watermark of each
+        filter are searched, including the closed ones, which are dropped.
+        """
+
+        logger.info("Fetching user issues and pull requests from GitHub")
+
+        state = self.state.get('issues', {})
+        if full or time.time() - state.get('full_sync_at', 0) > \
+                ISSUES_FULL_SYNC_INTERVAL:
+            state = {}
+        self.state['issues'] = state
+
+        if not state:
+            started = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            issues = []
+            for filter, query in ISSUE_QUERIES.items():
+                found = self.search_issues(query + " is:open")
+                issues.extend(self.issue_to_dict(i, filter) for i in found)
+                # Without open issues, the next sync starts from now
+                state[filter] = started
+                self._advance_issues(state, filter, found)
 
-        repo_data = []
+            state['full_sync_at'] = time.time()
+            self.cache.store_issues_cache(issues)
+            return
 
-        repos = self.github_client.get_user().get_starred()
-        for repo in repos:
-            repo_data.append({
-                'name': repo.name,
-                'fullname': repo.full_name,
-                'description': repo.description,
-                'url': repo.html_url,
-                'stars': repo.stargazers_count
-            })
+        changed = []
+        closed = []
+        for filter, query in ISSUE_QUERIES.items():
+            found = self.search_issues("{} updated:>{}".format(
+                query, state[filter]))
+            for issue in found:
+                issue = self.issue_to_dict(issue, filter)
+                if issue['state'] == 'open':
+                    changed.append(issue)
+                else:
+                    closed.append(issue['id'])
+            self._advance_issues(state, filter, found)
 
-            time.sleep(0.1)
+        logger.info("%d issues changed since the last sync",
+                    len(changed) + len(closed))
+        if changed or closed:
+            self.cache.merge_issues_cache(changed, closed)
 
-        self.cache.store_starred_repos(repo_data)
+    def _advance_issues(self, state, filter, issues):
+        """ Moves the watermark of a filter to its newest issue """
+        dates = [issue['updated_at'] for issue in issues]
+        if dates:
+            state[filter] = max(dates + [state.get(filter) or ''])
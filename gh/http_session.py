@@ -0,0 +1,175 @@
+"""
+Shared HTTP sessions used for every request made by the extension.
+Connections are pooled and kept alive, so the docs search, the API client and
+the sync don't pay a new TLS handshake on every request.
+"""
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 15
+POOL_SIZE = 16  # Enough for the parallel page fetches of the three collections
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# Requests made while the user types aren't retried, and give up sooner: a
+# newer query is usually on its way.
+INTERACTIVE_TIMEOUT = (3, 5)
+INTERACTIVE_POOL_SIZE = 4
+
+
+def create_retry(retries=MAX_RETRIES):
+    """
+    Retries connection errors and server errors with an exponential backoff.
+    Only idempotent methods are retried, and rate limit responses are left
+    to the API client.
+    """
+    return Retry(total=retries,
+                 backoff_factor=BACKOFF_FACTOR,
+                 status_forcelist=RETRY_STATUSES,
+                 raise_on_status=False)
+
+
+class HostStats(object):
+    """ Latency statistics of the responses of a host """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.last_at = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.last = seconds
+        self.last_at = time.time()
+
+    def merge(self, other):
+        """ Adds the responses of other statistics of the same host """
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        if other.last_at > self.last_at:
+            self.last = other.last
+            self.last_at = other.last_at
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'avg_ms': self.total * 1000 / self.count if self.count else 0.0,
+            'max_ms': self.max * 1000,
+            'last_ms': self.last * 1000
+        }
+
+
+class HttpSession(requests.Session):
+    """
+    Session with a connection pool, retries, default timeouts and per host
+    latency statistics.
+    """
+
+    def __init__(self, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+                 pool_size=POOL_SIZE, retries=MAX_RETRIES):
+        """
+        Args:
+          timeout (tuple): The default connect and read timeouts
+          pool_size (int): Maximum number of kept alive connections per host
+          retries (int): Maximum number of retries of a request
+        """
+        super(HttpSession, self).__init__()
+        self.timeout = timeout
+        self.headers['Accept-Encoding'] = 'gzip, deflate'
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size,
+                              max_retries=create_retry(retries))
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        self.hooks['response'].append(self._record_latency)
+
+    def request(self, method, url, **kwargs):
+        """ Makes a request, with the default timeouts unless others are given """
+        kwargs.setdefault('timeout', self.timeout)
+        return super(HttpSession, self).request(method, url, **kwargs)
+
+    def _record_latency(self, response, *args, **kwargs):
+        """ Response hook keeping the time spent waiting for each host """
+        host = urlparse(response.url).netloc
+        with self._stats_lock:
+            stats = self._stats.setdefault(host, HostStats())
+            stats.add(response.elapsed.total_seconds())
+
+    def host_stats(self):
+        """ Returns a copy of the statistics of every host """
+        with self._stats_lock:
+            stats = {}
+            for host, host_stats in self._stats.items():
+                stats[host] = HostStats()
+                stats[host].merge(host_stats)
+            return stats
+
+    def latency_stats(self):
+        """ Returns the latency statistics of every host, in milliseconds """
+        return {
+            host: stats.as_dict()
+            for host, stats in self.host_stats().items()
+        }
+
+
+_session = None
+_interactive_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> HttpSession:
+    """ Returns the session shared by the whole extension """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = HttpSession()
+        return _session
+
+
+def get_interactive_session() -> HttpSession:
+    """
+    Returns the session of the requests made while the user types, which
+    fail fast instead of being retried
+    """
+    global _interactive_session
+    with _session_lock:
+        if _interactive_session is None:
+            _interactive_session = HttpSession(INTERACTIVE_TIMEOUT,
+                                               INTERACTIVE_POOL_SIZE,
+                                               retries=0)
+        return _interactive_session
+
+
+def latency_stats():
+    """
+    Returns the latency statistics of every host reached by the shared
+    sessions, none before they are created
+    """
+    with _session_lock:
+        sessions = [
+            session for session in (_session, _interactive_session)
+            if session is not None
+        ]
+    stats = {}
+    for session in sessions:
+        for host, host_stats in session.host_stats().items():
+            stats.setdefault(host, HostStats()).merge(host_stats)
+    return {host: host_stats.as_dict() for host, host_stats in stats.items()}
@@ -1,5 +1,6 @@
 from ulauncher.api.client.EventListener import EventListener
-from gh.actions import REFRESH_DATA
+from gh.actions import COPY_ITEM, DUMP_METRICS, OPEN_ITEM, REFRESH_DATA, \
+    SHOW_METRICS, SHOW_SYNC_STATUS
 
 
 class ItemEnterEventListener(EventListener):
@@ -8,5 +9,17 @@ class ItemEnterEventListener(EventListener):
     def on_event(self, event, extension):
         """ handle function """
         data = event.get_data()
+        if data['action'] in (OPEN_ITEM, COPY_ITEM):
+            return extension.select_item(data)
+
         if data['action'] == REFRESH_DATA:
-            return extension.refresh_data()
+            return extension.refresh_data(full=True)
+
+        if data['action'] == SHOW_SYNC_STATUS:
+            return extension.show_sync_status()
+
+        if data['action'] == SHOW_METRICS:
+            return extension.show_metrics()
+
+        if data['action'] == DUMP_METRICS:
+            return extension.dump_metrics()
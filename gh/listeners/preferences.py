@@ -1,7 +1,8 @@
 import logging
 
 from ulauncher.api.client.EventListener import EventListener
-from github import Github, GithubException
+
+from gh.accounts import ACCOUNT_PREFERENCES
 
 logger = logging.getLogger(__name__)
 
@@ -11,13 +12,21 @@ class PreferencesEventListener(EventListener):
 
     def on_event(self, event, extension):
         """ Handle event """
-        extension.github = Github(event.preferences['access_token'])
-        try:
-            extension.refresh_user()
-            extension.refresh_data()
-        except GithubException as ex:
-            logger.error(ex)
-            extension.user = None
+        extension.configure_cache(event.preferences.get('cache_backend'))
+        extension.configure_sync_backend(event.preferences.get('sync_backend'))
+        extension.account_preferences = {
+            name: event.preferences.get(name)
+            for name in ACCOUNT_PREFERENCES
+        }
+        extension.configure_accounts()
+        extension.configure_docs_index(
+            event.preferences.get('docs_search'),
+            event.preferences.get('docs_dump_file'))
+        extension.notify_new_notifications = event.preferences.get(
+            'notify_new_notifications') == 'yes'
+        extension.start_notifications_poller()
+        extension.refresh_user()
+        extension.refresh_data()
 
 
 class PreferencesUpdateEventListener(EventListener):
@@ -25,11 +34,33 @@ class PreferencesUpdateEventListener(EventListener):
 
     def on_event(self, event, extension):
         """ Event handler """
-        if event.id == 'access_token':
-            extension.github = Github(event.new_value)
-            try:
-                extension.refresh_user()
-                extension.refresh_data()
-            except GithubException as ex:
-                logger.error(ex)
-                extension.user = None
+        if event.id in ACCOUNT_PREFERENCES:
+            # New accounts have their own empty cache, so they are fully
+            # synced, while the unchanged ones are only refreshed
+            extension.account_preferences[event.id] = event.new_value
+            extension.configure_accounts()
+            extension.live_cache.invalidate()
+            extension.start_notifications_poller()
+            extension.refresh_user()
+            extension.refresh_data()
+
+        if event.id == 'sync_backend':
+            extension.configure_sync_backend(event.new_value)
+
+        if event.id == 'notify_new_notifications':
+            extension.notify_new_notifications = event.new_value == 'yes'
+
+        if event.id == 'docs_search':
+            extension.configure_docs_index(event.new_value,
+                                           extension.docs_dump_file)
+            extension.docs_scheduler.request(['docs'])
+
+        if event.id == 'docs_dump_file':
+            extension.configure_docs_index(
+                'offline' if extension.docs_offline else 'live',
+                event.new_value)
+            extension.docs_scheduler.request(['docs'])
+
+        if event.id == 'cache_backend':
+            extension.configure_cache(event.new_value)
+            extension.refresh_data(full=True)
@@ -4,6 +4,7 @@ from ulauncher.api.shared.event import KeywordQueryEvent
 from ulauncher.api.client.Extension import Extension
 from ulauncher.api.client.EventListener import EventListener
 from gh.constants import ISSUE_FILTER_ASSIGNED, ISSUE_FILTER_CREATED, PR_FILTER_ASSIGNED, PR_FILTER_CREATED
+from gh.metrics import timed
 
 logger = logging.getLogger(__name__)
 
@@ -15,9 +16,15 @@ class KeywordQueryEventListener(EventListener):
         """ Handles event """
 
         query = event.get_argument() or ""
+        extension.current_event = event
         keyword_id = self.get_keyword_id(extension.preferences,
                                          event.get_keyword())
 
+        with timed("keyword.{}".format(keyword_id or "options")):
+            return self.dispatch(keyword_id, query, extension)
+
+    def dispatch(self, keyword_id: str, query: str, extension: Extension):
+        """ Runs the handler of the keyword """
         if keyword_id == "kw_gists":
             return extension.user_gists(query)
 
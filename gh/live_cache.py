@@ -0,0 +1,119 @@
+"""
+Cache for the keywords that query the GitHub API live (issues, pull requests,
+organizations, users and public repos search).
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from gh.query_scheduler import QueryScheduler
+
+LIVE_CACHE_TTL = 60  # Results younger than this are served without refreshing
+LIVE_CACHE_MAX_AGE = 86400  # Results older than this are never served
+LIVE_CACHE_MAX_ENTRIES = 256
+
+CacheEntry = namedtuple('CacheEntry', 'rows fetched_at')
+
+
+def filter_rows(rows, query):
+    """ Keeps the rows whose search key contains every term of the query """
+    terms = query.lower().split()
+    return [row for row in rows if all(term in row['key'] for term in terms)]
+
+
+class LiveCache(object):
+    """
+    Per (keyword, query) cache with LRU eviction and stale-while-revalidate.
+
+    A cached answer is returned right away. When it is older than the TTL, a
+    background refresh fetches a new one and hands it to a callback. When a
+    query is not cached yet but one of its prefixes is (`foo` while typing
+    `foob`), the prefix results are filtered locally while the real query is
+    fetched in the background.
+
+    Background fetches go through a QueryScheduler, so they are debounced
+    per keyword and only the newest query of a keyword gets its callback.
+
+    Rows are plain dicts with at least a lowercased `key` used for filtering.
+    """
+
+    def __init__(self, ttl=LIVE_CACHE_TTL, max_age=LIVE_CACHE_MAX_AGE,
+                 max_entries=LIVE_CACHE_MAX_ENTRIES, scheduler=None):
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.scheduler = scheduler or QueryScheduler()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, key):
+        """ Returns a servable entry, marking it as recently used """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry.fetched_at > self.max_age:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _lookup_prefix(self, keyword, query):
+        """ Returns the entry of the longest cached prefix of the query """
+        for size in range(len(query) - 1, 0, -1):
+            entry = self._lookup((keyword, query[:size]))
+            if entry is not None:
+                return entry
+        return None
+
+    def put(self, keyword, query, rows):
+        """ Stores the rows of a query, evicting the least recently used """
+        with self._lock:
+            self._entries[(keyword, query)] = CacheEntry(rows, time.time())
+            self._entries.move_to_end((keyword, query))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """ Drops every cached entry """
+        with self._lock:
+            self._entries.clear()
+
+    def _refresh(self, keyword, query, fetch, on_update, on_error):
+        """ Schedules a background fetch of the query """
+
+        def job():
+            rows = fetch()
+            # Results of superseded queries are still worth caching.
+            self.put(keyword, query, rows)
+            return rows
+
+        self.scheduler.schedule(keyword, job, on_update, on_error)
+
+    def get(self, keyword, query, fetch, on_update, on_error=None):
+        """
+        Returns the rows of a query, or None when nothing usable is cached
+        yet. In that case the rows are handed to on_update once fetched.
+
+        Args:
+          keyword (str): The keyword the query belongs to
+          query (str): The query typed by the user
+          fetch (callable): Fetches the rows from the API
+          on_update (callable): Receives the rows of a background fetch
+          on_error (callable): Receives the exception of a failed background fetch
+        """
+        entry = self._lookup((keyword, query))
+        if entry is not None:
+            if time.time() - entry.fetched_at > self.ttl:
+                self._refresh(keyword, query, fetch, on_update, on_error)
+            else:
+                self.scheduler.supersede(keyword)
+            return entry.rows
+
+        self._refresh(keyword, query, fetch, on_update, on_error)
+
+        entry = self._lookup_prefix(keyword, query)
+        if entry is not None:
+            return filter_rows(entry.rows, query)
+
+        return None
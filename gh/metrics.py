@@ -0,0 +1,110 @@
+"""
+Timing instrumentation of the query handling and the sync.
+
+Every stage (a keyword, a cache load, a search, an API call...) keeps the
+durations of its most recent runs, from which percentiles are computed.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from gh.utils import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+METRICS_WINDOW = 512  # Number of recent durations kept per stage
+METRICS_FILE = 'github_metrics.json'
+
+
+class Histogram(object):
+    """ Rolling window of the durations of a stage """
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def summary(self):
+        """ Returns the percentiles of the window, in milliseconds """
+        samples = sorted(self.samples)
+        size = len(samples)
+
+        def percentile(percent):
+            return samples[min(size - 1, int(size * percent / 100))] * 1000
+
+        return {
+            'count': self.count,
+            'mean_ms': self.total * 1000 / self.count,
+            'p50_ms': percentile(50),
+            'p90_ms': percentile(90),
+            'p99_ms': percentile(99),
+            'max_ms': samples[-1] * 1000
+        }
+
+
+class Metrics(object):
+    """ The histograms of all the stages """
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(self.window)
+            histogram.add(seconds)
+
+    @contextmanager
+    def timed(self, stage):
+        """ Records the duration of the block, even when it raises """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def summary(self):
+        """ Returns the summary of every stage, slowest p99 first """
+        with self._lock:
+            summaries = {
+                stage: histogram.summary()
+                for stage, histogram in self._histograms.items()
+            }
+        return dict(
+            sorted(summaries.items(),
+                   key=lambda item: item[1]['p99_ms'],
+                   reverse=True))
+
+    def dump(self, path, **extra):
+        """
+        Writes the summary of every stage to a JSON file, with the extra
+        sections given, e.g. the latency of every host
+        """
+        data = {
+            'dumped_at': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            'stages': self.summary()
+        }
+        data.update(extra)
+        write_json_atomic(path, data)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+metrics = Metrics()
+
+
+def timed(stage):
+    """ Times a block in the shared metrics """
+    return metrics.timed(stage)
@@ -0,0 +1,198 @@
+"""
+Background poller of the user notifications and their local inbox.
+"""
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from gh.api import GitHubApiClient, PER_PAGE
+from gh.utils import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATIONS_FILE = 'github_notifications.json'
+DEFAULT_POLL_INTERVAL = 60
+NOTIFICATIONS_MAX_DAYS = 15  # Only keep notifications of the last X days
+
+
+def notification_url(notification, api: GitHubApiClient):
+    """
+    Returns the web URL of the subject of a notification, on the GitHub
+    instance of the API client
+    """
+    subject = notification['subject']
+    url = (subject['url'] or "").replace(api.base_url + "/repos",
+                                         api.web_url)
+    if subject['type'] == "PullRequest":
+        url = url.replace("pulls", "pull")
+    return url or api.web_url + "/notifications"
+
+
+def notification_to_dict(notification, api: GitHubApiClient):
+    """ Keeps only the notification fields stored in the inbox """
+    subject = notification['subject']
+    repository = notification['repository']['full_name']
+    return {
+        'id': notification['id'],
+        'title': subject['title'],
+        'type': subject['type'],
+        'repository': repository,
+        'updated_at': notification['updated_at'],
+        'url': notification_url(notification, api),
+        'key': "\n".join((subject['title'], repository, subject['type'])).lower()
+    }
+
+
+class NotificationsInbox(object):
+    """
+    The notifications of the last poll, kept in memory and in a cache file
+    together with the Last-Modified and X-Poll-Interval of the response.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._data = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._data is None:
+                try:
+                    with open(self.path) as f:
+                        self._data = json.load(f)
+                except FileNotFoundError:
+                    self._data = {}
+                except ValueError as e:
+                    logger.error("Invalid notifications cache: %s", e)
+                    self._data = {}
+            return self._data
+
+    @property
+    def polled(self):
+        """ Whether the notifications were polled at least once """
+        return 'polled_at' in self._load()
+
+    @property
+    def last_modified(self):
+        return self._load().get('last_modified')
+
+    @property
+    def poll_interval(self):
+        return self._load().get('poll_interval', DEFAULT_POLL_INTERVAL)
+
+    def rows(self):
+        """ Returns the notifications, most recently updated first """
+        return self._load().get('notifications', [])
+
+    def store(self, notifications, last_modified, poll_interval):
+        """ Replaces the notifications, returning the ones that are new """
+        known = {row['id'] for row in self.rows()}
+        new = [row for row in notifications if row['id'] not in known]
+        self._save(
+            dict(notifications=notifications,
+                 last_modified=last_modified,
+                 poll_interval=poll_interval,
+                 polled_at=time.time()))
+        return new
+
+    def touch(self, poll_interval):
+        """
+        Records a poll that found no changes.
+        The file is only rewritten when GitHub changed the poll interval.
+        """
+        data = dict(self._load(), polled_at=time.time())
+        if data.get('poll_interval') != poll_interval:
+            data['poll_interval'] = poll_interval
+            self._save(data)
+        else:
+            self._data = data
+
+    def _save(self, data):
+        self._data = data
+        try:
+            write_json_atomic(self.path, data)
+        except OSError as e:
+            logger.error("Failed to write the notifications cache: %s", e)
+
+
+class NotificationsPoller(object):
+    """
+    Polls the notifications in the background.
+
+    It waits the X-Poll-Interval asked by GitHub between polls, and sends
+    If-Modified-Since, so polls without changes get a 304 response which
+    doesn't count against the rate limit.
+    """
+
+    def __init__(self, api: GitHubApiClient, inbox: NotificationsInbox,
+                 on_new=None):
+        """
+        Args:
+          api (GitHubApiClient): The API client
+          inbox (NotificationsInbox): The inbox updated by the polls
+          on_new (callable): Receives the new notifications of a poll
+        """
+        self.api = api
+        self.inbox = inbox
+        self.on_new = on_new
+        self._stop = threading.Event()
+        self._poll_lock = threading.Lock()
+
+    def start(self):
+        """ Starts polling in a daemon thread """
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error("Failed to poll notifications: %s", e)
+            self._stop.wait(self.inbox.poll_interval)
+
+    def poll(self):
+        """ Polls the notifications once and updates the inbox """
+        with self._poll_lock:
+            since = datetime.utcnow() - timedelta(NOTIFICATIONS_MAX_DAYS)
+            params = {
+                'participating': 'true',
+                'since': since.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                'per_page': PER_PAGE
+            }
+            headers = {}
+            if self.inbox.polled and self.inbox.last_modified:
+                headers['If-Modified-Since'] = self.inbox.last_modified
+
+            # The notifications are shown as they arrive, so they use the
+            # interactive rate limit reserves.
+            with self.api.interactive():
+                response = self.api.request('GET', '/notifications', params,
+                                            headers)
+                poll_interval = int(
+                    response.headers.get('X-Poll-Interval',
+                                         DEFAULT_POLL_INTERVAL))
+                if response.status_code == 304:
+                    self.inbox.touch(poll_interval)
+                    return
+
+                first_page = response
+                notifications = list(response.json())
+                for response in self.api.next_pages(first_page):
+                    notifications.extend(response.json())
+
+            first_poll = not self.inbox.polled
+            new = self.inbox.store(
+                [notification_to_dict(n, self.api) for n in notifications],
+                first_page.headers.get('Last-Modified'), poll_interval)
+            logger.debug("%d notifications, %d new", len(notifications),
+                         len(new))
+
+        if new and not first_poll and self.on_new is not None:
+            self.on_new(new)
@@ -0,0 +1,57 @@
+"""
+The profile of the authenticated user, persisted next to the cache so the
+keywords can use it before GitHub answers.
+"""
+import hashlib
+import json
+import logging
+from collections import namedtuple
+
+from gh.utils import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+USER_PROFILE_FILE = 'github_user.json'
+
+
+class UserProfile(namedtuple('UserProfile', 'login name html_url')):
+    """ The fields of the authenticated user used by the keywords """
+
+    @classmethod
+    def from_api(cls, user):
+        """ Builds the profile from a /user response """
+        return cls(user['login'], user['name'] or user['login'],
+                   user['html_url'])
+
+
+def token_fingerprint(token):
+    """ Identifies a token without storing it """
+    return hashlib.sha256((token or "").encode()).hexdigest()
+
+
+class ProfileStore(object):
+    """ Stores the profile together with the fingerprint of its token """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self, token):
+        """ Returns the stored profile, if it belongs to the token """
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.error("Invalid user profile file: %s", e)
+            return None
+
+        if data.get('token_fingerprint') != token_fingerprint(token):
+            return None
+        return UserProfile(data['login'], data['name'], data['html_url'])
+
+    def store(self, token, profile):
+        """ Saves the profile of the user of the token """
+        write_json_atomic(
+            self.path,
+            dict(profile._asdict(), token_fingerprint=token_fingerprint(token)))
@@ -0,0 +1,90 @@
+"""
+Debounces the queries of the keywords backed by the GitHub API.
+"""
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEBOUNCE_DELAY = 0.3
+
+
+class QueryScheduler(object):
+    """
+    Runs at most one pending job per keyword.
+
+    Scheduling a job for a keyword cancels its pending job, if it didn't
+    start yet, and the job only runs after the debounce delay. Jobs that
+    are already in flight can't be interrupted, but their results are
+    dropped when a newer job was scheduled for the same keyword, so
+    results from older queries never replace the newest ones.
+    """
+
+    def __init__(self, delay=DEBOUNCE_DELAY):
+        self.delay = delay
+        self._pending = {}
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    def schedule(self, keyword, job, on_done, on_error=None):
+        """
+        Schedules a job for a keyword.
+
+        Args:
+          keyword (str): The keyword the job belongs to
+          job (callable): The job to run in the background
+          on_done (callable): Receives the result, if the job is still the newest one
+          on_error (callable): Receives the exception, if the job is still the newest one
+        """
+        with self._lock:
+            sequence = self._supersede(keyword)
+            timer = threading.Timer(
+                self.delay, self._run,
+                (keyword, sequence, job, on_done, on_error))
+            timer.daemon = True
+            self._pending[keyword] = timer
+            timer.start()
+
+        return sequence
+
+    def _supersede(self, keyword):
+        """ Cancels the pending job of a keyword and bumps its sequence """
+        sequence = self._latest.get(keyword, 0) + 1
+        self._latest[keyword] = sequence
+
+        pending = self._pending.pop(keyword, None)
+        if pending is not None:
+            pending.cancel()
+        return sequence
+
+    def supersede(self, keyword):
+        """
+        Marks the pending and in flight jobs of a keyword as outdated,
+        e.g. when a newer query was answered without scheduling a job.
+        """
+        with self._lock:
+            self._supersede(keyword)
+
+    def is_latest(self, keyword, sequence):
+        """ Checks if no newer job was scheduled for the keyword """
+        return self._latest.get(keyword) == sequence
+
+    def _run(self, keyword, sequence, job, on_done, on_error):
+        """ Runs a job and hands its result over if it wasn't superseded """
+        with self._lock:
+            if not self.is_latest(keyword, sequence):
+                return
+            self._pending.pop(keyword, None)
+
+        try:
+            result = job()
+        except Exception as e:
+            logger.error("Query for %s failed: %s", keyword, e)
+            if on_error is not None and self.is_latest(keyword, sequence):
+                on_error(e)
+            return
+
+        if self.is_latest(keyword, sequence):
+            on_done(result)
+        else:
+            logger.debug("Dropping superseded results for %s", keyword)
@@ -0,0 +1,130 @@
+"""
+Compact in-memory records of the cached repositories.
+
+Cached collections are normally served from their memory mapped snapshot.
+When the snapshot can't be written, e.g. on a read-only or full disk, the
+collection is kept in memory, and a 50k items collection kept as dicts costs
+tens of MB, so repositories are kept as `__slots__` records instead: owners
+are interned, the full name and the GitHub URL are derived, and the
+descriptions of a collection are packed into a single UTF-8 buffer and only
+decoded when an item is displayed. Records can be read like the dicts they
+replace.
+"""
+import sys
+from array import array
+
+GITHUB_URL = "https://github.com/"
+
+
+class StringTable(object):
+    """ Strings packed into a single UTF-8 buffer, decoded on access """
+
+    def __init__(self, strings):
+        offsets = array('L', [0])
+        chunks = []
+        end = 0
+        for string in strings:
+            chunk = (string or "").encode('utf-8')
+            chunks.append(chunk)
+            end += len(chunk)
+            offsets.append(end)
+        self.data = b"".join(chunks)
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].decode('utf-8')
+
+
+class Record(object):
+    """ Base of the compact records, readable like a dict of its FIELDS """
+
+    __slots__ = ()
+
+    FIELDS = ()
+
+    def __getitem__(self, field):
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field)
+
+    def __contains__(self, field):
+        return field in self.FIELDS
+
+    def get(self, field, default=None):
+        return getattr(self, field, default)
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+
+class RepoRecord(Record):
+    """ A cached repository """
+
+    __slots__ = ('owner', 'name', 'stars', 'updated_at', '_url',
+                 '_descriptions', '_index')
+
+    FIELDS = ('name', 'fullname', 'description', 'url', 'stars', 'updated_at')
+
+    def __init__(self, repo, descriptions, index):
+        """
+        Args:
+          repo (dict): The repository, as stored in the cache file
+          descriptions (StringTable): The descriptions of the collection
+          index (int): The position of the description in the table
+        """
+        owner, _, name = repo['fullname'].partition('/')
+        self.owner = sys.intern(owner)
+        self.name = repo['name']
+        self.stars = repo.get('stars')
+        self.updated_at = repo.get('updated_at')
+        # Only the URLs that differ from the github.com one are stored
+        url = repo['url']
+        self._url = None if url == GITHUB_URL + repo['fullname'] else url
+        self._descriptions = descriptions
+        self._index = index
+
+    @property
+    def fullname(self):
+        return "{}/{}".format(self.owner, self.name)
+
+    @property
+    def url(self):
+        return self._url or GITHUB_URL + self.fullname
+
+    @property
+    def description(self):
+        return self._descriptions[self._index] or None
+
+
+class OrgRepoRecord(RepoRecord):
+    """ A cached repository of an organization of the user """
+
+    __slots__ = ('org', )
+
+    FIELDS = RepoRecord.FIELDS + ('org', )
+
+    def __init__(self, repo, descriptions, index):
+        super(OrgRepoRecord, self).__init__(repo, descriptions, index)
+        self.org = sys.intern(repo['org'])
+
+
+def pack_records(record_type, items):
+    """
+    Converts the items of a collection to records sharing a single
+    description table. Items that already are records are repacked.
+    """
+    descriptions = StringTable(item['description'] for item in items)
+    return [
+        record_type(item, descriptions, i) for i, item in enumerate(items)
+    ]
+
+
+def unpack_records(items):
+    """ Converts records back to dicts, e.g. to save them as JSON """
+    return [
+        item.to_dict() if isinstance(item, Record) else item for item in items
+    ]
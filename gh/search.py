@@ -0,0 +1,473 @@
+"""
+Ranked fuzzy search over the locally cached collections (repos, stars, gists).
+"""
+import bisect
+import heapq
+import math
+import re
+from collections import Counter
+
+WORD_SEPARATORS = re.compile(r'[^a-z0-9]+')
+
+# Match tiers. Results are ranked by tier before their score, so a better
+# kind of match always ranks above a more popular item.
+TIER_WORD_PREFIX = 3
+TIER_SUBSTRING = 2
+TIER_FUZZY = 1
+
+STARS_WEIGHT = 0.6
+RECENCY_WEIGHT = 0.4
+
+# Word prefixes up to this length are indexed directly.
+PREFIX_LENGTH = 3
+
+# Fuzzy matches are shortlisted by match span before being fully scored.
+FUZZY_SHORTLIST_FACTOR = 4
+
+
+def _trigrams(text):
+    """ Returns the set of trigrams of a string """
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _char_mask(text):
+    """ Returns a bitmask of the characters present in the text """
+    mask = 0
+    for char in set(text):
+        mask |= 1 << (ord(char) & 63)
+    return mask
+
+
+def _starts_word(term, key):
+    """ Checks if the term occurs in the key at the start of a word """
+    pos = key.find(term)
+    while pos > 0 and WORD_SEPARATORS.match(key, pos - 1) is None:
+        pos = key.find(term, pos + 1)
+    return pos != -1
+
+
+def _acronym_pattern(chars):
+    """
+    Matches the characters as a subsequence starting at a word boundary,
+    e.g. `ulgh` on `ulauncher-github`. Every character is matched at its
+    first occurrence on the line, like a lazy `.*?` would, but a key that
+    doesn't match fails without backtracking. The word boundary is checked
+    after the first character, so the engine can skip ahead to it.
+    """
+    first = re.escape(chars[0])
+    pattern = r'{}(?<=(?<![a-z0-9]){})'.format(first, first)
+    for char in chars[1:]:
+        char = re.escape(char)
+        pattern += r'[^{}\n]*{}'.format(char, char)
+    return re.compile(pattern)
+
+
+def _find_word_start(key, char, pos):
+    """ Finds the next occurrence of char at the start of a word """
+    pos = key.find(char, pos)
+    while pos > 0 and key[pos - 1].isalnum():
+        pos = key.find(char, pos + 1)
+    return pos
+
+
+def fuzzy_score(term, key):
+    """
+    Scores a fuzzy match of term inside key, between 0 and 1.
+    Each piece of the term (split on separators) prefers to start at a word
+    boundary and to match consecutive characters, so `ul-gh` scores higher on
+    `ulauncher-github` than on `lib-go-ulauncher`.
+    Returns None when term is not a subsequence of key.
+    """
+    pieces = [piece for piece in WORD_SEPARATORS.split(term) if piece]
+    if not pieces:
+        return None
+
+    pos = 0
+    word_starts = 0
+    prefix_chars = 0
+    for piece in pieces:
+        start = _find_word_start(key, piece[0], pos)
+        if start == -1:
+            start = key.find(piece[0], pos)
+            if start == -1:
+                return None
+        else:
+            word_starts += 1
+
+        run = 1
+        while run < len(piece) and key.startswith(piece[run], start + run):
+            run += 1
+        prefix_chars += run
+
+        pos = start + run
+        for char in piece[run:]:
+            pos = key.find(char, pos)
+            if pos == -1:
+                return None
+            pos += 1
+
+    total_chars = sum(len(piece) for piece in pieces)
+    return (0.5 * word_starts / len(pieces) +
+            0.4 * prefix_chars / total_chars + 0.1 * (1 - pos / len(key)))
+
+
+class SearchIndex(object):
+    """
+    Immutable search index built over a list of (search_key, item) entries.
+
+    Candidates are found with a trigram index (substring matches), an index
+    of the words and of their first characters (word prefix matches) and
+    character masks (fuzzy matches). Results are ranked by match quality,
+    then stars and recency, and the top ones are taken from a heap.
+    """
+
+    def __init__(self, entries, stars_field='stars',
+                 updated_field='updated_at'):
+        """
+        Args:
+          entries (list): (search_key, item) pairs, most recently updated first
+          stars_field (str): The item field holding the number of stars
+          updated_field (str): The item field holding the last update date
+        """
+        self.items = [item for _, item in entries]
+        self.keys = [key for key, _ in entries]
+        self.lengths = [len(key) or 1 for key in self.keys]
+        self.masks = [_char_mask(key) for key in self.keys]
+        self.priors = self._build_priors(stars_field, updated_field)
+        self.trigrams = {}
+        self.prefixes = {}
+        self.words = {}
+
+        trigrams = self.trigrams
+        prefixes = self.prefixes
+        words = self.words
+        for i, key in enumerate(self.keys):
+            for trigram in _trigrams(key):
+                posting = trigrams.get(trigram)
+                if posting is None:
+                    trigrams[trigram] = [i]
+                else:
+                    posting.append(i)
+
+            key_words = set(WORD_SEPARATORS.split(key))
+            key_words.discard('')
+            word_prefixes = set()
+            for word in key_words:
+                for size in range(1, min(len(word), PREFIX_LENGTH) + 1):
+                    word_prefixes.add(word[:size])
+                posting = words.get(word)
+                if posting is None:
+                    words[word] = [i]
+                else:
+                    posting.append(i)
+            for prefix in word_prefixes:
+                posting = prefixes.get(prefix)
+                if posting is None:
+                    prefixes[prefix] = [i]
+                else:
+                    posting.append(i)
+
+        self.vocabulary = sorted(words)
+
+    @classmethod
+    def from_parts(cls, items, keys, lengths, masks, priors, trigrams,
+                   prefixes, words, vocabulary):
+        """
+        Creates an index from prebuilt parts, e.g. the sequences of a mapped
+        snapshot. The term maps only need to support `get`, and the
+        vocabulary is the sorted sequence of the words.
+        """
+        index = cls.__new__(cls)
+        index.items = items
+        index.keys = keys
+        index.lengths = lengths
+        index.masks = masks
+        index.priors = priors
+        index.trigrams = trigrams
+        index.prefixes = prefixes
+        index.words = words
+        index.vocabulary = vocabulary
+        return index
+
+    def with_items(self, items):
+        """
+        Returns a copy of the index holding other items in the same order,
+        e.g. the compact records of its items.
+        """
+        return self.from_parts(items, self.keys, self.lengths, self.masks,
+                               self.priors, self.trigrams, self.prefixes,
+                               self.words, self.vocabulary)
+
+    def __len__(self):
+        return len(self.items)
+
+    def _build_priors(self, stars_field, updated_field):
+        """ Computes a static popularity score, between 0 and 1, per item """
+        total = len(self.items)
+        if not total:
+            return []
+
+        stars = [math.log1p(item.get(stars_field) or 0) for item in self.items]
+        max_stars = max(stars) or 1
+
+        # ISO 8601 dates sort lexicographically, so the recency of an item is
+        # its rank among all the dates. Items without a date are stored most
+        # recently updated first, so their position is used instead.
+        dates = [item.get(updated_field) for item in self.items]
+        if all(dates):
+            order = sorted(range(total), key=dates.__getitem__)
+            recency = [0.0] * total
+            for rank, i in enumerate(order):
+                recency[i] = (rank + 1) / total
+        else:
+            recency = [1 - i / total for i in range(total)]
+
+        return [
+            0.99 * (STARS_WEIGHT * stars[i] / max_stars +
+                    RECENCY_WEIGHT * recency[i]) for i in range(total)
+        ]
+
+    def _substring_candidates(self, term):
+        """ Returns the ids of the items whose key contains the term """
+        keys = self.keys
+        if len(term) < 3:
+            return [i for i, key in enumerate(keys) if term in key]
+
+        postings = sorted((self.trigrams.get(t, ()) for t in _trigrams(term)),
+                          key=len)
+        ids = postings[0]
+        if len(postings) > 1 and ids:
+            ids = set(ids)
+            for posting in postings[1:]:
+                ids.intersection_update(posting)
+                if not ids:
+                    return []
+
+        return [i for i in ids if term in keys[i]]
+
+    def _words_starting_with(self, prefix):
+        """ Returns the ids of the items with a word starting with the prefix """
+        if len(prefix) <= PREFIX_LENGTH:
+            return self.prefixes.get(prefix, [])
+
+        vocabulary = self.vocabulary
+        postings = []
+        for j in range(bisect.bisect_left(vocabulary, prefix),
+                       len(vocabulary)):
+            word = vocabulary[j]
+            if not word.startswith(prefix):
+                break
+            postings.append(self.words.get(word))
+
+        if len(postings) == 1:
+            return postings[0]
+        return sorted(set().union(*postings))
+
+    def _word_prefix_candidates(self, term):
+        """
+        Returns the ids of the items with a word starting with the term.
+        A term spanning several words, like `owner/na`, starts with whole
+        words, so its candidates are the items having all of them and a word
+        starting with its last one, which are then checked in order.
+        """
+        words = WORD_SEPARATORS.split(term)
+        if len(words) == 1:
+            return self._words_starting_with(term)
+
+        keys = self.keys
+        if not words[0]:
+            # Only a separator preceded by another one starts the term
+            pattern = re.compile(r'[^a-z0-9]{}'.format(re.escape(term)))
+            return [
+                i for i in self._substring_candidates(term)
+                if keys[i].startswith(term) or pattern.search(keys[i])
+            ]
+
+        postings = [self.words.get(word, ()) for word in words[:-1]]
+        if words[-1]:
+            postings.append(self._words_starting_with(words[-1]))
+        postings.sort(key=len)
+        ids = set(postings[0])
+        for posting in postings[1:]:
+            if not ids:
+                break
+            ids.intersection_update(posting)
+
+        return sorted(i for i in ids if _starts_word(term, keys[i]))
+
+    def _fuzzy_candidates(self, term, exclude, limit):
+        """
+        Returns the ids of the items fuzzy matching the term.
+        The first character of the term must start a word, and the matches
+        with the tightest span are shortlisted to be scored.
+        """
+        chars = WORD_SEPARATORS.sub('', term)
+        if not chars:
+            return []
+
+        pattern = _acronym_pattern(chars)
+        query_mask = _char_mask(chars)
+        keys = self.keys
+        masks = self.masks
+        spans = {}
+        for i in self.prefixes.get(chars[0], ()):
+            if masks[i] & query_mask != query_mask or i in exclude:
+                continue
+            match = pattern.search(keys[i])
+            if match:
+                spans[i] = match.end() - match.start()
+
+        lengths = self.lengths
+        priors = self.priors
+        return heapq.nlargest(
+            limit * FUZZY_SHORTLIST_FACTOR, spans,
+            key=lambda i: priors[i] - spans[i] / lengths[i])
+
+    def _term_score(self, term, key):
+        """
+        Scores a single query term against an item key.
+        Returns the tier of the match and its score within the tier.
+        """
+        pos = key.find(term)
+        if pos == -1:
+            quality = fuzzy_score(term, key)
+            if quality is None:
+                return None
+            return TIER_FUZZY, quality
+
+        bonus = len(term) / len(key)
+        while pos != -1:
+            if pos == 0 or not key[pos - 1].isalnum():
+                return TIER_WORD_PREFIX, bonus
+            pos = key.find(term, pos + 1)
+
+        return TIER_SUBSTRING, bonus
+
+    def _search_term(self, term, limit):
+        """
+        Single term search. Tiers are filled best first, and each tier is
+        ranked with a heap, so only the items of the tiers that can reach the
+        top results are scored.
+        """
+        priors = self.priors
+        lengths = self.lengths
+        size = len(term)
+
+        def rank_exact(i):
+            return priors[i] + size / lengths[i]
+
+        prefix_ids = self._word_prefix_candidates(term)
+        results = heapq.nlargest(limit, prefix_ids, key=rank_exact)
+        if len(results) >= limit:
+            return results
+
+        substring = set(self._substring_candidates(term))
+        inner_ids = substring.difference(prefix_ids)
+        results += heapq.nlargest(limit - len(results), inner_ids,
+                                  key=rank_exact)
+
+        if len(results) < limit:
+            keys = self.keys
+            fuzzy_ids = self._fuzzy_candidates(term, substring,
+                                               limit - len(results))
+            scored = []
+            for i in fuzzy_ids:
+                quality = fuzzy_score(term, keys[i])
+                if quality is not None:
+                    scored.append((quality + priors[i], -i))
+            results += [-i for _, i in
+                        heapq.nlargest(limit - len(results), scored)]
+
+        return results
+
+    def _search_terms(self, terms, limit):
+        """
+        Multiple term search. Every term must match each result.
+        Results are ranked by their worst tier over the terms, then by the
+        sum of their tiers, then by score, so an item containing every term
+        always ranks above a fuzzy match.
+
+        The items containing every term only differ by the number of terms
+        starting a word, so they are grouped by that number, best first, and
+        only the groups that can reach the top results are ranked. Fuzzy
+        matches are only searched when there are not enough of those.
+        """
+        keys = self.keys
+        longest = max(terms, key=len)
+        candidates = self._substring_candidates(longest)
+        for term in terms:
+            if term is not longest:
+                candidates = [i for i in candidates if term in keys[i]]
+
+        word_starts = Counter()
+        for term in terms:
+            word_starts.update(self._word_prefix_candidates(term))
+
+        groups = [[] for _ in range(len(terms) + 1)]
+        for i in candidates:
+            groups[word_starts[i]].append(i)
+
+        priors = self.priors
+        lengths = self.lengths
+        size = sum(len(term) for term in terms)
+
+        def rank_exact(i):
+            return priors[i] + size / lengths[i], -i
+
+        results = []
+        for ids in reversed(groups):
+            if len(results) >= limit:
+                break
+            results += heapq.nlargest(limit - len(results), ids,
+                                      key=rank_exact)
+
+        if len(results) < limit:
+            fuzzy_ids = self._fuzzy_candidates("".join(terms),
+                                               set(candidates),
+                                               limit - len(results))
+            scored = self._score_terms(terms, fuzzy_ids)
+            results += [
+                -i for _, i in heapq.nlargest(limit - len(results), scored)
+            ]
+
+        return results
+
+    def _score_terms(self, terms, ids):
+        """
+        Returns the ((worst tier, sum of tiers, score), -id) of the items
+        matching every term
+        """
+        keys = self.keys
+        priors = self.priors
+        scored = []
+        for i in ids:
+            worst = TIER_WORD_PREFIX
+            tiers = 0
+            total = priors[i]
+            for term in terms:
+                match = self._term_score(term, keys[i])
+                if match is None:
+                    break
+                tier, score = match
+                worst = min(worst, tier)
+                tiers += tier
+                total += score
+            else:
+                scored.append(((worst, tiers, total), -i))
+        return scored
+
+    def search(self, query, limit):
+        """
+        Returns the best `limit` items matching the query.
+        An empty query returns the items in their stored order.
+        """
+        terms = query.lower().split()
+        if not terms:
+            return self.items[:limit]
+
+        if len(terms) == 1:
+            ids = self._search_term(terms[0], limit)
+        else:
+            ids = self._search_terms(terms, limit)
+
+        return [self.items[i] for i in ids]
@@ -0,0 +1,354 @@
+"""
+Versioned binary snapshots of the cached collections and their search index.
+
+A snapshot is written next to the JSON file of a collection every time the
+collection is stored, and opened with mmap, so a cold start doesn't parse
+nor index anything and the pages are shared read-only. Items are decoded
+from their columns when they are accessed, and only the search keys, which
+queries scan, are decoded when the snapshot is opened.
+
+Layout:
+
+    magic (8 bytes) | version (uint32) | header size (uint32) | header | sections
+
+The header is JSON and describes the columns and the offset and size of
+every section, relative to the first section. Sections are arrays in the
+native byte order, aligned on 8 bytes:
+
+    strings.offsets, strings.data    deduplicated UTF-8 string table
+    column.<field>                   string ids (uint32) or integers (int64)
+    keys, lengths, masks, priors     the per item arrays of the search index
+    <map>.terms, <map>.offsets,      sorted term string ids, and the ids of
+    <map>.postings                   the items of each term (trigrams,
+                                     prefixes, words)
+"""
+import bisect
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+from gh.search import SearchIndex
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'GHSNAP\x00\x00'
+SNAPSHOT_VERSION = 2
+SNAPSHOT_EXTENSION = '.snapshot'
+
+PREFIX = struct.Struct('<8sII')
+ALIGNMENT = 8
+
+NONE_ID = 0xFFFFFFFF
+NONE_INT = -2**63
+
+COLUMN_FORMATS = {'str': 'I', 'json': 'I', 'int': 'q'}
+
+
+def snapshot_path(path):
+    """ Returns the path of the snapshot of a JSON cache file """
+    return os.path.splitext(path)[0] + SNAPSHOT_EXTENSION
+
+
+class StringTableBuilder(object):
+    """ Collects the distinct strings of a snapshot """
+
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def add(self, string):
+        if string is None:
+            return NONE_ID
+        string_id = self.ids.get(string)
+        if string_id is None:
+            string_id = self.ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+    def sections(self):
+        offsets = array('Q', [0])
+        data = bytearray()
+        for string in self.strings:
+            data += string.encode('utf-8')
+            offsets.append(len(data))
+        return {'strings.offsets': offsets.tobytes(), 'strings.data': data}
+
+
+def _column_type(values):
+    if all(v is None or (isinstance(v, int) and not isinstance(v, bool))
+           for v in values):
+        return 'int'
+    if all(v is None or isinstance(v, str) for v in values):
+        return 'str'
+    return 'json'
+
+
+def _term_map_sections(name, term_map, strings):
+    """ Stores the terms sorted, so they can be found with a binary search """
+    terms = array('I')
+    offsets = array('I', [0])
+    postings = array('I')
+    for term in sorted(term_map):
+        terms.append(strings.add(term))
+        postings.extend(term_map[term])
+        offsets.append(len(postings))
+    return {
+        name + '.terms': terms.tobytes(),
+        name + '.offsets': offsets.tobytes(),
+        name + '.postings': postings.tobytes()
+    }
+
+
+def write_snapshot(path, index, signature):
+    """
+    Writes the items and the search index of a collection to a snapshot.
+
+    Args:
+      path (str): The path of the snapshot
+      index (SearchIndex): The in-memory index of the collection, over dicts
+      signature (tuple): The signature of the JSON file of the collection
+    """
+    items = index.items
+    fields = []
+    for item in items:
+        fields.extend(field for field in item if field not in fields)
+
+    strings = StringTableBuilder()
+    sections = {}
+    columns = []
+    for field in fields:
+        values = [item.get(field) for item in items]
+        column_type = _column_type(values)
+        if column_type == 'int':
+            column = array('q', (NONE_INT if v is None else v
+                                 for v in values))
+        elif column_type == 'str':
+            column = array('I', (strings.add(v) for v in values))
+        else:
+            column = array('I', (strings.add(json.dumps(v)) for v in values))
+        columns.append([field, column_type])
+        sections['column.' + field] = column.tobytes()
+
+    sections['keys'] = array('I', map(strings.add, index.keys)).tobytes()
+    sections['lengths'] = array('I', index.lengths).tobytes()
+    sections['masks'] = array('Q', index.masks).tobytes()
+    sections['priors'] = array('d', index.priors).tobytes()
+    sections.update(_term_map_sections('trigrams', index.trigrams, strings))
+    sections.update(_term_map_sections('prefixes', index.prefixes, strings))
+    sections.update(_term_map_sections('words', index.words, strings))
+    sections.update(strings.sections())
+
+    layout = {}
+    offset = 0
+    for name, data in sections.items():
+        layout[name] = [offset, len(data)]
+        offset += len(data) + (-len(data) % ALIGNMENT)
+
+    header = json.dumps({
+        'count': len(items),
+        'signature': list(signature),
+        'byteorder': sys.byteorder,
+        'columns': columns,
+        'sections': layout
+    }).encode('utf-8')
+    header += b' ' * (-(PREFIX.size + len(header)) % ALIGNMENT)
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                    suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(PREFIX.pack(MAGIC, SNAPSHOT_VERSION, len(header)))
+            f.write(header)
+            for data in sections.values():
+                f.write(data)
+                f.write(b'\x00' * (-len(data) % ALIGNMENT))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class StringTable(object):
+    """ The string table of a mapped snapshot """
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __getitem__(self, string_id):
+        return str(self.data[self.offsets[string_id]:
+                             self.offsets[string_id + 1]], 'utf-8')
+
+    def decode(self, string_ids):
+        """
+        Decodes many strings at once, much faster than one by one: the span
+        of the table holding them is copied once, and sliced directly when
+        it is ASCII.
+        """
+        string_ids = string_ids.tolist()
+        if not string_ids:
+            return []
+
+        first = min(string_ids)
+        offsets = self.offsets[first:max(string_ids) + 2].tolist()
+        start = offsets[0]
+        data = bytes(self.data[start:offsets[-1]])
+        if data.isascii():
+            text = data.decode('ascii')
+            return [
+                text[offsets[i - first] - start:offsets[i - first + 1] - start]
+                for i in string_ids
+            ]
+        return [
+            str(data[offsets[i - first] - start:
+                     offsets[i - first + 1] - start], 'utf-8')
+            for i in string_ids
+        ]
+
+
+class StringColumn(object):
+    """ A sequence of strings stored as ids in the string table """
+
+    def __init__(self, ids, strings):
+        self.ids = ids
+        self.strings = strings
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        string_id = self.ids[i]
+        return None if string_id == NONE_ID else self.strings[string_id]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self.ids)))
+
+
+class JsonColumn(StringColumn):
+    """ A sequence of values of mixed types, stored as JSON strings """
+
+    def __getitem__(self, i):
+        value = super(JsonColumn, self).__getitem__(i)
+        return None if value is None else json.loads(value)
+
+
+class IntColumn(object):
+    """ A sequence of integers, None included """
+
+    def __init__(self, values):
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        value = self.values[i]
+        return None if value == NONE_INT else value
+
+
+class TermMap(object):
+    """ Maps the sorted terms of an index to the ids of their items """
+
+    def __init__(self, terms, offsets, postings):
+        self.terms = terms
+        self.offsets = offsets
+        self.postings = postings
+
+    def get(self, term, default=None):
+        i = bisect.bisect_left(self.terms, term)
+        if i == len(self.terms) or self.terms[i] != term:
+            return default
+        return self.postings[self.offsets[i]:self.offsets[i + 1]]
+
+
+class SnapshotItems(object):
+    """ The items of a mapped snapshot, decoded as dicts on access """
+
+    def __init__(self, columns, count):
+        self.columns = columns
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def _item(self, i):
+        return {field: column[i] for field, column in self.columns}
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._item(j) for j in range(*i.indices(self.count))]
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return self._item(i)
+
+    def __iter__(self):
+        return (self._item(i) for i in range(self.count))
+
+
+def _read_header(mapped):
+    magic, version, header_size = PREFIX.unpack_from(mapped)
+    if magic != MAGIC or version != SNAPSHOT_VERSION:
+        return None, 0
+    start = PREFIX.size + header_size
+    return json.loads(mapped[PREFIX.size:start].decode('utf-8')), start
+
+
+def open_snapshot(path, signature):
+    """
+    Maps the snapshot of a collection and returns its search index.
+    Returns None when the snapshot is missing, of another version, or
+    wasn't built from the JSON file with the given signature.
+    """
+    try:
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        header, start = _read_header(mapped)
+        if header is None or header['signature'] != list(signature or ()) \
+                or header['byteorder'] != sys.byteorder:
+            return None
+
+        view = memoryview(mapped)
+
+        def section(name, fmt):
+            offset, size = header['sections'][name]
+            return view[start + offset:start + offset + size].cast(fmt)
+
+        strings = StringTable(section('strings.offsets', 'Q'),
+                              section('strings.data', 'B'))
+
+        columns = []
+        for field, column_type in header['columns']:
+            values = section('column.' + field, COLUMN_FORMATS[column_type])
+            if column_type == 'int':
+                columns.append((field, IntColumn(values)))
+            elif column_type == 'str':
+                columns.append((field, StringColumn(values, strings)))
+            else:
+                columns.append((field, JsonColumn(values, strings)))
+
+        def term_map(name):
+            return TermMap(StringColumn(section(name + '.terms', 'I'), strings),
+                           section(name + '.offsets', 'I'),
+                           section(name + '.postings', 'I'))
+
+        words = term_map('words')
+        return SearchIndex.from_parts(
+            SnapshotItems(columns, header['count']),
+            strings.decode(section('keys', 'I')),
+            section('lengths', 'I'), section('masks', 'Q'),
+            section('priors', 'd'), term_map('trigrams'),
+            term_map('prefixes'), words, words.terms)
+    except (KeyError, TypeError, ValueError, struct.error) as e:
+        logger.error("Invalid cache snapshot %s: %s", path, e)
+        return None
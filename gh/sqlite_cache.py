@@ -0,0 +1,422 @@
+"""
+SQLite storage backend for the local cache.
+It exposes the same interface as `gh.cache.Cache`, but items are upserted one
+by one and searches are answered straight from an FTS5 index, so memory stays
+flat regardless of the size of the collections.
+"""
+import copy
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DATABASE_FILE = 'github_cache.db'
+
+TOKEN = re.compile(r'[a-z0-9]+')
+
+# Streamed items are placed this far before the existing items, so the
+# pages of a stream stay in order while preceding the items not streamed yet.
+STREAM_POSITIONS = 2**32
+
+# The upsert clause (INSERT ... ON CONFLICT DO UPDATE) needs SQLite 3.24
+UPSERT = sqlite3.sqlite_version_info >= (3, 24, 0)
+
+
+class SqliteCollection(object):
+    """ A cached collection stored in a SQLite table with an FTS5 index """
+
+    def __init__(self, cache, table, key_field, fields, text_fields, weights):
+        """
+        Args:
+          cache (SqliteCache): The cache owning the database connections
+          table (str): The table name
+          key_field (str): The field identifying an item
+          fields (tuple): All the stored fields
+          text_fields (tuple): The fields indexed for full text search
+          weights (tuple): The bm25 weight of each text field
+        """
+        self.cache = cache
+        self.table = table
+        self.key_field = key_field
+        self.fields = fields
+        self.text_fields = text_fields
+        self.weights = weights
+        self.fts_table = '{}_fts'.format(table)
+        self.scope = None
+
+    def scoped(self, field, value):
+        """ Returns a view of the items whose field equals the value, ignoring case """
+        view = copy.copy(self)
+        view.scope = (field, value)
+        return view
+
+    def create(self, db, fts5):
+        """ Creates the table, and its FTS5 index kept in sync by triggers """
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS {} ({}, position REAL, UNIQUE({}))".
+            format(self.table, ", ".join(self.fields), self.key_field))
+        db.execute("CREATE INDEX IF NOT EXISTS {0}_position ON {0}(position)".
+                   format(self.table))
+        if not fts5:
+            return
+
+        columns = ", ".join(self.text_fields)
+        new_values = ", ".join("new." + f for f in self.text_fields)
+        old_values = ", ".join("old." + f for f in self.text_fields)
+        db.executescript("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {columns}, content='{table}', content_rowid='rowid');
+            CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts}(rowid, {columns}) VALUES (new.rowid, {new});
+            END;
+            CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {columns})
+                VALUES ('delete', old.rowid, {old});
+            END;
+            CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {columns})
+                VALUES ('delete', old.rowid, {old});
+                INSERT INTO {fts}(rowid, {columns}) VALUES (new.rowid, {new});
+            END;
+        """.format(fts=self.fts_table, table=self.table, columns=columns,
+                   new=new_values, old=old_values))
+
+    def _upsert(self, db, items, first_position):
+        """
+        Inserts or updates the items, keeping their order.
+        Without the upsert clause, the existing rows are updated before the
+        other ones are inserted. INSERT OR REPLACE isn't used, as the rows
+        it deletes don't fire the triggers keeping the FTS5 index in sync.
+        """
+        fields = self.fields + ('position', )
+        columns = ", ".join(fields)
+        placeholders = ", ".join("?" for _ in fields)
+        rows = [
+            tuple(item.get(f) for f in self.fields) + (first_position + i, )
+            for i, item in enumerate(items)
+        ]
+
+        if UPSERT:
+            updates = ", ".join("{0}=excluded.{0}".format(f) for f in fields)
+            db.executemany(
+                "INSERT INTO {} ({}) VALUES ({}) "
+                "ON CONFLICT({}) DO UPDATE SET {}".format(
+                    self.table, columns, placeholders, self.key_field,
+                    updates), rows)
+            return
+
+        key = self.fields.index(self.key_field)
+        db.executemany(
+            "UPDATE {} SET {} WHERE {} = ?".format(
+                self.table, ", ".join("{}=?".format(f) for f in fields),
+                self.key_field), [row + (row[key], ) for row in rows])
+        db.executemany(
+            "INSERT OR IGNORE INTO {} ({}) VALUES ({})".format(
+                self.table, columns, placeholders), rows)
+
+    def store(self, data):
+        """ Replaces the whole collection """
+        with self.cache.transaction() as db:
+            keys = [(item[self.key_field], ) for item in data]
+            db.execute("CREATE TEMP TABLE IF NOT EXISTS kept (key PRIMARY KEY)")
+            db.execute("DELETE FROM kept")
+            db.executemany("INSERT OR IGNORE INTO kept VALUES (?)", keys)
+            db.execute("DELETE FROM {} WHERE {} NOT IN (SELECT key FROM kept)".
+                       format(self.table, self.key_field))
+            self._upsert(db, data, 0)
+
+    def merge(self, data, removed=()):
+        """
+        Upserts changed items, placing them before the existing ones.
+        The items with a key in `removed` are deleted.
+        """
+        with self.cache.transaction() as db:
+            db.executemany(
+                "DELETE FROM {} WHERE {} = ?".format(self.table,
+                                                     self.key_field),
+                [(key, ) for key in removed])
+            first = db.execute("SELECT MIN(position) FROM {}".format(
+                self.table)).fetchone()[0] or 0
+            self._upsert(db, data, first - len(data))
+
+    def stream(self, replace=False):
+        """ Returns a stream upserting the pages of a sync into the table """
+        return SqliteCollectionStream(self, replace)
+
+    def _where(self, conditions, params):
+        """ Builds the WHERE clause of the conditions and of the scope """
+        if self.scope is not None:
+            conditions = conditions + ("t.{} = ? COLLATE NOCASE".format(
+                self.scope[0]), )
+            params = params + (self.scope[1], )
+        if not conditions:
+            return "", params
+        return "WHERE " + " AND ".join(conditions), params
+
+    def __len__(self):
+        where, params = self._where((), ())
+        return self.cache.connection().execute(
+            "SELECT COUNT(*) FROM {} t {}".format(self.table, where),
+            params).fetchone()[0]
+
+    def _select(self, join="", conditions=(), order="t.position", params=(),
+                limit=None):
+        """ Runs a select over the table and returns the rows as dicts """
+        columns = ", ".join("t." + f for f in self.fields)
+        where, params = self._where(conditions, params)
+        rows = self.cache.connection().execute(
+            "SELECT {} FROM {} t {} {} ORDER BY {} LIMIT ?".format(
+                columns, self.table, join, where, order), params + (limit, ))
+        return [dict(zip(self.fields, row)) for row in rows]
+
+    def _fts_search(self, tokens, limit):
+        """ Searches the FTS5 index, every token being a prefix """
+        match = " ".join('"{}"*'.format(token) for token in tokens)
+        weights = ", ".join(str(w) for w in self.weights)
+        return self._select(
+            "JOIN {0} ON {0}.rowid = t.rowid".format(self.fts_table),
+            ("{} MATCH ?".format(self.fts_table), ),
+            "bm25({}, {}), t.position".format(self.fts_table, weights),
+            (match, ), limit)
+
+    def _like_search(self, tokens, limit):
+        """
+        Matches the tokens as a subsequence of the first text field,
+        e.g. `ul-gh` becomes `%u%l%g%h%` and matches `ulauncher-github`.
+        """
+        pattern = "%" + "%".join("".join(tokens)) + "%"
+        return self._select(
+            conditions=("t.{} LIKE ?".format(self.text_fields[0]), ),
+            params=(pattern, ), limit=limit)
+
+    def search(self, query, limit):
+        """
+        Returns the best `limit` items matching the query.
+        An empty query returns the items in their stored order.
+        """
+        tokens = TOKEN.findall(query.lower())
+        if not tokens:
+            return self._select(limit=limit)
+
+        results = []
+        if self.cache.fts5:
+            results = self._fts_search(tokens, limit)
+        return results or self._like_search(tokens, limit)
+
+
+class SqliteCollectionStream(object):
+    """
+    Upserts the pages of a sync into a table as they arrive, so they are
+    searchable right away. With `replace`, the keys of the streamed items
+    are kept in a temporary table, and the rows that weren't streamed are
+    deleted once the stream is closed.
+    """
+
+    def __init__(self, collection, replace=False):
+        self.collection = collection
+        self.replace = replace
+        self.streamed_table = 'streamed_{}'.format(collection.table)
+        with collection.cache.transaction() as db:
+            first = db.execute("SELECT MIN(position) FROM {}".format(
+                collection.table)).fetchone()[0] or 0
+            self.position = first - STREAM_POSITIONS
+            if replace:
+                db.execute(
+                    "CREATE TEMP TABLE IF NOT EXISTS {} (key PRIMARY KEY)".
+                    format(self.streamed_table))
+                db.execute("DELETE FROM {}".format(self.streamed_table))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # The pages upserted before an error are kept, nothing is dropped
+        if exc_type is None:
+            self.close()
+
+    def add(self, items):
+        """ Upserts the items of a page """
+        collection = self.collection
+        with collection.cache.transaction() as db:
+            collection._upsert(db, items, self.position)
+            if self.replace:
+                db.executemany(
+                    "INSERT OR IGNORE INTO {} VALUES (?)".format(
+                        self.streamed_table),
+                    [(item[collection.key_field], ) for item in items])
+        self.position += len(items)
+
+    def close(self):
+        """ Deletes the rows that weren't streamed """
+        if not self.replace:
+            return
+
+        collection = self.collection
+        with collection.cache.transaction() as db:
+            db.execute(
+                "DELETE FROM {} WHERE {} NOT IN (SELECT key FROM {})".format(
+                    collection.table, collection.key_field,
+                    self.streamed_table))
+            db.execute("DELETE FROM {}".format(self.streamed_table))
+
+
+class SqliteCache(object):
+    """ Cache backed by a single SQLite database """
+
+    def __init__(self, cache_dir):
+        """ Class constructor"""
+        self.database_file = os.path.join(cache_dir, DATABASE_FILE)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+        repo_fields = ('fullname', 'name', 'description', 'url', 'stars',
+                       'updated_at')
+        self.repos = SqliteCollection(self, 'repos', 'fullname', repo_fields,
+                                      ('name', 'fullname', 'description'),
+                                      (10.0, 5.0, 1.0))
+        self.starred_repos = SqliteCollection(
+            self, 'starred', 'fullname', repo_fields,
+            ('name', 'fullname', 'description'), (10.0, 5.0, 1.0))
+        self.gists = SqliteCollection(
+            self, 'gists', 'url',
+            ('url', 'filename', 'description', 'updated_at'),
+            ('filename', 'description'), (5.0, 1.0))
+        self.orgs = SqliteCollection(self, 'orgs', 'login',
+                                     ('login', 'name', 'description', 'url'),
+                                     ('login', 'name'), (5.0, 5.0))
+        self.org_repos = SqliteCollection(
+            self, 'org_repos', 'fullname', repo_fields + ('org', ),
+            ('name', 'fullname', 'description'), (10.0, 5.0, 1.0))
+        self.issues = SqliteCollection(
+            self, 'issues', 'id',
+            ('id', 'filter', 'title', 'repository', 'number', 'state',
+             'labels', 'url', 'updated_at'),
+            ('title', 'repository', 'labels'), (10.0, 2.0, 1.0))
+
+        self.fts5 = True
+        db = self.connection()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS sync_state (data TEXT)")
+        for collection in (self.repos, self.starred_repos, self.gists,
+                           self.orgs, self.org_repos, self.issues):
+            try:
+                collection.create(db, self.fts5)
+            except sqlite3.OperationalError as e:
+                logger.warning("FTS5 is not available, using LIKE: %s", e)
+                self.fts5 = False
+                collection.create(db, self.fts5)
+        db.commit()
+
+    def connection(self):
+        """ Returns the database connection of the current thread """
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.database_file, timeout=30)
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def transaction(self):
+        """ Serializes writers, and commits or rolls back on exit """
+        db = self.connection()
+        with self._write_lock:
+            try:
+                yield db
+            except Exception:
+                db.rollback()
+                raise
+            db.commit()
+
+    def store_repos_cache(self, data=[]):
+        self.repos.store(data)
+
+    def store_gists_cache(self, data=[]):
+        self.gists.store(data)
+
+    def store_starred_repos(self, data=[]):
+        """ Save starred repos in the cache"""
+        self.starred_repos.store(data)
+
+    def store_orgs_cache(self, data=[]):
+        """ Save the organizations of the user in the cache """
+        self.orgs.store(data)
+
+    def store_org_repos_cache(self, data=[]):
+        """ Save the repos of the organizations of the user in the cache """
+        self.org_repos.store(data)
+
+    def store_issues_cache(self, data=[]):
+        """ Save the open issues and pull requests of the user in the cache """
+        self.issues.store(data)
+
+    def merge_repos_cache(self, data):
+        """ Merge changed repos into the cache """
+        self.repos.merge(data)
+
+    def merge_gists_cache(self, data):
+        """ Merge changed gists into the cache """
+        self.gists.merge(data)
+
+    def merge_starred_repos(self, data):
+        """ Merge new starred repos into the cache """
+        self.starred_repos.merge(data)
+
+    def get_repos(self) -> SqliteCollection:
+        """ Returns the searchable cached repos """
+        return self.repos
+
+    def get_gists(self) -> SqliteCollection:
+        """ Returns the searchable cached gists """
+        return self.gists
+
+    def get_starred_repos(self) -> SqliteCollection:
+        """ Returns the searchable cached starred repos """
+        return self.starred_repos
+
+    def merge_issues_cache(self, data, closed=()):
+        """ Merge changed issues into the cache, dropping the closed ones """
+        self.issues.merge(data, closed)
+
+    def get_orgs(self) -> SqliteCollection:
+        """ Returns the searchable cached organizations """
+        return self.orgs
+
+    def get_org_repos(self, org=None) -> SqliteCollection:
+        """
+        Returns the searchable cached organization repos,
+        or only the repos of the given organization.
+        """
+        if org is None:
+            return self.org_repos
+        return self.org_repos.scoped('org', org)
+
+    def get_issues(self, filter) -> SqliteCollection:
+        """ Returns the searchable cached issues of a filter """
+        return self.issues.scoped('filter', filter)
+
+    def stream(self, name, replace=False):
+        """
+        Returns a stream upserting the pages of a sync into a collection.
+        Args:
+          name (str): The collection, e.g. `repos` or `starred_repos`
+          replace (bool): Delete the items that weren't streamed once it is closed
+        """
+        return getattr(self, name).stream(replace)
+
+    def get_sync_state(self):
+        """ Returns the ETags and watermarks of the last sync """
+        row = self.connection().execute(
+            "SELECT data FROM sync_state").fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def store_sync_state(self, state):
+        """ Save the ETags and watermarks of the last sync """
+        with self.transaction() as db:
+            db.execute("DELETE FROM sync_state")
+            db.execute("INSERT INTO sync_state VALUES (?)",
+                       (json.dumps(state), ))
@@ -0,0 +1,316 @@
+"""
+Runs the background syncs, each collection at its own interval.
+"""
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from gh.api import RateLimitError
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two syncs of each job. Incremental syncs of unchanged
+# collections only cost a few 304 responses.
+SYNC_INTERVALS = {
+    'repos': 3600,
+    'gists': 3600,
+    'starred': 86400,
+    'orgs': 86400,
+    'issues': 300,
+    'docs': 86400
+}
+
+# Fraction of a delay added or removed at random, so the jobs drift apart
+# instead of hitting the API together.
+JITTER = 0.1
+
+# Delay before retrying a failed job, doubled on every consecutive failure
+BACKOFF_BASE = 30
+BACKOFF_MAX = 3600
+
+
+class SyncStoppedError(Exception):
+    """ Reported for the jobs that were still awaited when the scheduler stopped """
+
+    def __init__(self):
+        super(SyncStoppedError, self).__init__("The sync was stopped")
+
+
+def jittered(delay):
+    return delay * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+def request_all(schedulers, on_done, **kwargs):
+    """
+    Requests the jobs of several schedulers at once.
+
+    Args:
+      schedulers (list): (name, scheduler) pairs. Names are only used in the
+        errors, so two schedulers may share one
+      on_done (callable): Receives the errors of the jobs, by `<scheduler>/<job>`
+        name, and the elapsed time, once the jobs of every scheduler ran
+      kwargs: The arguments of `SyncScheduler.request`
+    """
+    schedulers = list(schedulers)
+    if not schedulers:
+        on_done({}, 0)
+        return
+
+    pending = set(range(len(schedulers)))
+    errors = {}
+    started_at = time.time()
+    lock = threading.Lock()
+
+    def scheduler_done(i, scheduler_errors, elapsed):
+        with lock:
+            for job, error in scheduler_errors.items():
+                errors["{}/{}".format(schedulers[i][0], job)] = error
+            pending.discard(i)
+            if pending:
+                return
+        on_done(errors, time.time() - started_at)
+
+    for i, (name, scheduler) in enumerate(schedulers):
+        scheduler.request(
+            on_done=lambda errors, elapsed, i=i: scheduler_done(
+                i, errors, elapsed),
+            **kwargs)
+
+
+class SyncJob(object):
+    """ The schedule and the status of a job """
+
+    def __init__(self, name, run, interval):
+        """
+        Args:
+          name (str): The name of the job
+          run (callable): Runs the job, receives the `full` flag
+          interval (int): Seconds between two runs
+        """
+        self.name = name
+        self.run = run
+        self.interval = interval
+        self.next_run = time.time()
+        self.full = False  # The next run is a full sync
+        self.running = False
+        self.running_full = False
+        self.pending = False  # Requested again while running
+        self.generation = 0  # Number of runs started
+        self.started_at = None
+        self.last_success_at = None
+        self.last_duration = None
+        self.failures = 0
+        self.last_error = None
+
+    def status(self):
+        return {
+            'name': self.name,
+            'running': self.running,
+            'started_at': self.started_at,
+            'next_run': None if self.running else self.next_run,
+            'last_success_at': self.last_success_at,
+            'last_duration': self.last_duration,
+            'failures': self.failures,
+            'last_error': self.last_error
+        }
+
+
+class SyncScheduler(object):
+    """
+    Runs every job when it is due, from a single thread.
+
+    A job never runs twice at the same time: refreshes requested while it
+    runs are coalesced into a single run after the current one. Failed jobs
+    are retried with an exponential backoff, and not before the rate limit
+    resets when GitHub rejected them.
+    """
+
+    def __init__(self, jobs, intervals=SYNC_INTERVALS):
+        """
+        Args:
+          jobs (dict): The callable of each job, which receives the `full` flag
+          intervals (dict): The seconds between two runs of each job
+        """
+        self.jobs = {
+            name: SyncJob(name, run, intervals[name])
+            for name, run in jobs.items()
+        }
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=len(self.jobs))
+        self._waiters = []
+        self._thread = None
+        self._stopped = False
+
+    def start(self):
+        """ Starts the scheduler thread, unless it is running """
+        with self._condition:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=len(self.jobs))
+            self._stopped = False
+            # A thread stopped meanwhile goes on once it wakes up
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stops scheduling jobs. Running jobs are left to finish, but the
+        requests still waiting for jobs are resolved right away, with a
+        SyncStoppedError for every job they waited for.
+        """
+        with self._condition:
+            self._stopped = True
+            executor, self._executor = self._executor, None
+            waiters, self._waiters = self._waiters, []
+            self._condition.notify_all()
+
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+        now = time.time()
+        for expected, errors, started_at, on_done in waiters:
+            for name in expected:
+                errors[name] = SyncStoppedError()
+            self._notify(on_done, errors, now - started_at)
+
+    def request(self, names=None, full=False, max_age=0, on_done=None):
+        """
+        Runs jobs as soon as possible. Failing jobs still wait for their
+        backoff, so repeated requests don't hammer GitHub.
+
+        Args:
+          names (list): The jobs to run, all of them by default
+          full (bool): Refetch everything instead of only the changes
+          max_age (int): Skips the jobs that succeeded less than this many seconds ago
+          on_done (callable): Receives the errors of the jobs by name and the
+            elapsed time, once all of them ran
+        """
+        now = time.time()
+        expected = {}
+        with self._condition:
+            for name in names or list(self.jobs):
+                job = self.jobs[name]
+                if max_age and job.last_success_at and not job.failures \
+                        and now - job.last_success_at < max_age:
+                    continue
+
+                if job.running and (job.running_full or not full):
+                    # The current run is as good as a new one
+                    expected[name] = job.generation
+                    continue
+
+                if job.running:
+                    job.pending = True
+                elif not job.failures:
+                    job.next_run = now
+                # A failing job keeps its backoff, or the rate limit reset it
+                # waits for, and runs then
+                job.full = job.full or full
+                expected[name] = job.generation + 1
+
+            if expected and on_done is not None:
+                self._waiters.append((expected, {}, now, on_done))
+            self._condition.notify_all()
+
+        if not expected and on_done is not None:
+            on_done({}, 0)
+
+    def status(self):
+        """ Returns the status of every job, and how many are running """
+        with self._condition:
+            jobs = [job.status() for job in self.jobs.values()]
+        return {
+            'jobs': jobs,
+            'running': sum(1 for job in jobs if job['running']),
+            'total': len(jobs)
+        }
+
+    def _loop(self):
+        with self._condition:
+            while not self._stopped:
+                now = time.time()
+                for job in self.jobs.values():
+                    if not job.running and job.next_run <= now:
+                        self._start(job)
+
+                waiting = [
+                    job.next_run for job in self.jobs.values()
+                    if not job.running
+                ]
+                timeout = max(min(waiting) - now, 0) if waiting else None
+                self._condition.wait(timeout)
+
+    def _start(self, job):
+        """ Submits a run of a job. Called with the lock held. """
+        full, job.full = job.full, False
+        job.running = True
+        job.running_full = full
+        job.generation += 1
+        job.started_at = time.time()
+        self._executor.submit(self._run, job, job.generation, full)
+
+    def _run(self, job, generation, full):
+        error = None
+        try:
+            job.run(full)
+        except Exception as e:
+            logger.error("Sync of %s failed: %s", job.name, e)
+            error = e
+
+        now = time.time()
+        with self._condition:
+            job.running = False
+            job.last_duration = now - job.started_at
+            if error is None:
+                job.failures = 0
+                job.last_error = None
+                job.last_success_at = now
+                delay = job.interval
+            else:
+                job.failures += 1
+                job.last_error = str(error)
+                delay = min(BACKOFF_MAX,
+                            BACKOFF_BASE * 2**(job.failures - 1))
+                if isinstance(error, RateLimitError):
+                    delay = max(delay, error.reset_at - now)
+
+            if job.pending and error is None:
+                job.next_run = now
+            else:
+                job.next_run = now + jittered(delay)
+            job.pending = False
+
+            done = self._resolve_waiters(job.name, generation, error)
+            self._condition.notify_all()
+
+        for errors, started_at, on_done in done:
+            self._notify(on_done, errors, now - started_at)
+
+    def _notify(self, on_done, errors, elapsed):
+        try:
+            on_done(errors, elapsed)
+        except Exception as e:
+            logger.error("Sync callback failed: %s", e)
+
+    def _resolve_waiters(self, name, generation, error):
+        """
+        Records a finished run in the waiting requests, and returns the
+        ones that are complete. Called with the lock held.
+        """
+        done = []
+        for waiter in list(self._waiters):
+            expected, errors, started_at, on_done = waiter
+            if expected.get(name, generation + 1) > generation:
+                continue
+
+            del expected[name]
+            if error is not None:
+                errors[name] = error
+            if not expected:
+                self._waiters.remove(waiter)
+                done.append((errors, started_at, on_done))
+        return done
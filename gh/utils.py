@@ -1,7 +1,71 @@
+import json
+import os
 import re
+import tempfile
 
 
 def remove_html(text):
     """ Helper function to remove HTML tags from a string"""
     regex = re.compile(r'<[^>]+>')
     return regex.sub('', text)
+
+
+def format_date(value):
+    """ Formats an ISO 8601 date from the GitHub API for display """
+    return (value or "").replace('T', ' ').rstrip('Z')
+
+
+def format_duration(seconds):
+    """ Formats a number of seconds as a short human readable duration """
+    seconds = int(max(seconds, 0))
+    if seconds < 60:
+        return "{} s".format(seconds)
+    if seconds < 3600:
+        return "{} min".format(seconds // 60)
+    if seconds < 86400:
+        return "{} h {} min".format(seconds // 3600, seconds % 3600 // 60)
+    return "{} d {} h".format(seconds // 86400, seconds % 86400 // 3600)
+
+
+def format_progress(pages, items, total_pages=None):
+    """ Formats the progress of a sync, e.g. "4200 items (42/500 pages)" """
+    if total_pages:
+        return "{} items ({}/{} pages)".format(items, pages, total_pages)
+    return "{} items ({} pages)".format(items, pages)
+
+
+def repository_full_name(repository_url):
+    """ Extracts the owner/name of a repository from its API URL """
+    return "/".join(repository_url.rstrip('/').split('/')[-2:])
+
+
+def _write_atomic(path, write):
+    """
+    Writes a file without ever exposing a partially written one.
+    `write` receives a temporary file in the same directory, which is flushed
+    to disk, and then renamed over the target.
+    """
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory,
+                                    prefix='.' + os.path.basename(path),
+                                    suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def write_json_atomic(path, data):
+    """ Writes data as JSON without ever exposing a partially written file """
+    _write_atomic(path, lambda f: json.dump(data, f))
+
+
+def write_json_lines_atomic(path, rows):
+    """ Writes rows as JSON lines without ever exposing a partially written file """
+    _write_atomic(path,
+                  lambda f: f.writelines(json.dumps(row) + "\n" for row in rows))
@@ -0,0 +1,71 @@
+"""
+Fake HTTP session for the API client, so the tests run without network
+access nor Ulauncher. Requests are recorded and answered by a handler.
+"""
+import json
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+BASE_URL = "https://api.example.com"
+
+
+def make_response(url, status=200, body=None, headers=None):
+    """ Builds a response as the requests library returns it """
+    response = requests.Response()
+    response.url = url
+    response.status_code = status
+    response.reason = HTTPStatus(status).phrase
+    response.headers = CaseInsensitiveDict(headers or {})
+    response._content = json.dumps(body).encode() if body is not None else b''
+    return response
+
+
+def paginated(path, params, items, per_page, headers=None, last_link=True):
+    """
+    Answers a page of a collection, with the Link header GitHub sends.
+    Some endpoints only link the next page, without `last_link`.
+
+    Returns:
+      tuple: The status, the body and the headers of the response
+    """
+    page = int(params.get('page', 1))
+    last_page = max((len(items) + per_page - 1) // per_page, 1)
+    links = []
+    for rel, number in (('next', page + 1), ('last', last_page)):
+        if page < last_page and (rel == 'next' or last_link):
+            url = "{}{}?{}".format(BASE_URL, path,
+                                   urlencode(dict(params, page=number)))
+            links.append('<{}>; rel="{}"'.format(url, rel))
+
+    headers = dict(headers or {})
+    if links:
+        headers['Link'] = ", ".join(links)
+    return 200, items[(page - 1) * per_page:page * per_page], headers
+
+
+class FakeSession(object):
+    """ Records the requests and answers them with a handler """
+
+    def __init__(self, handler):
+        """
+        Args:
+          handler (callable): Receives the method, the path, the query
+            parameters and the headers of a request, and returns its status,
+            body and headers
+        """
+        self.handler = handler
+        self.requests = []
+
+    def request(self, method, url, params=None, headers=None, json=None):
+        parsed = urlparse(url)
+        query = dict(parse_qsl(parsed.query))
+        query.update((name, str(value)) for name, value in (params or {}).items())
+        headers = dict(headers or {})
+        self.requests.append((method, parsed.path, query, headers))
+
+        status, body, response_headers = self.handler(method, parsed.path,
+                                                      query, headers)
+        return make_response(url, status, body, response_headers)
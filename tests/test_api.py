@@ -0,0 +1,154 @@
+import threading
+import time
+import unittest
+
+from gh.api import (GitHubApiClient, RateLimitBudget, RateLimiter,
+                    RateLimitError)
+from tests.fake_session import BASE_URL, FakeSession, paginated
+
+
+def rate_limit_headers(remaining, resource='core', reset_in=3600):
+    return {
+        'X-RateLimit-Remaining': str(remaining),
+        'X-RateLimit-Reset': str(int(time.time() + reset_in)),
+        'X-RateLimit-Resource': resource
+    }
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_unknown_budget_does_not_block(self):
+        limiter = RateLimiter({'core': 10})
+        limiter.acquire('core')
+        self.assertEqual(limiter.budgets, {})
+
+    def test_acquire_spends_the_budget(self):
+        limiter = RateLimiter({'core': 10})
+        limiter.update(rate_limit_headers(100))
+        limiter.acquire('core')
+        self.assertEqual(limiter.budgets['core'].remaining, 99)
+
+    def test_update_uses_the_resource_header(self):
+        limiter = RateLimiter({})
+        limiter.update(rate_limit_headers(5, 'search'), 'core')
+        self.assertEqual(list(limiter.budgets), ['search'])
+
+    def test_background_requests_wait_at_the_reserve(self):
+        limiter = RateLimiter({'core': 10})
+        limiter.budgets['core'] = RateLimitBudget(10, time.time() + 0.3)
+
+        started_at = time.time()
+        limiter.acquire('core')
+        self.assertGreaterEqual(time.time() - started_at, 0.25)
+
+    def test_interactive_requests_use_the_reserve(self):
+        limiter = RateLimiter({'core': 10})
+        limiter.budgets['core'] = RateLimitBudget(10, time.time() + 3600)
+
+        for _ in range(10):
+            limiter.acquire('core', interactive=True)
+        self.assertEqual(limiter.budgets['core'].remaining, 0)
+
+        with self.assertRaises(RateLimitError):
+            limiter.acquire('core', interactive=True)
+
+    def test_budgets_are_per_resource(self):
+        limiter = RateLimiter({'core': 10, 'search': 10})
+        limiter.budgets['search'] = RateLimitBudget(0, time.time() + 3600)
+        limiter.budgets['core'] = RateLimitBudget(100, time.time() + 3600)
+
+        waiter = threading.Thread(target=limiter.acquire, args=('search',))
+        waiter.daemon = True
+        waiter.start()
+        waiter.join(0.2)
+        self.assertTrue(waiter.is_alive())
+
+        limiter.acquire('core')
+        self.assertEqual(limiter.budgets['core'].remaining, 99)
+
+
+class GitHubApiClientTest(unittest.TestCase):
+
+    def client(self, handler, max_workers=4):
+        api = GitHubApiClient('token', BASE_URL, max_workers=max_workers)
+        api._session = FakeSession(handler)
+        return api
+
+    def test_iter_pages_yields_every_page_in_order(self):
+        items = list(range(250))
+
+        def handler(method, path, params, headers):
+            return paginated(path, params, items, int(params['per_page']))
+
+        api = self.client(handler, max_workers=2)
+        pages = [response.json() for response in api.iter_pages('/user/repos')]
+
+        self.assertEqual([len(page) for page in pages], [100, 100, 50])
+        self.assertEqual(sum(pages, []), items)
+        self.assertEqual(api.request_count, 3)
+        self.assertEqual(
+            sorted(params.get('page', '1')
+                   for _, _, params, _ in api.session.requests),
+            ['1', '2', '3'])
+
+    def test_iter_pages_follows_next_links_without_last_page(self):
+        items = list(range(25))
+
+        def handler(method, path, params, headers):
+            return paginated(path, params, items, 10, last_link=False)
+
+        api = self.client(handler)
+        pages = [response.json() for response in api.iter_pages('/gists')]
+
+        self.assertEqual(sum(pages, []), items)
+        self.assertEqual(api.request_count, 3)
+
+    def test_not_modified_responses_are_returned(self):
+        def handler(method, path, params, headers):
+            if headers.get('If-None-Match') == '"abc"':
+                return 304, None, {}
+            return 200, [], {'ETag': '"abc"'}
+
+        api = self.client(handler)
+        response = api.request('GET', '/user/repos')
+        self.assertEqual(response.headers['ETag'], '"abc"')
+
+        response = api.request('GET', '/user/repos',
+                               headers={'If-None-Match': '"abc"'})
+        self.assertEqual(response.status_code, 304)
+
+    def test_requests_are_counted_per_block(self):
+        api = self.client(lambda *args: (200, {}, {}))
+        with api.count_requests() as outer:
+            api.get('/user')
+            with api.count_requests() as inner:
+                api.get('/user')
+        self.assertEqual((outer.count, inner.count), (2, 1))
+
+    def test_page_workers_are_counted_for_the_caller(self):
+        items = list(range(300))
+
+        def handler(method, path, params, headers):
+            return paginated(path, params, items, int(params['per_page']))
+
+        api = self.client(handler)
+        with api.count_requests() as counter:
+            list(api.iter_pages('/user/starred'))
+        self.assertEqual(counter.count, 3)
+
+    def test_interactive_requests_are_not_retried_when_rate_limited(self):
+        def handler(method, path, params, headers):
+            return 403, None, rate_limit_headers(0, 'search')
+
+        api = self.client(handler)
+        with api.interactive():
+            with self.assertRaises(RateLimitError):
+                api.get('/search/issues', {'q': 'bug'})
+        self.assertEqual(api.request_count, 1)
+
+    def test_search_requests_use_the_search_budget(self):
+        api = self.client(
+            lambda *args: (200, {'items': []}, rate_limit_headers(29, 'search')))
+        api.get('/search/issues', {'q': 'bug'})
+        self.assertEqual(api.rate_limiter.budgets['search'].remaining, 29)
+        self.assertNotIn('core', api.rate_limiter.budgets)
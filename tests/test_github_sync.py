@@ -0,0 +1,92 @@
+import shutil
+import tempfile
+import unittest
+
+from gh.api import GitHubApiClient
+from gh.cache import Cache
+from gh.github_sync import GitHubDataSync
+from tests.fake_session import BASE_URL, FakeSession, paginated
+
+
+def repo(number, updated_at):
+    return {
+        'name': 'repo-{}'.format(number),
+        'full_name': 'octocat/repo-{}'.format(number),
+        'description': None,
+        'html_url': 'https://github.com/octocat/repo-{}'.format(number),
+        'stargazers_count': number,
+        'updated_at': updated_at
+    }
+
+
+class FakeRepos(object):
+    """ Serves /user/repos, most recently updated first, with an ETag """
+
+    def __init__(self, repos):
+        self.repos = repos
+        self.version = 1
+
+    @property
+    def etag(self):
+        return '"v{}"'.format(self.version)
+
+    def add(self, repo):
+        self.repos = [repo] + self.repos
+        self.version += 1
+
+    def __call__(self, method, path, params, headers):
+        if headers.get('If-None-Match') == self.etag:
+            return 304, None, {'ETag': self.etag}
+        return paginated(path, params, self.repos, int(params['per_page']),
+                         {'ETag': self.etag})
+
+
+class GitHubDataSyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+        self.github = FakeRepos([
+            repo(number, '2020-01-01T00:00:{:02d}Z'.format(59 - number))
+            for number in range(250)
+        ])
+        self.session = FakeSession(self.github)
+        api = GitHubApiClient('token', BASE_URL)
+        api._session = self.session
+        self.cache = Cache(self.cache_dir)
+        self.sync = GitHubDataSync(api, self.cache)
+
+    def repo_names(self):
+        index = self.cache.get_repos()
+        return {item['name'] for item in index.search("", len(index))}
+
+    def test_full_sync_fetches_every_page(self):
+        self.sync.execute(collections=['repos'])
+
+        self.assertEqual(len(self.session.requests), 3)
+        self.assertEqual(len(self.repo_names()), 250)
+        self.assertEqual(self.cache.get_sync_state()['repos']['etag'], '"v1"')
+
+    def test_unchanged_collection_costs_one_not_modified_response(self):
+        self.sync.execute(collections=['repos'])
+        del self.session.requests[:]
+
+        self.sync.execute(collections=['repos'])
+
+        self.assertEqual(len(self.session.requests), 1)
+        _, _, _, headers = self.session.requests[0]
+        self.assertEqual(headers['If-None-Match'], '"v1"')
+        self.assertEqual(len(self.repo_names()), 250)
+
+    def test_incremental_sync_stops_at_the_watermark(self):
+        self.sync.execute(collections=['repos'])
+        del self.session.requests[:]
+
+        self.github.add(repo(250, '2021-01-01T00:00:00Z'))
+        self.sync.execute(collections=['repos'])
+
+        self.assertEqual(len(self.session.requests), 1)
+        self.assertEqual(len(self.repo_names()), 251)
+        self.assertIn('repo-250', self.repo_names())
+        self.assertEqual(self.cache.get_sync_state()['repos']['etag'], '"v2"')
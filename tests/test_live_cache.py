@@ -0,0 +1,77 @@
+import threading
+import unittest
+
+from gh.api import GitHubApiClient
+from gh.live_cache import LiveCache
+from gh.query_scheduler import QueryScheduler
+from tests.fake_session import BASE_URL, FakeSession
+
+
+class LiveSearchTest(unittest.TestCase):
+    """ Every live search costs a single request, and cached ones none """
+
+    def setUp(self):
+        self.session = FakeSession(self.search)
+        self.api = GitHubApiClient('token', BASE_URL)
+        self.api._session = self.session
+        self.cache = LiveCache(scheduler=QueryScheduler(delay=0.05))
+        self.fetch_requests = []
+        self.updates = []
+        self.updated = threading.Event()
+
+    def search(self, method, path, params, headers):
+        words = ['bug', 'bugfix', 'build', 'docs']
+        return 200, {
+            'items': [{'title': word} for word in words
+                      if word.startswith(params['q'])]
+        }, {}
+
+    def type(self, query):
+        """ Looks up a query the way the extension's live keywords do """
+
+        def fetch():
+            with self.api.count_requests() as counter, self.api.interactive():
+                try:
+                    items = self.api.get('/search/issues', {'q': query})['items']
+                    return [{'key': item['title']} for item in items]
+                finally:
+                    self.fetch_requests.append(counter.count)
+
+        def on_update(rows):
+            self.updates.append(rows)
+            self.updated.set()
+
+        return self.cache.get('issues', query, fetch, on_update)
+
+    def wait_for_update(self):
+        self.assertTrue(self.updated.wait(2))
+        self.updated.clear()
+
+    def test_debounced_keystrokes_make_one_request(self):
+        for query in ('b', 'bu', 'bug'):
+            self.assertIsNone(self.type(query))
+        self.wait_for_update()
+
+        self.assertEqual(self.fetch_requests, [1])
+        self.assertEqual(len(self.session.requests), 1)
+        self.assertEqual(self.session.requests[0][2]['q'], 'bug')
+        self.assertEqual(self.updates, [[{'key': 'bug'}, {'key': 'bugfix'}]])
+
+    def test_cached_queries_make_no_request(self):
+        self.type('bu')
+        self.wait_for_update()
+
+        self.assertEqual(self.type('bu'), self.updates[0])
+        self.assertFalse(self.updated.wait(0.2))
+        self.assertEqual(len(self.session.requests), 1)
+
+    def test_refined_queries_make_one_request_each(self):
+        self.type('bu')
+        self.wait_for_update()
+
+        # The prefix results are filtered while the query is fetched
+        self.assertEqual(self.type('bugf'), [{'key': 'bugfix'}])
+        self.wait_for_update()
+
+        self.assertEqual(self.fetch_requests, [1, 1])
+        self.assertEqual(len(self.session.requests), 2)
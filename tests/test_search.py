@@ -0,0 +1,42 @@
+import itertools
+import unittest
+
+from gh.search import TIER_FUZZY, SearchIndex
+
+
+def index_of(names):
+    """ Indexes the names, the last ones with the most stars """
+    return SearchIndex([(name, {'name': name, 'stars': stars})
+                        for stars, name in enumerate(names)])
+
+
+def names_of(items):
+    return [item['name'] for item in items]
+
+
+class SearchIndexTest(unittest.TestCase):
+
+    def test_word_prefixes_rank_first(self):
+        index = index_of(['github-ulauncher', 'ulauncher-github', 'gists'])
+        self.assertEqual(names_of(index.search('gith', 3)),
+                         ['ulauncher-github', 'github-ulauncher'])
+
+    def test_terms_found_as_substrings_rank_above_fuzzy_matches(self):
+        index = index_of(['ui-deploy-4', 'u-yaml-4', 'ui-yarn-42'])
+        self.assertEqual(names_of(index.search('u y-4', 3)),
+                         ['ui-deploy-4', 'ui-yarn-42', 'u-yaml-4'])
+
+    def test_ranking_matches_scoring_every_item(self):
+        names = [
+            '{}-{}-{}'.format(word, other, number)
+            for number, (word, other) in enumerate(itertools.product(
+                ('ui', 'data', 'python', 'docs'),
+                ('deploy', 'server', 'plugin', 'yaml')))
+        ]
+        index = index_of(names)
+        for query in ('u y', 'd p', 'p 1', 'y-1 ui', 'a e', 'ta er 1'):
+            scored = sorted(index._score_terms(query.split(), range(len(names))),
+                            reverse=True)
+            expected = [names[-i] for key, i in scored if key[0] > TIER_FUZZY]
+            found = names_of(index.search(query, len(names)))
+            self.assertEqual(found[:len(expected)], expected, query)
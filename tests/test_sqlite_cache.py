@@ -0,0 +1,43 @@
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from gh.sqlite_cache import SqliteCache
+
+
+def repo(name, description):
+    return {
+        'fullname': 'octocat/{}'.format(name),
+        'name': name,
+        'description': description,
+        'url': 'https://github.com/octocat/{}'.format(name),
+        'stars': 1,
+        'updated_at': '2020-01-01T00:00:00Z'
+    }
+
+
+class SqliteCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+    def check_upserts(self):
+        cache = SqliteCache(self.cache_dir)
+        cache.store_repos_cache([repo('hello', 'first'), repo('world', 'second')])
+        cache.merge_repos_cache([repo('world', 'renamed'), repo('new', 'third')])
+
+        repos = cache.get_repos()
+        self.assertEqual([item['name'] for item in repos.search("", 10)],
+                         ['world', 'new', 'hello'])
+        self.assertEqual([item['name'] for item in repos.search("renamed", 10)],
+                         ['world'])
+        self.assertEqual(repos.search("second", 10), [])
+
+    def test_upsert(self):
+        self.check_upserts()
+
+    def test_upsert_without_the_upsert_clause(self):
+        with mock.patch('gh.sqlite_cache.UPSERT', False):
+            self.check_upserts()